@@ -4,52 +4,169 @@
 
 import json
 import asyncio
-from typing import Dict, Any, List
-from fastapi import APIRouter, HTTPException, Request
+import time
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
+from uuid import uuid4
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse, Response
+from starlette.background import BackgroundTask
 
-from ..models.chat import ChatRequest, ChatResponse, ErrorResponse
+from ..models.chat import BatchChatRequest, ChatRequest, ChatResponse, ErrorResponse
+from ..services.admission_service import admission_service, AdmissionRejectedError, AdmissionTicket
+from ..services.batch_service import batch_service
 from ..services.coze_service import coze_service
 from ..services.config_service import config_service
+from ..services.http_pool_service import http_pool_service
+from ..services.metrics import endpoint_var
+from ..services.stream_pipeline import (
+    CoalesceStage, FormDataStage, LoggingStage, MetricsStage, ReferencesStage, SSESink, Stage, StreamPipeline,
+    pipeline_stats,
+)
+from ..services.stream_resume import resumable_streams
+from ..services.stream_stats import stream_stats
 from ..utils.logger import get_logger, set_request_id, StreamLogger
+from ..utils.sse_encoder import SSEEncoder
+from ..utils.tracing import add_span, current_trace, span, tracer
 
 logger = get_logger("chat_api")
 
-router = APIRouter(prefix="/api/chat", tags=["聊天"])
+async def label_endpoint(request: Request) -> None:
+    """记录当前接口路径，服务层的上游指标按接口打标签"""
+    route = request.scope.get("route")
+    endpoint_var.set(getattr(route, "path", request.url.path))
 
 
-@router.options("/stream")
-async def options_stream():
-    """处理流式聊天的OPTIONS预检请求"""
-    return Response(
-        status_code=200,
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "POST, OPTIONS",
-            "Access-Control-Allow-Headers": "*",
-        }
-    )
+router = APIRouter(prefix="/api/chat", tags=["聊天"], dependencies=[Depends(label_endpoint)])
 
 
-@router.post("/stream")
-async def stream_chat(request: ChatRequest, req: Request = None):
+async def acquire_admission(doctor_type: str = None) -> AdmissionTicket:
     """
-    流式聊天接口
+    获取医生类型的并发名额，被拒绝时转换为带Retry-After的HTTP错误
+    
+    Args:
+        doctor_type: 医生类型
+        
+    Returns:
+        AdmissionTicket: 并发名额
+    """
+    try:
+        with span("chat.admission", doctor_type=doctor_type or "default"):
+            return await admission_service.acquire(doctor_type)
+    except AdmissionRejectedError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+def get_coalesce_settings(request: ChatRequest, endpoint: str) -> Tuple[int, int]:
+    """
+    确定本次请求的增量合并参数，请求中的设置优先于接口配置
     
     Args:
         request: 聊天请求
-        req: FastAPI请求对象
+        endpoint: 接口路径
+        
+    Returns:
+        (合并时间窗口毫秒数, 字节数上限)
+    """
+    endpoint_config = config_service.get_config().stream.get_coalesce(endpoint)
+    window_ms = request.coalesce_ms if request.coalesce_ms is not None else endpoint_config.window_ms
+    max_bytes = request.coalesce_bytes if request.coalesce_bytes is not None else endpoint_config.max_bytes
+    return window_ms, max_bytes
+
+
+def sse_headers(request_id: str) -> Dict[str, str]:
+    """SSE响应头"""
+    return {
+        "Cache-Control": "no-cache, no-transform",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",  # 禁用Nginx缓冲
+        "Transfer-Encoding": "chunked",  # 使用分块编码
+        "Content-Type": "text/event-stream; charset=utf-8",
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Headers": "*",
+        "X-Request-ID": request_id  # 添加请求ID用于追踪
+    }
+
+
+def open_event_stream(request_id: str, frames: AsyncIterator[bytes], ticket: AdmissionTicket,
+                      resume_token: Optional[str] = None) -> StreamingResponse:
+    """
+    返回流式响应，启用续传时在后台读取帧并保存最近的帧
+    
+    Args:
+        request_id: 请求ID，同时作为续传的流ID
+        frames: SSE帧
+        ticket: 准入名额，流结束后归还
+        resume_token: 续传令牌，None表示不可续传
         
     Returns:
         StreamingResponse: 流式响应
     """
-    # 生成并设置请求ID
-    request_id = set_request_id(f"stream_{request.user_id}_{int(asyncio.get_event_loop().time())}")
+    if resume_token is not None:
+        # 客户端断开后上游在宽限期内继续生成，名额在流真正结束时归还
+        body = resumable_streams.open(request_id, resume_token, frames, on_finish=ticket.release)
+        background = None
+    else:
+        body = frames
+        background = BackgroundTask(ticket.release)  # 响应未能开始迭代时也归还名额
+    return StreamingResponse(body, media_type="text/event-stream", background=background,
+                             headers=sse_headers(request_id))
+
+
+def build_stream_pipeline(request: ChatRequest, request_id: str, endpoint: str, encoder: SSEEncoder,
+                          stream_logger: StreamLogger, label: str) -> StreamPipeline:
+    """
+    按接口组装流式处理管道
+    
+    Args:
+        request: 已绑定对话ID的聊天请求，见coze_service.bind_conversation
+        request_id: 请求ID
+        endpoint: 接口路径
+        encoder: SSE编码器
+        stream_logger: 流日志记录器
+        label: 日志中的接口名称
+        
+    Returns:
+        StreamPipeline: 处理管道，末端编码为SSE字节帧
+    """
+    stream_config = config_service.get_config().stream
+    stages: List[Stage] = []
+    if endpoint == "/api/chat/stream-without-references":
+        stages.append(FormDataStage(request_id))
+        stages.append(ReferencesStage(request.conversation_id, coze_service._save_references, request_id))
     
+    # 增量合并参数
+    coalesce_ms, coalesce_bytes = get_coalesce_settings(request, endpoint)
+    if coalesce_ms > 0:
+        stages.append(CoalesceStage(coalesce_ms, coalesce_bytes))
+    stages.append(MetricsStage(request.doctor_type, endpoint))
+    stages.append(LoggingStage(request_id, stream_logger, label))
+    return StreamPipeline(stages, SSESink(encoder), timing=stream_config.stage_timing)
+
+
+async def start_event_stream(request: ChatRequest, req: Optional[Request], request_id: str,
+                             endpoint: str, logger_name: str, label: str) -> StreamingResponse:
+    """
+    两个流式接口共用的处理流程：组装管道、准入控制并返回流式响应
+    
+    Args:
+        request: 聊天请求
+        req: FastAPI请求对象
+        request_id: 请求ID
+        endpoint: 接口路径
+        logger_name: 流日志记录器名称
+        label: 日志中的接口名称
+        
+    Returns:
+        StreamingResponse: 流式响应
+    """
     # 创建流日志记录器
-    stream_logger = StreamLogger("chat_stream")
+    stream_logger = StreamLogger(logger_name)
     
-    logger.info(f"[{request_id}] 收到流式聊天请求 - 用户: {request.user_id}, 医生类型: {request.doctor_type}, 消息长度: {len(request.message)}")
+    logger.info(f"[{request_id}] 收到{label}请求 - 用户: {request.user_id}, 医生类型: {request.doctor_type}, 消息长度: {len(request.message)}")
     
     # 记录请求来源信息
     if req:
@@ -57,15 +174,40 @@ async def stream_chat(request: ChatRequest, req: Request = None):
         user_agent = req.headers.get("user-agent", "unknown")
         logger.debug(f"[{request_id}] 客户端信息 - IP: {client_host}, UA: {user_agent}")
     
+    # 在请求任务中确定对话ID，管道保存引用、日志和上游对话使用同一个ID
+    request = coze_service.bind_conversation(request)
     # 确保请求设为流式
     request.stream = True
     
+    # 组装管道，由各阶段在请求上游前调整请求(如拼接表单数据)
+    stream_config = config_service.get_config().stream
+    encoder = SSEEncoder(request_id, stream_config.json_backend)
+    pipeline = build_stream_pipeline(request, request_id, endpoint, encoder, stream_logger, label)
+    pipeline.prepare(request)
+    logging_stage = next(stage for stage in pipeline.stages if isinstance(stage, LoggingStage))
+    
+    # 准入控制：超出并发和队列上限时快速返回429/503
+    cached_answer = coze_service.get_cached_answer(request)
+    if cached_answer is not None:
+        # 已缓存的回答直接回放，不访问上游，无需占用并发名额
+        ticket = AdmissionTicket(None)
+        events = coze_service.replay_answer(request, cached_answer)
+    else:
+        ticket = await acquire_admission(request.doctor_type)
+        # 已查找过缓存，不再重复查找
+        events = coze_service.chat_stream(request, check_cache=False)
+    
+    frames = pipeline.run(events, stream_config.keepalive_interval)
+    # 续传令牌只在初始化事件中返回给发起请求的客户端
+    resume_token = resumable_streams.new_token() if stream_config.resume.enabled else None
+    # 响应头发出后的span(上游各阶段)在流末尾以timing事件返回
+    trace = current_trace.get() if tracer.server_timing else None
+    
     async def generate_stream():
         """生成流式响应"""
-        
-        # TODO: 发送建议问题到前端
+        stream_start = time.perf_counter()
         try:
-            logger.info(f"[{request_id}] 开始生成流式响应")
+            logger.info(f"[{request_id}] 开始生成{label}响应")
             
             # 发送初始化事件，确保连接立即建立
             init_event = {
@@ -75,60 +217,28 @@ async def stream_chat(request: ChatRequest, req: Request = None):
                 "request_id": request_id
             }
             stream_logger.log_event("init", metadata=init_event)
-            yield f"data: {json.dumps(init_event, ensure_ascii=False)}\n\n"
+            if resume_token is not None:
+                # 令牌不写入流日志
+                init_event["resume_token"] = resume_token
+            yield encoder.encode_data(init_event)
             
-            # 计数器和时间记录器
-            event_count = 0
-            start_time = asyncio.get_event_loop().time()
-            last_event_time = start_time
+            # 服务层事件逐个经过管道各阶段，直接得到SSE字节帧
+            async for frame in frames:
+                yield frame
             
-            # 通过异步迭代器获取服务层生成的流式事件
-            async for event in coze_service.chat_stream(request):
-                event_count += 1
-                current_time = asyncio.get_event_loop().time()
-                time_since_last = current_time - last_event_time
-                
-                # 转换为SSE格式
-                event_data = event.dict()
-                # 添加请求ID用于追踪
-                event_data["request_id"] = request_id
-                
-                # 记录事件信息，根据类型记录详细程度
-                if event.type == "message":
-                    stream_logger.log_event("message", content=event_data.get("content", ""))
-                    logger.debug(f"[{request_id}] 发送流式消息事件 #{event_count}, 间隔: {time_since_last:.3f}秒")
-                elif event.type == "follow_up":
-                    stream_logger.log_event("follow_up", metadata=event_data)
-                    logger.info(f"[{request_id}] 发送建议问题事件 #{event_count}, 问题数量: {len(event.follow_up_questions) if event.follow_up_questions else 0}")
-                else:
-                    stream_logger.log_event(event.type, metadata=event_data)
-                    logger.info(f"[{request_id}] 发送流式{event.type}事件 #{event_count}")
-                
-                # 确保每个事件都以正确的格式输出，包含双换行符作为分隔
-                sse_message = f"data: {json.dumps(event_data, ensure_ascii=False)}\n\n"
-                yield sse_message
-                
-                # 更新最后事件时间
-                last_event_time = current_time
-                
-                # 如果是完成或错误事件，结束流
-                if event.done:
-                    elapsed = current_time - start_time
-                    stream_logger.log_summary("完成")
-                    logger.info(f"[{request_id}] 流式聊天结束，共发送 {event_count} 个事件，总耗时: {elapsed:.2f}秒")
-                    break
-                
-                # 如果事件间隔过长，发送心跳保持连接
-                if time_since_last > 10:  # 10秒没有消息时发送心跳
-                    heartbeat = f": heartbeat {int(current_time)}\n\n"
-                    logger.debug(f"[{request_id}] 发送心跳，距上次事件: {time_since_last:.1f}秒")
-                    yield heartbeat
+            if trace is not None:
+                add_span("chat.stream", stream_start)
+                yield encoder.encode_data(trace.timing_event(request_id))
             
             # 确保总是发送一个最终心跳
-            yield f": end-of-stream {int(asyncio.get_event_loop().time())}\n\n"
+            yield encoder.comment(f"end-of-stream {int(asyncio.get_event_loop().time())}")
                     
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端断开：停止读取上游，finally中关闭上游迭代器以中止生成
+            logging_stage.abandon()
+            raise
         except Exception as e:
-            logger.error(f"[{request_id}] 流式聊天生成错误: {e}", exc_info=True)
+            logger.error(f"[{request_id}] {label}生成错误: {e}", exc_info=True)
             stream_logger.log_summary("失败", str(e))
             
             error_event = {
@@ -137,26 +247,45 @@ async def stream_chat(request: ChatRequest, req: Request = None):
                 "done": True,
                 "request_id": request_id
             }
-            yield f"data: {json.dumps(error_event, ensure_ascii=False)}\n\n"
+            yield encoder.encode_data(error_event)
+        finally:
+            await frames.aclose()
+            pipeline_stats.record(endpoint, pipeline)
+            ticket.release()
     
-    
-    # 返回流式响应，设置合适的响应头
-    return StreamingResponse(
-        generate_stream(),
-        media_type="text/event-stream",
+    return open_event_stream(request_id, generate_stream(), ticket, resume_token)
+
+
+@router.options("/stream")
+async def options_stream():
+    """处理流式聊天的OPTIONS预检请求"""
+    return Response(
+        status_code=200,
         headers={
-            "Cache-Control": "no-cache, no-transform",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",  # 禁用Nginx缓冲
-            "Transfer-Encoding": "chunked",  # 使用分块编码
-            "Content-Type": "text/event-stream; charset=utf-8",
             "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "POST, OPTIONS",
             "Access-Control-Allow-Headers": "*",
-            "X-Request-ID": request_id  # 添加请求ID用于追踪
         }
     )
 
 
+@router.post("/stream")
+async def stream_chat(request: ChatRequest, req: Request = None):
+    """
+    流式聊天接口
+    
+    Args:
+        request: 聊天请求
+        req: FastAPI请求对象
+        
+    Returns:
+        StreamingResponse: 流式响应
+    """
+    # 生成并设置请求ID
+    request_id = set_request_id(f"stream_{request.user_id}_{int(asyncio.get_event_loop().time())}_{uuid4().hex[:8]}")
+    return await start_event_stream(request, req, request_id, "/api/chat/stream", "chat_stream", "流式聊天")
+
+
 @router.options("/stream-without-references")
 async def options_stream_without_references():
     """处理无引用流式聊天的OPTIONS预检请求"""
@@ -183,130 +312,58 @@ async def stream_chat_without_references(request: ChatRequest, req: Request = No
         StreamingResponse: 流式响应，不包含引用文献部分
     """
     # 生成并设置请求ID
-    request_id = set_request_id(f"stream_noref_{request.user_id}_{int(asyncio.get_event_loop().time())}")
-    
-    # 创建流日志记录器
-    stream_logger = StreamLogger("chat_stream_noref")
-    
-    logger.info(f"[{request_id}] 收到无引用流式聊天请求 - 用户: {request.user_id}, 医生类型: {request.doctor_type}, 消息长度: {len(request.message)}")
-    
-    # 处理表单数据，如果存在则拼接到消息前面
-    original_message = request.message
-    if request.form_data:
-        try:
-            # 将表单数据转换为格式化的JSON字符串
-            form_str = json.dumps(request.form_data, ensure_ascii=False, indent=2)
-            # 拼接到消息前面
-            request.message = f"表单数据:\n{form_str}\n\n用户问题:\n{request.message}"
-            logger.info(f"[{request_id}] 拼接表单数据到消息，原始长度: {len(original_message)}，新长度: {len(request.message)}")
-        except Exception as e:
-            logger.error(f"[{request_id}] 处理表单数据失败: {e}", exc_info=True)
-            # 如果处理失败，恢复原始消息
-            request.message = original_message
-    
-    # 记录请求来源信息
-    if req:
-        client_host = req.client.host if req.client else "unknown"
-        user_agent = req.headers.get("user-agent", "unknown")
-        logger.debug(f"[{request_id}] 客户端信息 - IP: {client_host}, UA: {user_agent}")
+    request_id = set_request_id(f"stream_noref_{request.user_id}_{int(asyncio.get_event_loop().time())}_{uuid4().hex[:8]}")
+    return await start_event_stream(request, req, request_id, "/api/chat/stream-without-references",
+                                    "chat_stream_noref", "无引用流式聊天")
+
+
+@router.get("/stream/{request_id}/resume")
+async def resume_stream(request_id: str, req: Request, last_event_id: Optional[int] = None,
+                        token: Optional[str] = None):
+    """
+    断线续传
     
-    # 确保请求设为流式
-    request.stream = True
+    补发Last-Event-ID之后的帧，再继续接收进行中的流，不会重新请求上游。
+    两个流式接口的request_id均可续传，须带上初始化事件中的resume_token。
     
-    async def generate_stream():
-        """生成流式响应"""
+    Args:
+        request_id: 流式响应的request_id(见初始化事件)
+        req: FastAPI请求对象，从Last-Event-ID和X-Resume-Token请求头读取续传位置和令牌
+        last_event_id: 续传位置，未提供Last-Event-ID请求头时使用
+        token: 续传令牌，未提供X-Resume-Token请求头时使用
         
-        try:
-            logger.info(f"[{request_id}] 开始生成无引用流式响应")
-            
-            # 发送初始化事件，确保连接立即建立
-            init_event = {
-                "type": "init",
-                "message": "连接成功",
-                "done": False,
-                "request_id": request_id
-            }
-            stream_logger.log_event("init", metadata=init_event)
-            yield f"data: {json.dumps(init_event, ensure_ascii=False)}\n\n"
-            
-            # 计数器和时间记录器
-            event_count = 0
-            start_time = asyncio.get_event_loop().time()
-            last_event_time = start_time
-            
-            # 使用无引用的流式聊天服务
-            async for event in coze_service.chat_stream_without_references(request):
-                event_count += 1
-                current_time = asyncio.get_event_loop().time()
-                time_since_last = current_time - last_event_time
-                
-                # 转换为SSE格式
-                event_data = event.dict()
-                # 添加请求ID用于追踪
-                event_data["request_id"] = request_id
-                
-                # 记录事件信息，根据类型记录详细程度
-                if event.type == "message":
-                    stream_logger.log_event("message", content=event_data.get("content", ""))
-                    logger.debug(f"[{request_id}] 发送流式消息事件 #{event_count}, 间隔: {time_since_last:.3f}秒")
-                elif event.type == "follow_up":
-                    stream_logger.log_event("follow_up", metadata=event_data)
-                    logger.info(f"[{request_id}] 发送建议问题事件 #{event_count}, 问题数量: {len(event.follow_up_questions) if event.follow_up_questions else 0}")
-                else:
-                    stream_logger.log_event(event.type, metadata=event_data)
-                    logger.info(f"[{request_id}] 发送流式{event.type}事件 #{event_count}")
-                
-                # 确保每个事件都以正确的格式输出，包含双换行符作为分隔
-                sse_message = f"data: {json.dumps(event_data, ensure_ascii=False)}\n\n"
-                yield sse_message
-                
-                # 更新最后事件时间
-                last_event_time = current_time
-                
-                # 如果是完成或错误事件，结束流
-                if event.done:
-                    elapsed = current_time - start_time
-                    stream_logger.log_summary("完成")
-                    logger.info(f"[{request_id}] 无引用流式聊天结束，共发送 {event_count} 个事件，总耗时: {elapsed:.2f}秒")
-                    break
-                
-                # 如果事件间隔过长，发送心跳保持连接
-                if time_since_last > 10:  # 10秒没有消息时发送心跳
-                    heartbeat = f": heartbeat {int(current_time)}\n\n"
-                    logger.debug(f"[{request_id}] 发送心跳，距上次事件: {time_since_last:.1f}秒")
-                    yield heartbeat
-            
-            # 确保总是发送一个最终心跳
-            yield f": end-of-stream {int(asyncio.get_event_loop().time())}\n\n"
-                    
-        except Exception as e:
-            logger.error(f"[{request_id}] 无引用流式聊天生成错误: {e}", exc_info=True)
-            stream_logger.log_summary("失败", str(e))
-            
-            error_event = {
-                "type": "error",
-                "error": str(e),
-                "done": True,
-                "request_id": request_id
-            }
-            yield f"data: {json.dumps(error_event, ensure_ascii=False)}\n\n"
+    Returns:
+        StreamingResponse: 流式响应
+    """
+    token = req.headers.get("x-resume-token", token)
+    header = req.headers.get("last-event-id")
+    try:
+        position = int(header) if header is not None else (last_event_id or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无效的Last-Event-ID: {header}")
     
+    try:
+        frames = resumable_streams.resume(request_id, token or "", position)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="流不存在或已过期，请重新发送请求")
+    except LookupError:
+        raise HTTPException(status_code=410, detail="需要补发的内容已不在缓冲区中，请重新发送请求")
     
-    # 返回流式响应，设置合适的响应头
-    return StreamingResponse(
-        generate_stream(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache, no-transform",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",  # 禁用Nginx缓冲
-            "Transfer-Encoding": "chunked",  # 使用分块编码
-            "Content-Type": "text/event-stream; charset=utf-8",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "*",
-            "X-Request-ID": request_id  # 添加请求ID用于追踪
-        }
-    )
+    return StreamingResponse(frames, media_type="text/event-stream", headers=sse_headers(request_id))
+
+
+@router.get("/resume-stats")
+async def get_resume_stats() -> Dict[str, Any]:
+    """
+    获取断线续传统计
+    
+    Returns:
+        保留的流数量和续传次数
+    """
+    return {
+        "success": True,
+        "data": resumable_streams.get_stats()
+    }
 
 
 @router.post("/message", response_model=ChatResponse)
@@ -326,7 +383,8 @@ async def single_chat(request: ChatRequest):
         # 强制设置为非流式
         request.stream = False
         
-        response = await coze_service.chat_single(request)
+        async with admission_service.slot(request.doctor_type):
+            response = await coze_service.chat_single(request)
         
         if response.error:
             logger.error(f"聊天错误: {response.error}")
@@ -335,6 +393,10 @@ async def single_chat(request: ChatRequest):
         logger.info(f"单次聊天完成 - 对话: {response.conversation_id}")
         return response
         
+    except AdmissionRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"单次聊天接口错误: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -384,7 +446,8 @@ async def single_chat_without_references(request: ChatRequest):
         # 强制设置为非流式
         request.stream = False
         
-        response = await coze_service.chat_single_without_references(request)
+        async with admission_service.slot(request.doctor_type):
+            response = await coze_service.chat_single_without_references(request)
         
         if response.error:
             logger.error(f"聊天错误: {response.error}")
@@ -393,11 +456,46 @@ async def single_chat_without_references(request: ChatRequest):
         logger.info(f"无引用单次聊天完成 - 对话: {response.conversation_id}")
         return response
         
+    except AdmissionRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"无引用单次聊天接口错误: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/batch")
+async def batch_chat(batch: BatchChatRequest):
+    """
+    批量聊天接口，用于对各医生机器人批量执行标准问题
+    
+    Args:
+        batch: 批量聊天请求
+        
+    Returns:
+        StreamingResponse: NDJSON流，每行一个按完成顺序返回的结果，最后一行为汇总
+    """
+    max_items = config_service.get_config().batch.max_items
+    if len(batch.requests) > max_items:
+        raise HTTPException(status_code=413, detail=f"单次批量请求最多 {max_items} 条")
+    
+    logger.info(f"收到批量聊天请求 - 共 {len(batch.requests)} 条, 每医生并发: {batch.concurrency or '默认'}")
+    
+    async def generate_results():
+        async for line in batch_service.run(batch.requests, batch.concurrency, batch.without_references):
+            yield line.model_dump_json() + "\n"
+    
+    return StreamingResponse(
+        generate_results(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
 @router.options("/references/{conversation_id}")
 async def options_references():
     """处理获取引用文献的OPTIONS预检请求"""
@@ -432,6 +530,118 @@ async def get_references(conversation_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/admission-stats")
+async def get_admission_stats() -> Dict[str, Any]:
+    """
+    获取各医生类型的并发和排队统计，用于调整并发上限
+    
+    Returns:
+        排队统计信息
+    """
+    return {
+        "success": True,
+        "data": admission_service.get_stats()
+    }
+
+
+@router.get("/pool-stats")
+async def get_pool_stats() -> Dict[str, Any]:
+    """
+    获取共享HTTP连接池统计
+    
+    Returns:
+        连接池统计信息
+    """
+    return {
+        "success": True,
+        "data": http_pool_service.get_stats()
+    }
+
+
+@router.get("/breaker-stats")
+async def get_breaker_stats() -> Dict[str, Any]:
+    """
+    获取各机器人的熔断器状态
+    
+    Returns:
+        熔断器统计信息
+    """
+    return {
+        "success": True,
+        "data": coze_service.get_breaker_stats()
+    }
+
+
+@router.get("/single-flight-stats")
+async def get_single_flight_stats() -> Dict[str, Any]:
+    """
+    获取相同请求合并的统计
+    
+    Returns:
+        进行中的上游流和共用次数
+    """
+    return {
+        "success": True,
+        "data": coze_service.get_single_flight_stats()
+    }
+
+
+@router.get("/stream-stats")
+async def get_stream_stats() -> Dict[str, Any]:
+    """
+    获取流式请求的完成和断开统计
+    
+    Returns:
+        完成数、客户端中途断开数和估算节省的输出token数
+    """
+    return {
+        "success": True,
+        "data": stream_stats.get_stats()
+    }
+
+
+@router.get("/pipeline-stats")
+async def get_pipeline_stats() -> Dict[str, Any]:
+    """
+    获取流式管道各阶段的耗时，需开启stream.stage_timing
+    
+    Returns:
+        按接口汇总的各阶段调用次数、累计耗时和平均耗时
+    """
+    return {
+        "success": True,
+        "data": pipeline_stats.get_stats()
+    }
+
+
+@router.get("/answer-cache-stats")
+async def get_answer_cache_stats() -> Dict[str, Any]:
+    """
+    获取回答缓存的容量和命中统计
+    
+    Returns:
+        回答缓存统计信息
+    """
+    return {
+        "success": True,
+        "data": coze_service.get_answer_cache_stats()
+    }
+
+
+@router.get("/references-stats")
+async def get_references_stats() -> Dict[str, Any]:
+    """
+    获取引用文本存储的容量和命中统计
+    
+    Returns:
+        引用文本存储统计信息
+    """
+    return {
+        "success": True,
+        "data": await coze_service.get_references_stats()
+    }
+
+
 @router.get("/bot-info")
 async def get_bot_info(doctor_type: str = None) -> Dict[str, Any]:
     """
@@ -513,14 +723,29 @@ async def reload_config():
         # 重新加载配置服务
         config_service.reload_config()
         
-        # 重新加载Coze客户端
+        # 重新加载Coze客户端，连接池配置变化时切换连接池
+        await http_pool_service.reload()
         coze_service.reload_client()
+        await coze_service.reload_references_store()
         
-        return {
+        # 按新配置重建准入控制
+        admission_service.reload()
+        
+        result = {
             "success": True,
             "message": "配置重新加载成功"
         }
         
+        # 重新预热，避免重载后的首个请求承担客户端创建和握手开销
+        server_config = config_service.get_server_config()
+        if server_config.warmup_enabled:
+            result["warmup"] = await coze_service.warm_up(
+                connections=server_config.warmup_connections,
+                timeout=server_config.warmup_timeout
+            )
+        
+        return result
+        
     except Exception as e:
         logger.error(f"重新加载配置错误: {e}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -2,11 +2,18 @@
 健康检查API
 """
 
+import asyncio
 from datetime import datetime
-from fastapi import APIRouter
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from ..models.chat import HealthResponse
-from ..utils.logger import get_logger
+from ..services.coze_service import coze_service
+from ..services.metrics import registry
+from ..utils.log_store import query_logs
+from ..utils.logger import get_logger, get_log_stats, get_log_store
+from ..utils.request_timing import request_timing_stats
 
 logger = get_logger("health_api")
 
@@ -27,4 +34,80 @@ async def health_check():
         status="healthy",
         version="1.0.0",
         timestamp=datetime.now().isoformat()
-    ) 
\ No newline at end of file
+    ) 
+
+
+@router.get("/health/ready")
+async def readiness_check():
+    """
+    就绪检查接口，预热完成前返回503
+    
+    Returns:
+        预热状态及各医生的预热耗时
+    """
+    status = coze_service.get_warmup_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus指标接口
+    
+    Returns:
+        Prometheus文本格式的首token时间、token间隔、流时长、帧数、上游错误/重试/超时和进行中的流数
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/request-stats")
+async def get_request_stats():
+    """
+    获取各路由的请求耗时统计
+    
+    Returns:
+        各路由的请求数、平均响应头耗时、平均首字节耗时、平均和最大总耗时及发送字节数
+    """
+    return {
+        "success": True,
+        "data": request_timing_stats.get_stats()
+    }
+
+
+@router.get("/log-stats")
+async def get_logging_stats():
+    """
+    获取batched日志模式下各输出的队列统计
+    
+    Returns:
+        各输出的排队、已写入、丢弃和写入失败条数
+    """
+    return {
+        "success": True,
+        "data": get_log_stats()
+    }
+
+
+@router.get("/logs")
+async def get_logs(request_id: Optional[str] = None, conversation_id: Optional[str] = None):
+    """
+    按请求ID或对话ID查询结构化日志，需开启logging.structured
+    
+    Args:
+        request_id: 请求ID
+        conversation_id: 对话ID，同时返回这些请求在对话ID确定前的日志
+        
+    Returns:
+        按写入顺序排列的日志，包括已轮转和压缩的文件
+    """
+    if not request_id and not conversation_id:
+        raise HTTPException(status_code=400, detail="需要提供request_id或conversation_id")
+    store = get_log_store()
+    if store is None:
+        raise HTTPException(status_code=404, detail="未启用结构化日志")
+    # 读取文件的IO放到线程中，不阻塞事件循环
+    entries = await asyncio.to_thread(query_logs, store.path, request_id, conversation_id, store)
+    return {
+        "success": True,
+        "data": entries
+    }
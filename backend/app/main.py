@@ -2,59 +2,19 @@
 FastAPI主应用
 """
 
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
-from starlette.middleware.base import BaseHTTPMiddleware
 import os
-import time
-import asyncio
 
 from .api import chat, health, videos
 from .services.config_service import config_service
-from .utils.logger import setup_logger, get_logger, set_request_id
-
-
-# 请求日志中间件
-class RequestLoggerMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # 生成请求ID
-        request_id = set_request_id()
-        
-        # 获取日志记录器
-        logger = get_logger("http")
-        
-        # 记录请求开始
-        start_time = time.time()
-        client_host = request.client.host if request.client else "unknown"
-        logger.info(f"[{request_id}] 开始请求: {request.method} {request.url.path} - 客户端: {client_host}")
-        
-        try:
-            # 调用下一个中间件或路由处理函数
-            response = await call_next(request)
-            
-            # 计算处理时间
-            process_time = time.time() - start_time
-            
-            # 记录请求结果
-            logger.info(
-                f"[{request_id}] 完成请求: {request.method} {request.url.path} "
-                f"- 状态码: {response.status_code} - 耗时: {process_time:.3f}秒"
-            )
-            
-            # 添加请求ID到响应头
-            response.headers["X-Request-ID"] = request_id
-            return response
-            
-        except Exception as e:
-            # 记录异常
-            process_time = time.time() - start_time
-            logger.error(
-                f"[{request_id}] 请求异常: {request.method} {request.url.path} "
-                f"- 错误: {str(e)} - 耗时: {process_time:.3f}秒"
-            )
-            raise
+from .services.coze_service import coze_service
+from .services.http_pool_service import http_pool_service
+from .utils.logger import setup_logger, get_logger
+from .utils.request_timing import RequestTimingMiddleware
+from .utils.tracing import tracer
 
 
 @asynccontextmanager
@@ -76,14 +36,25 @@ async def lifespan(app: FastAPI):
         
         # 设置合适的日志级别
         log_level = "DEBUG" if config.server.debug else "INFO"
-        setup_logger(level=log_level, log_file=log_file)
+        setup_logger(level=log_level, log_file=log_file, log_config=config.logging)
+        tracer.configure(config.tracing, base_dir=os.path.dirname(log_dir))
         
         logger.info("="*50)
         logger.info("应用启动中...")
-        logger.info(f"日志级别: {log_level}, 日志文件: {log_file}")
+        logger.info(f"日志级别: {log_level}, 日志文件: {log_file}, 输出模式: {config.logging.mode}")
         logger.info(f"服务器配置: {config.server.host}:{config.server.port}")
         logger.info(f"机器人ID: {config.coze.get_config().bot_id}")
         logger.info(f"调试模式: {'启用' if config.server.debug else '禁用'}")
+        
+        # 预热各医生客户端和上游连接，完成前不接收请求
+        if config.server.warmup_enabled:
+            logger.info("开始预热医生客户端和上游连接...")
+            warmup_status = await coze_service.warm_up(
+                connections=config.server.warmup_connections,
+                timeout=config.server.warmup_timeout
+            )
+            logger.info(f"预热完成，总耗时: {warmup_status['elapsed_ms']}ms")
+        
         logger.info("应用启动完成")
         logger.info("="*50)
         
@@ -95,6 +66,9 @@ async def lifespan(app: FastAPI):
     
     # 关闭时的清理
     logger.info("应用正在关闭...")
+    await coze_service.aclose()
+    await http_pool_service.aclose()
+    tracer.close()
     logger.info("="*50)
 
 
@@ -106,8 +80,8 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# 添加请求日志中间件
-app.add_middleware(RequestLoggerMiddleware)
+# 添加请求日志和计时中间件(纯ASGI，不影响流式响应)
+app.add_middleware(RequestTimingMiddleware)
 
 # 获取配置
 try:
@@ -131,7 +105,7 @@ app.add_middleware(
     allow_credentials=False,  # 当支持null origin和通配符origin时，需要设置为False
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
-    expose_headers=["X-Request-ID"],  # 暴露请求ID头部
+    expose_headers=["X-Request-ID", "Retry-After"],  # 暴露请求ID和限流重试头部
 )
 
 # 注册路由
@@ -30,6 +30,8 @@ class ChatRequest(BaseModel):
     stream: bool = Field(default=True, description="是否流式响应")
     doctor_type: Optional[str] = Field(default=None, description="医生类型，如'wang'或'chen'")
     form_data: Optional[Dict[str, Any]] = Field(default=None, description="表单数据，将会被转换为字符串并拼接到消息前面")
+    coalesce_ms: Optional[int] = Field(default=None, ge=0, description="流式增量合并时间窗口(毫秒)，0表示不合并，未设置时使用接口配置")
+    coalesce_bytes: Optional[int] = Field(default=None, ge=0, description="合并内容的字节数上限，未设置时使用接口配置")
 
 
 class ChatResponse(BaseModel):
@@ -59,6 +61,39 @@ class StreamEvent(BaseModel):
     follow_up_questions: Optional[List[str]] = Field(default=None, description="建议问题列表")
 
 
+# 单次批量请求条数的硬上限，请求体超过时在解析阶段即被拒绝；batch.max_items只能在此范围内调低
+BATCH_MAX_ITEMS = 1000
+
+
+class BatchChatRequest(BaseModel):
+    """批量聊天请求"""
+    requests: List[ChatRequest] = Field(..., description="聊天请求列表", min_length=1, max_length=BATCH_MAX_ITEMS)
+    concurrency: Optional[int] = Field(default=None, ge=1, description="每个医生类型同时执行的请求数，未设置时使用配置")
+    without_references: bool = Field(default=False, description="是否去除回答中的引用文献部分")
+
+
+class BatchChatItemResult(BaseModel):
+    """批量聊天中单个请求的结果"""
+    type: str = Field(default="result", description="行类型")
+    index: int = Field(..., description="请求在列表中的序号")
+    doctor_type: Optional[str] = Field(default=None, description="医生类型")
+    conversation_id: Optional[str] = Field(default=None, description="对话ID")
+    content: str = Field(default="", description="回复内容")
+    usage: Optional[Dict[str, Any]] = Field(default=None, description="使用统计")
+    error: Optional[str] = Field(default=None, description="错误信息")
+    wait_ms: float = Field(default=0.0, description="等待执行名额的时间(毫秒)")
+    elapsed_ms: float = Field(default=0.0, description="执行耗时(毫秒)")
+
+
+class BatchChatSummary(BaseModel):
+    """批量聊天的汇总，作为最后一行输出"""
+    type: str = Field(default="summary", description="行类型")
+    total: int = Field(..., description="请求总数")
+    succeeded: int = Field(..., description="成功数")
+    failed: int = Field(..., description="失败数")
+    elapsed_ms: float = Field(..., description="总耗时(毫秒)")
+
+
 class HealthResponse(BaseModel):
     """健康检查响应"""
     status: str = Field(..., description="服务状态")
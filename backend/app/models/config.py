@@ -5,6 +5,8 @@
 from typing import List, Dict, Optional, Any
 from pydantic import BaseModel, Field
 
+from .chat import BATCH_MAX_ITEMS
+
 
 class CozeConfig(BaseModel):
     """Coze API配置"""
@@ -14,6 +16,13 @@ class CozeConfig(BaseModel):
     default_user_id: str = Field(default="default_user", description="默认用户ID")
     timeout: int = Field(default=30, description="请求超时时间(秒)")
     max_retries: int = Field(default=3, description="最大重试次数")
+    retry_base_delay: float = Field(default=0.5, description="重试退避基础时间(秒)，按指数增长并加入随机抖动")
+    retry_max_delay: float = Field(default=4.0, description="单次重试退避时间上限(秒)")
+    breaker_failure_threshold: int = Field(default=5, description="连续失败多少次后熔断")
+    breaker_reset_timeout: float = Field(default=30.0, description="熔断后多久允许探测请求(秒)")
+    max_concurrency: int = Field(default=0, description="同时进行的上游请求数上限，0表示不限制(不启用准入控制)")
+    max_queue_size: int = Field(default=100, description="超出并发上限后的等待队列长度上限")
+    queue_timeout: float = Field(default=15.0, description="排队等待的最长时间(秒)")
     description: Optional[str] = Field(default=None, description="配置描述")
 
 
@@ -33,11 +42,32 @@ class CozeConfigs(BaseModel):
         Returns:
             对应的Coze配置
         """
-        if doctor_type and hasattr(self, doctor_type):
-            config = getattr(self, doctor_type)
-            if config:
-                return config
-        return self.default
+        name = self.resolve_doctor_type(doctor_type)
+        return getattr(self, name) if name else self.default
+    
+    def resolve_doctor_type(self, doctor_type: Optional[str] = None) -> Optional[str]:
+        """
+        将请求中的医生类型归一为已配置的医生类型
+        
+        Args:
+            doctor_type: 客户端传入的医生类型
+            
+        Returns:
+            已配置的医生类型，未知类型和默认配置均为None
+        """
+        if doctor_type and doctor_type != "default" and doctor_type in type(self).model_fields \
+                and getattr(self, doctor_type):
+            return doctor_type
+        return None
+    
+    def doctor_types(self) -> List[Optional[str]]:
+        """
+        获取所有已配置的医生类型
+        
+        Returns:
+            医生类型列表，默认配置对应None
+        """
+        return [None] + [name for name in type(self).model_fields if name != "default" and getattr(self, name)]
 
 
 class ServerConfig(BaseModel):
@@ -46,9 +76,122 @@ class ServerConfig(BaseModel):
     port: int = Field(default=8000, description="服务器端口")
     debug: bool = Field(default=False, description="调试模式")
     cors_origins: List[str] = Field(default_factory=list, description="允许的跨域源")
+    warmup_enabled: bool = Field(default=False, description="启动和重载配置时预热医生客户端和上游连接")
+    warmup_connections: int = Field(default=1, description="每个医生预先建立的连接数")
+    warmup_timeout: float = Field(default=10.0, description="预热建立连接超时时间(秒)")
+
+
+class HttpPoolConfig(BaseModel):
+    """共享HTTP连接池配置"""
+    max_connections: int = Field(default=200, description="连接池最大连接数")
+    max_keepalive_connections: int = Field(default=50, description="保持空闲的keep-alive连接数上限")
+    keepalive_expiry: float = Field(default=60.0, description="空闲连接保持时间(秒)")
+    connect_timeout: float = Field(default=5.0, description="建立连接超时时间(秒)")
+    http2: bool = Field(default=True, description="安装h2时启用HTTP/2")
+
+
+class CoalesceConfig(BaseModel):
+    """流式增量合并配置"""
+    window_ms: int = Field(default=0, description="合并时间窗口(毫秒)，0表示不合并")
+    max_bytes: int = Field(default=4096, description="合并内容的字节数上限，达到后立即发出")
+
+
+class ResumeConfig(BaseModel):
+    """SSE流续传配置"""
+    enabled: bool = Field(default=False, description="是否允许客户端断线后通过Last-Event-ID续传，开启后断开的流会在宽限期内继续生成")
+    buffer_frames: int = Field(default=4096, ge=1, description="每个流保留的最近SSE帧数")
+    grace_seconds: float = Field(default=10.0, gt=0, description="客户端断开后继续生成、等待重连的时间(秒)")
+    retention_seconds: float = Field(default=60.0, ge=0, description="流结束后保留帧的时间(秒)")
+    max_streams: int = Field(default=1000, ge=1, description="最多保留的流数量")
+
+
+class StreamConfig(BaseModel):
+    """流式输出配置"""
+    coalesce: CoalesceConfig = Field(default_factory=CoalesceConfig, description="默认的增量合并配置")
+    endpoint_coalesce: Dict[str, CoalesceConfig] = Field(
+        default_factory=dict, description="按接口路径覆盖的增量合并配置，如'/api/chat/stream'"
+    )
+    single_flight: bool = Field(default=False, description="同时进行的相同请求是否共用一个上游流")
+    json_backend: str = Field(default="auto", description="SSE帧的JSON序列化后端：auto、orjson或json")
+    keepalive_interval: float = Field(default=15, ge=0, description="上游静默期间发送心跳注释帧的间隔(秒)，0表示不发送")
+    resume: ResumeConfig = Field(default_factory=ResumeConfig, description="断线续传配置")
+    stage_timing: bool = Field(default=False, description="是否记录流式管道各阶段的耗时")
+    
+    def get_coalesce(self, endpoint: str) -> CoalesceConfig:
+        """
+        获取接口的增量合并配置
+        
+        Args:
+            endpoint: 接口路径
+            
+        Returns:
+            接口配置，未单独配置时返回默认配置
+        """
+        return self.endpoint_coalesce.get(endpoint, self.coalesce)
+
+
+class ReferencesConfig(BaseModel):
+    """引用文本存储配置"""
+    backend: str = Field(default="memory", description="存储后端: memory(单进程)、sqlite(同机多worker)、redis(多机)")
+    sqlite_path: str = Field(default="data/references.db", description="sqlite后端的数据库文件路径")
+    redis_url: str = Field(default="redis://localhost:6379/0", description="redis后端地址")
+    redis_timeout: float = Field(default=1.0, description="redis命令超时时间(秒)")
+    key_prefix: str = Field(default="johnson:references:", description="redis后端的键前缀")
+    ttl_seconds: float = Field(default=3600.0, description="引用文本保留时间(秒)，0表示不过期")
+    max_entries: int = Field(default=10000, description="最多保留的对话数，0表示不限制")
+    max_bytes: int = Field(default=64 * 1024 * 1024, description="引用文本总字节数上限，0表示不限制")
+
+
+class AnswerCacheConfig(BaseModel):
+    """相同问题的回答缓存配置"""
+    enabled: bool = Field(default=False, description="是否启用回答缓存")
+    ttl_seconds: float = Field(default=600.0, description="回答保留时间(秒)，0表示不过期")
+    max_entries: int = Field(default=1000, description="最多缓存的回答数，0表示不限制")
+    max_bytes: int = Field(default=32 * 1024 * 1024, description="缓存回答总字节数上限，0表示不限制")
+    replay_chunk_chars: int = Field(default=16, description="回放时每个消息事件的字符数，0表示一次发出全文")
+    replay_interval_ms: int = Field(default=20, description="回放时消息事件之间的间隔(毫秒)，0表示不等待")
+
+
+class BatchConfig(BaseModel):
+    """批量聊天配置"""
+    max_items: int = Field(default=500, ge=1, le=BATCH_MAX_ITEMS, description="单次批量请求的最大条数")
+    concurrency_per_doctor: int = Field(default=4, description="每个医生类型同时执行的请求数")
+
+
+class LogConfig(BaseModel):
+    """日志输出配置"""
+    mode: str = Field(default="sync", description="输出模式：sync(同步写入)或batched(有界队列+后台批量写入)")
+    queue_size: int = Field(default=10000, ge=1, description="batched模式下每个输出的队列容量(条)")
+    batch_size: int = Field(default=512, ge=1, description="后台每次写入的最大条数")
+    flush_interval: float = Field(default=0.05, gt=0, description="后台写入间隔(秒)")
+    overflow: str = Field(default="drop", description="队列满时的策略：drop(丢弃新日志)、drop_oldest(丢弃最早的日志)或sample(过半后按比例采样)")
+    sample_rate: int = Field(default=10, ge=1, description="sample策略下WARNING以下的日志每N条保留1条")
+    stream_trace_sample_rate: float = Field(
+        default=0.0, ge=0, le=1, description="逐事件写DEBUG明细日志的流所占比例，其余流只写一条摘要"
+    )
+    structured: bool = Field(default=False, description="额外写入按请求ID和对话ID索引的JSON-lines日志(app.jsonl)")
+    structured_max_bytes: int = Field(default=50 * 1024 * 1024, ge=1, description="JSON-lines日志轮转的文件大小(字节)")
+    structured_backups: int = Field(default=10, ge=0, description="保留的轮转JSON-lines日志文件数")
+    structured_compress: bool = Field(default=True, description="轮转后按块压缩为gzip，查询时只解压命中的块")
+
+
+class TracingConfig(BaseModel):
+    """请求链路追踪配置"""
+    enabled: bool = Field(default=False, description="为每个请求记录各阶段耗时的span")
+    server_timing: bool = Field(default=False, description="在Server-Timing响应头和流末尾的timing事件中返回span耗时")
+    export_file: str = Field(default="", description="OTLP JSON-lines导出文件(相对backend目录，如logs/traces.jsonl)，为空则不导出")
+    export_queue_size: int = Field(default=10000, ge=1, description="待导出Trace的队列容量，满时丢弃")
+    service_name: str = Field(default="johnson-backend", description="导出时的service.name资源属性")
 
 
 class AppConfig(BaseModel):
     """应用配置"""
     coze: CozeConfigs
-    server: ServerConfig 
\ No newline at end of file
+    server: ServerConfig
+    http_pool: HttpPoolConfig = Field(default_factory=HttpPoolConfig, description="共享HTTP连接池配置")
+    stream: StreamConfig = Field(default_factory=StreamConfig, description="流式输出配置")
+    references: ReferencesConfig = Field(default_factory=ReferencesConfig, description="引用文本存储配置")
+    answer_cache: AnswerCacheConfig = Field(default_factory=AnswerCacheConfig, description="回答缓存配置")
+    batch: BatchConfig = Field(default_factory=BatchConfig, description="批量聊天配置")
+    logging: LogConfig = Field(default_factory=LogConfig, description="日志输出配置")
+    tracing: TracingConfig = Field(default_factory=TracingConfig, description="请求链路追踪配置")
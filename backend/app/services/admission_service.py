@@ -0,0 +1,257 @@
+"""
+聊天请求准入控制服务
+
+按医生类型(doctor_type)限制同时进行的上游请求数，超出上限的请求进入有界等待队列，
+队列已满或排队超时的请求会被快速拒绝，而不是一直挂起。
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+from ..services.config_service import config_service
+from ..utils.logger import get_logger
+
+logger = get_logger("admission_service")
+
+# 排队等待时间直方图的桶上限(毫秒)
+WAIT_BUCKETS_MS = (10, 50, 100, 500, 1000, 5000, 10000)
+
+
+class AdmissionRejectedError(Exception):
+    """请求未被准入"""
+
+    def __init__(self, doctor_type: Optional[str], status_code: int, retry_after: int, reason: str):
+        self.doctor_type = doctor_type
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+        super().__init__(reason)
+
+
+class AdmissionTicket:
+    """已准入请求持有的并发名额，release可重复调用；gate为None表示无需占用名额的请求"""
+
+    def __init__(self, gate: Optional["DoctorGate"]):
+        self._gate = gate
+        self._acquired_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        """释放并发名额"""
+        if self._released:
+            return
+        self._released = True
+        if self._gate is not None:
+            self._gate.release(time.monotonic() - self._acquired_at)
+
+
+class DoctorGate:
+    """单个医生类型的并发闸门和等待队列"""
+
+    def __init__(self, doctor_type: Optional[str], max_concurrency: int, max_queue_size: int, queue_timeout: float):
+        self.doctor_type = doctor_type
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.queue_timeout = queue_timeout
+
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        # 统计信息
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.avg_hold_time = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _retry_after(self) -> int:
+        """根据平均占用时长估算客户端应等待的秒数"""
+        limit = max(self.max_concurrency, 1)
+        estimate = self.avg_hold_time * (self.queue_depth + 1) / limit
+        return min(max(int(math.ceil(estimate)), 1), 60)
+
+    def _record_wait(self, wait_time: float) -> None:
+        self.admitted += 1
+        self.total_wait += wait_time
+        self.max_wait = max(self.max_wait, wait_time)
+        wait_ms = wait_time * 1000
+        for i, bound in enumerate(WAIT_BUCKETS_MS):
+            if wait_ms <= bound:
+                self.wait_buckets[i] += 1
+                break
+        else:
+            self.wait_buckets[-1] += 1
+
+    async def acquire(self) -> AdmissionTicket:
+        """
+        获取并发名额
+
+        Returns:
+            AdmissionTicket: 并发名额
+
+        Raises:
+            AdmissionRejectedError: 队列已满(429)或排队超时(503)
+        """
+        if self.max_concurrency <= 0 or (self.active < self.max_concurrency and not self._waiters):
+            self.active += 1
+            self._record_wait(0.0)
+            return AdmissionTicket(self)
+
+        if self.queue_depth >= self.max_queue_size:
+            self.rejected_queue_full += 1
+            raise AdmissionRejectedError(
+                self.doctor_type, 429, self._retry_after(),
+                f"医生 {self.doctor_type or 'default'} 请求过多，等待队列已满({self.max_queue_size})"
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        start = time.monotonic()
+
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # 等待期间请求被取消：如果名额已转交则归还，否则移出队列
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            else:
+                self._discard(waiter)
+            raise
+
+        if not waiter.done():
+            self._discard(waiter)
+            self.rejected_timeout += 1
+            raise AdmissionRejectedError(
+                self.doctor_type, 503, self._retry_after(),
+                f"医生 {self.doctor_type or 'default'} 排队超时({self.queue_timeout}秒)"
+            )
+
+        self._record_wait(time.monotonic() - start)
+        return AdmissionTicket(self)
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self, hold_time: float) -> None:
+        """归还名额，如有等待者则直接转交给队首"""
+        if hold_time:
+            self.avg_hold_time = hold_time if not self.avg_hold_time else 0.8 * self.avg_hold_time + 0.2 * hold_time
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active = max(self.active - 1, 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        buckets = {f"le_{bound}ms": count for bound, count in zip(WAIT_BUCKETS_MS, self.wait_buckets)}
+        buckets["gt_{}ms".format(WAIT_BUCKETS_MS[-1])] = self.wait_buckets[-1]
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue_size": self.max_queue_size,
+            "queue_timeout": self.queue_timeout,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "avg_hold_seconds": round(self.avg_hold_time, 3),
+            "wait_histogram": buckets,
+        }
+
+
+class AdmissionService:
+    """按医生类型的准入控制"""
+
+    def __init__(self):
+        """初始化准入控制服务"""
+        self._gates: Dict[Optional[str], DoctorGate] = {}
+
+    def _get_gate(self, doctor_type: Optional[str] = None) -> DoctorGate:
+        """
+        获取医生类型对应的闸门
+
+        Args:
+            doctor_type: 医生类型，如'wang'或'chen'，未配置的类型共用默认配置的闸门
+
+        Returns:
+            DoctorGate: 并发闸门
+        """
+        doctor_type = config_service.resolve_doctor_type(doctor_type)
+        if doctor_type not in self._gates:
+            config = config_service.get_coze_config(doctor_type)
+            self._gates[doctor_type] = DoctorGate(
+                doctor_type,
+                max_concurrency=config.max_concurrency,
+                max_queue_size=config.max_queue_size,
+                queue_timeout=config.queue_timeout,
+            )
+        return self._gates[doctor_type]
+
+    async def acquire(self, doctor_type: Optional[str] = None) -> AdmissionTicket:
+        """
+        为请求获取并发名额
+
+        Args:
+            doctor_type: 医生类型
+
+        Returns:
+            AdmissionTicket: 并发名额，使用完毕后需调用release
+
+        Raises:
+            AdmissionRejectedError: 请求被拒绝
+        """
+        gate = self._get_gate(doctor_type)
+        try:
+            return await gate.acquire()
+        except AdmissionRejectedError as e:
+            logger.warning(f"拒绝请求: {e.reason}, 状态码: {e.status_code}, Retry-After: {e.retry_after}")
+            raise
+
+    @asynccontextmanager
+    async def slot(self, doctor_type: Optional[str] = None):
+        """以上下文管理器方式持有并发名额"""
+        ticket = await self.acquire(doctor_type)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取所有医生类型的排队统计
+
+        Returns:
+            以医生类型为键的统计信息
+        """
+        return {(doctor_type or "default"): gate.get_stats() for doctor_type, gate in self._gates.items()}
+
+    def reload(self) -> None:
+        """配置重载后重建闸门，已持有的名额仍归还到旧闸门"""
+        self._gates = {}
+        logger.info("准入控制已重置")
+
+
+# 全局服务实例
+admission_service = AdmissionService()
@@ -0,0 +1,167 @@
+"""
+相同问题的回答缓存
+
+AI页面的预设问题会被大量用户以相同文本发给同一位医生。启用后，以归一化的
+(doctor_type, message, form_data)为键缓存完整回答(含引用段落)、使用统计和建议问题，
+命中时按配置的节奏回放为流式事件，不再请求上游。带上下文的请求不参与缓存。
+"""
+
+import asyncio
+import hashlib
+import json
+import unicodedata
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from ..models.chat import ChatRequest, StreamEvent, StreamEventType
+from ..models.config import AnswerCacheConfig
+from ..utils.ttl_store import TTLStore
+
+
+def normalize_message(message: str) -> str:
+    """统一全角/半角字符并折叠空白"""
+    return " ".join(unicodedata.normalize("NFKC", message).split())
+
+
+def make_cache_key(request: ChatRequest) -> Optional[str]:
+    """
+    计算请求的缓存键
+
+    Args:
+        request: 聊天请求
+
+    Returns:
+        缓存键，请求带上下文时返回None
+    """
+    if request.context:
+        return None
+    canonical = json.dumps(
+        [
+            (request.doctor_type or "").strip().lower(),
+            normalize_message(request.message),
+            request.form_data or None,
+        ],
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CachedAnswer:
+    """一次完整回答"""
+
+    __slots__ = ("content", "usage", "follow_up_questions")
+
+    def __init__(self, content: str, usage: Optional[Dict[str, Any]] = None,
+                 follow_up_questions: Optional[List[str]] = None):
+        self.content = content
+        self.usage = usage
+        self.follow_up_questions = follow_up_questions
+
+    def to_json(self) -> str:
+        return json.dumps({"content": self.content, "usage": self.usage,
+                           "follow_up_questions": self.follow_up_questions}, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, data: str) -> "CachedAnswer":
+        return cls(**json.loads(data))
+
+
+class AnswerRecorder:
+    """在转发流式事件的同时记录回答，流正常完成后写入缓存"""
+
+    def __init__(self, cache: "AnswerCache", key: str):
+        self._cache = cache
+        self._key = key
+        self._parts: List[str] = []
+
+    def record(self, event: StreamEvent) -> None:
+        """记录一个流式事件"""
+        if event.type == StreamEventType.MESSAGE:
+            if event.content:
+                self._parts.append(event.content)
+        elif event.type == StreamEventType.COMPLETE and self._parts:
+            self._cache.put(self._key, CachedAnswer(
+                content="".join(self._parts),
+                usage=event.usage,
+                follow_up_questions=event.follow_up_questions,
+            ))
+
+
+class AnswerCache:
+    """带TTL和LRU淘汰的回答缓存，以缓存键保存序列化的回答"""
+
+    def __init__(self, config: AnswerCacheConfig):
+        self.config = config
+        self._store = TTLStore(
+            ttl_seconds=config.ttl_seconds,
+            max_entries=config.max_entries,
+            max_bytes=config.max_bytes,
+        )
+        self.stored = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def key_for(self, request: ChatRequest) -> Optional[str]:
+        """缓存未启用或请求不可缓存时返回None"""
+        return make_cache_key(request) if self.config.enabled else None
+
+    def get(self, key: str) -> Optional[CachedAnswer]:
+        """读取缓存的回答"""
+        data = self._store.get(key)
+        return CachedAnswer.from_json(data) if data is not None else None
+
+    def put(self, key: str, answer: CachedAnswer) -> None:
+        """写入回答"""
+        if self._store.set(key, answer.to_json()):
+            self.stored += 1
+
+    def recorder(self, key: str) -> AnswerRecorder:
+        """创建记录上游流的记录器"""
+        return AnswerRecorder(self, key)
+
+    async def replay(self, answer: CachedAnswer, paced: bool = True) -> AsyncGenerator[StreamEvent, None]:
+        """
+        将缓存的回答回放为流式事件
+
+        Args:
+            answer: 缓存的回答
+            paced: 是否按配置的间隔逐块发出，非流式调用方可关闭
+
+        Yields:
+            StreamEvent: 消息事件和带建议问题的完成事件
+        """
+        content = answer.content
+        size = self.config.replay_chunk_chars if paced and self.config.replay_chunk_chars > 0 else len(content)
+        interval = self.config.replay_interval_ms / 1000 if paced else 0
+        for start in range(0, len(content), size or 1):
+            if start and interval:
+                await asyncio.sleep(interval)
+            yield StreamEvent(type=StreamEventType.MESSAGE, content=content[start:start + size], done=False)
+        yield StreamEvent(
+            type=StreamEventType.COMPLETE,
+            done=True,
+            usage=answer.usage,
+            follow_up_questions=answer.follow_up_questions,
+        )
+
+    def invalidate(self, config: Optional[AnswerCacheConfig] = None) -> None:
+        """清空缓存，配置重载后机器人或提示词可能已变化"""
+        if config is not None:
+            self.config = config
+            self._store.ttl_seconds = config.ttl_seconds
+            self._store.max_entries = config.max_entries
+            self._store.max_bytes = config.max_bytes
+        self._store.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        stats = self._store.get_stats()
+        stats.update({
+            "enabled": self.config.enabled,
+            "stored": self.stored,
+        })
+        return stats
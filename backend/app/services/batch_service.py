@@ -0,0 +1,100 @@
+"""
+批量聊天服务
+
+按医生类型限制同时执行的请求数，结果按完成顺序产出，便于以NDJSON流式返回。
+每个请求仍经过准入控制，批量任务不会挤占交互请求的全部并发名额。
+"""
+
+import asyncio
+import time
+from typing import AsyncGenerator, Dict, List, Optional, Union
+
+from ..models.chat import BatchChatItemResult, BatchChatSummary, ChatRequest
+from ..services.admission_service import admission_service, AdmissionRejectedError
+from ..services.config_service import config_service
+from ..services.coze_service import coze_service
+from ..services.stream_pipeline import merge_form_data
+from ..utils.logger import get_logger
+
+logger = get_logger("batch_service")
+
+
+class BatchService:
+    """批量聊天服务"""
+
+    def __init__(self, service=None):
+        self._service = service or coze_service
+
+    async def _run_one(self, index: int, request: ChatRequest, semaphore: asyncio.Semaphore,
+                       without_references: bool) -> BatchChatItemResult:
+        result = BatchChatItemResult(index=index, doctor_type=request.doctor_type,
+                                     conversation_id=request.conversation_id)
+        queued_at = time.perf_counter()
+        async with semaphore:
+            started_at = time.perf_counter()
+            result.wait_ms = round((started_at - queued_at) * 1000, 2)
+            try:
+                request.stream = False
+                async with admission_service.slot(request.doctor_type):
+                    if without_references:
+                        merge_form_data(request)
+                        response = await self._service.chat_single_without_references(request)
+                    else:
+                        response = await self._service.chat_single(request)
+                result.conversation_id = response.conversation_id
+                result.content = response.content
+                result.usage = response.usage
+                result.error = response.error
+            except AdmissionRejectedError as e:
+                result.error = e.reason
+            except Exception as e:
+                logger.error(f"批量聊天第 {index} 条失败: {e}")
+                result.error = str(e)
+            result.elapsed_ms = round((time.perf_counter() - started_at) * 1000, 2)
+        return result
+
+    async def run(self, requests: List[ChatRequest], concurrency: Optional[int] = None,
+                  without_references: bool = False
+                  ) -> AsyncGenerator[Union[BatchChatItemResult, BatchChatSummary], None]:
+        """
+        执行批量聊天
+
+        Args:
+            requests: 聊天请求列表
+            concurrency: 每个医生类型同时执行的请求数，None表示使用配置
+            without_references: 是否去除引用文献部分
+
+        Yields:
+            按完成顺序产出的单条结果，最后是汇总
+        """
+        limit = concurrency or config_service.get_config().batch.concurrency_per_doctor
+        semaphores: Dict[Optional[str], asyncio.Semaphore] = {}
+        start = time.perf_counter()
+
+        tasks = []
+        for index, request in enumerate(requests):
+            semaphore = semaphores.get(request.doctor_type)
+            if semaphore is None:
+                semaphore = semaphores[request.doctor_type] = asyncio.Semaphore(limit)
+            tasks.append(asyncio.ensure_future(self._run_one(index, request, semaphore, without_references)))
+
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if not result.error:
+                    succeeded += 1
+                yield result
+        finally:
+            # 调用方提前断开时取消尚未完成的请求
+            for task in tasks:
+                task.cancel()
+
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+        logger.info(f"批量聊天完成 - 共 {len(requests)} 条，成功 {succeeded} 条，耗时 {elapsed_ms}ms")
+        yield BatchChatSummary(total=len(requests), succeeded=succeeded,
+                               failed=len(requests) - succeeded, elapsed_ms=elapsed_ms)
+
+
+# 全局服务实例
+batch_service = BatchService()
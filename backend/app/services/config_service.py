@@ -94,6 +94,18 @@ class ConfigService:
         config = self.get_config()
         return config.coze.get_config(doctor_type)
     
+    def resolve_doctor_type(self, doctor_type: Optional[str] = None) -> Optional[str]:
+        """
+        将客户端传入的医生类型归一为已配置的医生类型，未知类型对应默认配置(None)
+        
+        Args:
+            doctor_type: 医生类型
+        
+        Returns:
+            已配置的医生类型或None
+        """
+        return self.get_config().coze.resolve_doctor_type(doctor_type)
+    
     def get_server_config(self) -> ServerConfig:
         """
         获取服务器配置
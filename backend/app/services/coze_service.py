@@ -5,18 +5,32 @@ Coze API服务封装
 import asyncio
 import json
 import re
-from typing import AsyncGenerator, Optional, Dict, Any, Tuple, List
+import time
+from typing import AsyncGenerator, Optional, Dict, Any, Set, Tuple, List
 from uuid import uuid4
 
-from cozepy import Coze, TokenAuth, Message, MessageContentType, COZE_CN_BASE_URL, ChatEventType
+from cozepy import AsyncCoze, AsyncTokenAuth, Message, COZE_CN_BASE_URL, ChatEvent, ChatEventType
 
 from ..models.chat import ChatRequest, ChatResponse, StreamEvent, StreamEventType, MessageRole
 from ..models.config import CozeConfig
 from ..services.config_service import config_service
-from ..utils.logger import get_logger
+from ..services.answer_cache import AnswerCache, CachedAnswer, make_cache_key
+from ..services.event_decoder import chat_event_decoder, CONTENT, FOLLOW_UP, COMPLETE
+from ..services import metrics
+from ..services.http_pool_service import http_pool_service
+from ..services.single_flight import SingleFlight
+from ..services.stream_stats import stream_stats
+from ..services.references_store import ReferencesBackend, create_references_backend
+from ..utils.logger import get_logger, set_conversation_id
+from ..utils.resilience import CircuitBreaker, RetryPolicy, is_retryable
+from ..utils.stream_utils import StreamIdleTimeout, with_idle_timeout
+from ..utils.tracing import add_span, span
 
 logger = get_logger("coze_service")
 
+# 流日志中按解码结果(IGNORED、CONTENT、FOLLOW_UP、COMPLETE)记录的事件类型
+_EVENT_LABELS = ("received", "content", "follow_up", "complete")
+
 
 class CozeService:
     """Coze API服务"""
@@ -24,12 +38,18 @@ class CozeService:
     def __init__(self):
         """初始化Coze服务"""
         self._coze_clients = {}
+        self._http_clients = {}
         self._configs = {}
-        self._references_cache = {}  # 用于缓存引用文本
+        self._breakers: Dict[str, CircuitBreaker] = {}  # 以bot_id区分的熔断器
+        self._references_store: Optional[ReferencesBackend] = None  # 用于缓存引用文本
+        self._answer_cache: Optional[AnswerCache] = None  # 相同问题的回答缓存
+        self._single_flight = SingleFlight()  # 进行中的相同请求共用上游流
+        self._cancel_tasks: Set[asyncio.Task] = set()  # 客户端断开后进行中的取消对话请求
+        self._warmup_status: Dict[str, Any] = {"ready": True, "state": "skipped", "doctors": {}}
         
-    def _get_client(self, doctor_type: Optional[str] = None) -> Coze:
+    def _get_client(self, doctor_type: Optional[str] = None) -> AsyncCoze:
         """
-        获取Coze客户端实例
+        获取Coze异步客户端实例
         
         Args:
             doctor_type: 医生类型，如'wang'或'chen'
@@ -37,14 +57,20 @@ class CozeService:
         Returns:
             Coze客户端
         """
+        # 未配置的医生类型共用默认客户端
+        doctor_type = config_service.resolve_doctor_type(doctor_type)
         if doctor_type not in self._coze_clients:
             config = config_service.get_coze_config(doctor_type)
             self._configs[doctor_type] = config
             
-            # 创建Coze客户端
-            self._coze_clients[doctor_type] = Coze(
-                auth=TokenAuth(token=config.api_token),
-                base_url=config.base_url
+            # 创建Coze异步客户端，所有上游调用均以await方式执行，不阻塞事件循环
+            # 各医生客户端共用同一个连接池，超时取自医生配置
+            http_client = http_pool_service.create_client(config)
+            self._http_clients[doctor_type] = http_client
+            self._coze_clients[doctor_type] = AsyncCoze(
+                auth=AsyncTokenAuth(token=config.api_token),
+                base_url=config.base_url,
+                http_client=http_client
             )
             logger.info(f"Coze客户端初始化完成: {doctor_type or 'default'}")
             
@@ -60,9 +86,165 @@ class CozeService:
         Returns:
             Coze配置对象
         """
+        doctor_type = config_service.resolve_doctor_type(doctor_type)
         if doctor_type not in self._configs:
             self._configs[doctor_type] = config_service.get_coze_config(doctor_type)
         return self._configs[doctor_type]
+    
+    def _get_answer_cache(self) -> AnswerCache:
+        """获取回答缓存，首次使用时按配置创建"""
+        if self._answer_cache is None:
+            self._answer_cache = AnswerCache(config_service.get_config().answer_cache)
+        return self._answer_cache
+    
+    def get_cached_answer(self, request: ChatRequest) -> Optional[CachedAnswer]:
+        """
+        读取请求已缓存的回答，命中的请求不会访问上游
+        
+        调用方据此跳过准入控制时，应把结果交给replay_answer回放，而不是再次经chat_stream查找，
+        避免两次读取之间条目过期导致未占用名额却访问上游。
+        
+        Args:
+            request: 聊天请求
+            
+        Returns:
+            缓存的回答，未启用缓存或未命中时返回None
+        """
+        cache = self._get_answer_cache()
+        key = cache.key_for(request)
+        return cache.get(key) if key is not None else None
+    
+    def _get_references_store(self) -> ReferencesBackend:
+        """获取引用文本存储，首次使用时按配置创建"""
+        if self._references_store is None:
+            self._references_store = create_references_backend(config_service.get_config().references)
+        return self._references_store
+    
+    async def _save_references(self, conversation_id: str, references: str) -> None:
+        """保存引用文本，存储不可用时只记录错误，不影响聊天结果"""
+        store = self._get_references_store()
+        try:
+            await store.set(conversation_id, references)
+        except Exception as e:
+            store.errors += 1
+            logger.error(f"保存引用文本失败({store.name}): {e}")
+    
+    def _get_breaker(self, config: CozeConfig) -> CircuitBreaker:
+        """
+        获取机器人对应的熔断器
+        
+        Args:
+            config: Coze配置
+        
+        Returns:
+            以bot_id区分的熔断器
+        """
+        if config.bot_id not in self._breakers:
+            self._breakers[config.bot_id] = CircuitBreaker(
+                config.bot_id,
+                failure_threshold=config.breaker_failure_threshold,
+                reset_timeout=config.breaker_reset_timeout
+            )
+        return self._breakers[config.bot_id]
+    
+    def _cancel_chat(self, client: AsyncCoze, conversation_id: str, chat_id: str, request_id: str = "") -> None:
+        """
+        在后台取消进行中的对话
+
+        取消请求不阻塞断开后的清理，也不会被调用方任务的再次取消打断，关闭服务时等待其完成。
+
+        Args:
+            client: Coze客户端
+            conversation_id: 会话ID
+            chat_id: 对话ID
+            request_id: 请求ID
+        """
+        async def cancel() -> None:
+            try:
+                await client.chat.cancel(conversation_id=conversation_id, chat_id=chat_id)
+                stream_stats.record_upstream_cancel(True)
+                logger.info(f"[{request_id}] 已取消上游对话 {chat_id}")
+            except Exception as e:
+                stream_stats.record_upstream_cancel(False)
+                logger.warning(f"[{request_id}] 取消上游对话 {chat_id} 失败: {e}")
+
+        task = asyncio.ensure_future(cancel())
+        self._cancel_tasks.add(task)
+        task.add_done_callback(self._cancel_tasks.discard)
+
+    async def _stream_upstream(self, client: AsyncCoze, config: CozeConfig, additional_messages: List[Message],
+                               user_id: str, request_id: str = "",
+                               doctor_type: Optional[str] = None) -> AsyncGenerator[ChatEvent, None]:
+        """
+        带重试和熔断的上游事件流
+        
+        上游流是惰性的，连接、鉴权和读取错误都在迭代时才出现，因此重试覆盖整个迭代过程。
+        一旦已产出增量内容就不再重试，避免向调用方重复输出。
+        
+        Args:
+            client: Coze客户端
+            config: Coze配置
+            additional_messages: 消息列表
+            user_id: 用户ID
+            request_id: 请求ID
+            doctor_type: 医生类型，用于指标标签
+            
+        Yields:
+            ChatEvent: 上游事件
+        """
+        labels = (metrics.doctor_label(doctor_type), metrics.endpoint_var.get())
+        breaker = self._get_breaker(config)
+        retry_state = RetryPolicy.from_config(config).begin()
+        
+        while True:
+            breaker.before_call()
+            delta_seen = False
+            healthy = False
+            raw_response = None
+            chat = None
+            try:
+                async for event in client.chat.stream(
+                    bot_id=config.bot_id,
+                    user_id=user_id,
+                    additional_messages=additional_messages,
+                ):
+                    if not healthy:
+                        # 收到首个事件说明连接和鉴权正常
+                        healthy = True
+                        breaker.record_success()
+                        # cozepy没有关闭流式响应的公开接口，依赖的版本范围见requirements.txt
+                        raw_response = event._raw_response
+                    if event.event == ChatEventType.CONVERSATION_CHAT_CREATED:
+                        chat = event.chat
+                    elif event.event in (ChatEventType.CONVERSATION_CHAT_COMPLETED,
+                                         ChatEventType.CONVERSATION_CHAT_FAILED):
+                        # 对话已结束，之后提前关闭流无需取消
+                        chat = None
+                    elif event.event == ChatEventType.CONVERSATION_MESSAGE_DELTA:
+                        delta_seen = True
+                    yield event
+                return
+            except (GeneratorExit, asyncio.CancelledError):
+                # 调用方提前结束(如客户端断开)：关闭上游响应归还连接，并取消对话以中止生成。
+                # 只关闭响应时Coze仍会继续生成并计费
+                if raw_response is not None and not raw_response.is_closed:
+                    await raw_response.aclose()
+                if chat is not None:
+                    self._cancel_chat(client, chat.conversation_id, chat.id, request_id)
+                raise
+            except Exception as e:
+                if is_retryable(e):
+                    breaker.record_failure()
+                elif not healthy:
+                    breaker.record_success()
+                
+                delay = None if delta_seen else retry_state.next_delay(e)
+                if delay is None:
+                    metrics.upstream_errors.labels(*labels).inc()
+                    raise
+                metrics.upstream_retries.labels(*labels).inc()
+                logger.warning(f"[{request_id}] 流式请求失败，{delay:.2f}秒后第{retry_state.attempt}次重试: {e}")
+                await asyncio.sleep(delay)
         
     def _extract_references(self, text: str) -> Tuple[str, str]:
         """
@@ -94,12 +276,109 @@ class CozeService:
         
         return main_content, references
         
-    async def chat_stream(self, request: ChatRequest) -> AsyncGenerator[StreamEvent, None]:
+    def bind_conversation(self, request: ChatRequest) -> ChatRequest:
+        """
+        确定对话ID并设置到日志上下文
+
+        请求未带对话ID时生成一个，已带时原样沿用，因此可重复调用。调用方应在处理请求的任务中
+        尽早调用一次，之后引用保存、日志、结构化日志索引和返回给调用方的ID都使用同一个对话ID。
+
+        Args:
+            request: 聊天请求
+
+        Returns:
+            带对话ID的请求
+        """
+        if not request.conversation_id:
+            request = request.model_copy(update={"conversation_id": str(uuid4())})
+        set_conversation_id(request.conversation_id)
+        return request
+    
+    async def _replay(self, answer: CachedAnswer, paced: bool) -> AsyncGenerator[StreamEvent, None]:
+        from ..utils.logger import get_request_id
+        
+        logger.info(f"[{get_request_id()}] 命中回答缓存，回放 {len(answer.content)} 个字符")
+        async for event in self._get_answer_cache().replay(answer, paced):
+            yield event
+    
+    async def replay_answer(self, request: ChatRequest, answer: CachedAnswer,
+                            paced: bool = True) -> AsyncGenerator[StreamEvent, None]:
+        """
+        回放get_cached_answer取得的回答
+        
+        Args:
+            request: 聊天请求
+            answer: 缓存的回答
+            paced: 是否按配置的间隔发出
+            
+        Yields:
+            StreamEvent: 消息事件和完成事件
+        """
+        self.bind_conversation(request)
+        async for event in self._replay(answer, paced):
+            yield event
+    
+    async def chat_stream(self, request: ChatRequest, paced: bool = True,
+                          check_cache: bool = True) -> AsyncGenerator[StreamEvent, None]:
         """
         流式聊天
         
+        启用回答缓存时相同问题直接回放缓存的回答；启用single-flight时，
+        同时进行的相同请求共用一个上游流。
+        
         Args:
             request: 聊天请求
+            paced: 回放缓存时是否按配置的间隔发出
+            check_cache: 是否查找回答缓存，调用方已通过get_cached_answer查找过时传False
+            
+        Yields:
+            StreamEvent: 流式事件
+        """
+        from ..utils.logger import get_request_id
+        
+        request = self.bind_conversation(request)
+        cache = self._get_answer_cache()
+        single_flight = config_service.get_config().stream.single_flight
+        key = make_cache_key(request) if cache.enabled or single_flight else None
+        if key is None:
+            async for event in self._chat_stream_upstream(request):
+                yield event
+            return
+        
+        if cache.enabled and check_cache:
+            answer = cache.get(key)
+            if answer is not None:
+                async for event in self._replay(answer, paced):
+                    yield event
+                return
+        
+        if single_flight:
+            if key in self._single_flight:
+                logger.info(f"[{get_request_id()}] 加入进行中的相同请求，共用上游流")
+            events = self._single_flight.stream(key, lambda: self._recorded_upstream(request, key))
+        else:
+            events = self._recorded_upstream(request, key)
+        try:
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+    
+    async def _recorded_upstream(self, request: ChatRequest, key: str) -> AsyncGenerator[StreamEvent, None]:
+        """请求上游，启用回答缓存时记录完整回答"""
+        cache = self._get_answer_cache()
+        recorder = cache.recorder(key) if cache.enabled else None
+        async for event in self._chat_stream_upstream(request):
+            if recorder is not None:
+                recorder.record(event)
+            yield event
+    
+    async def _chat_stream_upstream(self, request: ChatRequest) -> AsyncGenerator[StreamEvent, None]:
+        """
+        请求上游的流式聊天
+        
+        Args:
+            request: 聊天请求，conversation_id已由chat_stream确定
             
         Yields:
             StreamEvent: 流式事件
@@ -112,8 +391,9 @@ class CozeService:
         
         try:
             doctor_type = request.doctor_type
-            client = self._get_client(doctor_type)
-            config = self._get_config(doctor_type)
+            with span("coze.client", doctor_type=doctor_type or "default"):
+                client = self._get_client(doctor_type)
+                config = self._get_config(doctor_type)
             
             logger.info(f"[{request_id}] 使用医生配置: {doctor_type or 'default'}, bot_id: {config.bot_id}")
             
@@ -132,150 +412,69 @@ class CozeService:
                 
                 additional_messages = context_messages + additional_messages
             
-            conversation_id = request.conversation_id or str(uuid4())
+            conversation_id = request.conversation_id
             logger.info(f"[{request_id}] 开始流式聊天 - 用户: {request.user_id}, 对话: {conversation_id}")
             
             # 添加日志记录请求详情
             logger.debug(f"[{request_id}] 流式聊天请求详情 - bot_id: {config.bot_id}, user_id: {request.user_id or config.default_user_id}")
             
             try:
-                # 设置超时并添加重试
+                # 事件间隔超时
                 timeout_seconds = config.timeout or 30
-                retries = config.max_retries or 3
-                retry_count = 0
-                
-                while True:
-                    try:
-                        # 调用Coze流式聊天API
-                        stream_response = client.chat.stream(
-                            bot_id=config.bot_id,
-                            user_id=request.user_id or config.default_user_id,
-                            additional_messages=additional_messages,
-                        )
-                        break  # 成功获取响应流，跳出重试循环
-                    except Exception as retry_error:
-                        retry_count += 1
-                        if retry_count > retries:
-                            logger.error(f"[{request_id}] 重试次数超过上限 ({retries}次)，放弃请求", exc_info=True)
-                            raise
-                        
-                        logger.warning(f"[{request_id}] 流式请求失败，尝试重试 ({retry_count}/{retries}): {retry_error}")
-                        await asyncio.sleep(1)  # 重试前等待1秒
                 
                 # 使用异步模式处理流式响应
                 content_accumulator = ""
                 event_count = 0
                 follow_up_questions = []  # 收集建议问题
+                decode_event = chat_event_decoder.decode
                 
                 # 初始化事件发送计时器和超时检测
                 last_event_time = asyncio.get_event_loop().time()
                 start_time = last_event_time
+                # 链路追踪的上游阶段(首个事件、首个内容、完成)都从这里开始计时
+                upstream_start = time.perf_counter()
+                first_token_seen = False
                 
-                # 异步处理流式响应
-                for event in stream_response:
+                # 异步处理流式响应，逐个await上游事件（含重试和熔断），超过事件间隔超时则中止上游
+                stream_response = self._stream_upstream(
+                    client, config, additional_messages, request.user_id or config.default_user_id, request_id,
+                    request.doctor_type,
+                )
+                async for event in with_idle_timeout(stream_response, timeout_seconds):
                     event_count += 1
+                    if event_count == 1:
+                        add_span("coze.first_byte", upstream_start)
                     current_time = asyncio.get_event_loop().time()
                     time_since_last = current_time - last_event_time
                     
-                    # 检测事件超时
-                    if time_since_last > timeout_seconds:
-                        logger.warning(f"[{request_id}] 流式事件接收超时 ({time_since_last:.1f}秒 > {timeout_seconds}秒)")
+                    # 日志参数在DEBUG级别未启用时不会格式化
+                    logger.debug("[{}] 收到原始流式事件 #{}, 间隔: {:.3f}秒", request_id, event_count, time_since_last)
                     
-                    stream_logger.log_event("received", metadata={"event_type": getattr(event, 'event', 'unknown')})
-                    logger.debug(f"[{request_id}] 收到原始流式事件 #{event_count}, 间隔: {time_since_last:.3f}秒")
-                    
-                    # 提取内容
+                    # 查表解码事件，访问路径已预先解析
                     content = None
                     is_complete = False
                     usage_info = None
-                    follow_up_content = None
                     
-                    # 根据事件类型处理
-                    if hasattr(event, 'event'):
-                        # 处理具有event字段的事件
-                        event_type = getattr(event, 'event', None)
-                        
-                        if event_type == ChatEventType.CONVERSATION_MESSAGE_DELTA:
-                            # 消息增量事件 - 从各种可能的属性中提取内容
-                            if hasattr(event, 'message') and hasattr(event.message, 'content'):
-                                content = event.message.content
-                            elif hasattr(event, 'data') and hasattr(event.data, 'content'):
-                                content = event.data.content
-                            elif hasattr(event, 'delta') and hasattr(event.delta, 'content'):
-                                content = event.delta.content
-                            elif hasattr(event, 'content'):
-                                content = event.content
-                                
-                        elif event_type == ChatEventType.CONVERSATION_MESSAGE_COMPLETED:
-                            # 消息完成事件 - 检查是否为follow_up类型
-                            if hasattr(event, 'message') and hasattr(event.message, 'type'):
-                                msg_type = getattr(event.message, 'type', None)
-                                if msg_type == 'follow_up' and hasattr(event.message, 'content'):
-                                    follow_up_content = event.message.content
-                                    follow_up_questions.append(follow_up_content)
-                                    logger.debug(f"[{request_id}] 收集到建议问题: {follow_up_content}")
-                            elif hasattr(event, 'data') and hasattr(event.data, 'type'):
-                                msg_type = getattr(event.data, 'type', None)
-                                if msg_type == 'follow_up' and hasattr(event.data, 'content'):
-                                    follow_up_content = event.data.content
-                                    follow_up_questions.append(follow_up_content)
-                                    logger.debug(f"[{request_id}] 收集到建议问题: {follow_up_content}")
-                            # 检查原始事件数据中的type字段
-                            elif hasattr(event, 'type') and event.type == 'follow_up':
-                                if hasattr(event, 'content'):
-                                    follow_up_content = event.content
-                                    follow_up_questions.append(follow_up_content)
-                                    logger.debug(f"[{request_id}] 收集到建议问题: {follow_up_content}")
-                                    
-                        elif event_type == ChatEventType.CONVERSATION_CHAT_COMPLETED:
-                            # 对话完成事件 - 提取使用统计
-                            is_complete = True
-                            stream_logger.log_event("complete")
-                            
-                            # 尝试从各种可能的属性中提取使用统计
-                            for attr_path in ['chat.usage', 'data.usage', 'usage']:
-                                parts = attr_path.split('.')
-                                obj = event
-                                found = True
-                                
-                                for part in parts:
-                                    if hasattr(obj, part):
-                                        obj = getattr(obj, part)
-                                    else:
-                                        found = False
-                                        break
-                                
-                                if found and obj:
-                                    usage_info = {
-                                        "token_count": getattr(obj, 'token_count', 0),
-                                        "input_count": getattr(obj, 'input_count', 0),
-                                        "output_count": getattr(obj, 'output_count', 0)
-                                    }
-                                    break
-                                    
-                    else:
-                        # 处理没有event字段的事件
-                        # 尝试直接访问内容属性
-                        for attr_name in ['content', 'message.content', 'delta.content']:
-                            parts = attr_name.split('.')
-                            obj = event
-                            found = True
-                            
-                            for part in parts:
-                                if hasattr(obj, part):
-                                    obj = getattr(obj, part)
-                                else:
-                                    found = False
-                                    break
-                            
-                            if found and isinstance(obj, str):
-                                content = obj
-                                break
+                    kind, value = decode_event(event)
+                    if kind == CONTENT:
+                        content = value
+                        if not first_token_seen:
+                            first_token_seen = True
+                            add_span("coze.first_token", upstream_start)
+                    elif kind == FOLLOW_UP:
+                        follow_up_questions.append(value)
+                        logger.debug("[{}] 收集到建议问题: {}", request_id, value)
+                    elif kind == COMPLETE:
+                        # 对话完成事件，附带使用统计
+                        is_complete = True
+                        usage_info = value
+                        add_span("coze.complete", upstream_start, events=event_count)
+                    # 每个上游事件只记录一次，按解码结果计数
+                    stream_logger.log_event(_EVENT_LABELS[kind], content=content)
                     
                     # 处理提取的内容
                     if content:
                         content_accumulator += content
-                        stream_logger.log_event("content", content=content)
                         
                         # 发送消息事件
                         yield StreamEvent(
@@ -330,6 +529,17 @@ class CozeService:
                     stream_logger.log_summary("完成(隐式)")
                     logger.info(f"[{request_id}] 流式聊天完成(隐式) - 对话: {conversation_id}, 共处理 {event_count} 个事件，总耗时: {elapsed:.2f}秒")
                 
+            except StreamIdleTimeout as idle_error:
+                metrics.upstream_timeouts.labels(metrics.doctor_label(request.doctor_type),
+                                                metrics.endpoint_var.get()).inc()
+                logger.warning(f"[{request_id}] 流式事件接收超时，已中止上游 - 对话: {conversation_id}, 已处理 {event_count} 个事件")
+                stream_logger.log_summary("超时", str(idle_error))
+                
+                yield StreamEvent(
+                    type=StreamEventType.ERROR,
+                    error=str(idle_error),
+                    done=True
+                )
             except Exception as stream_error:
                 elapsed = asyncio.get_event_loop().time() - start_time if 'start_time' in locals() else 0
                 logger.error(f"[{request_id}] 流式处理过程中发生错误 (耗时: {elapsed:.2f}秒): {stream_error}", exc_info=True)
@@ -352,71 +562,6 @@ class CozeService:
                 done=True
             )
     
-    async def chat_stream_without_references(self, request: ChatRequest) -> AsyncGenerator[StreamEvent, None]:
-        """
-        流式聊天，但不包含引用文献部分
-        
-        Args:
-            request: 聊天请求
-            
-        Yields:
-            StreamEvent: 流式事件
-        """
-        from ..utils.logger import get_request_id
-        request_id = get_request_id()
-        logger.info(f"[{request_id}] 开始无引用流式聊天")
-        
-        # 使用状态标志跟踪是否进入了引用部分
-        in_reference_section = False
-        references_content = ""
-        conversation_id = request.conversation_id or str(uuid4())
-        
-        # 获取原始的流式回复
-        async for event in self.chat_stream(request):
-            if event.type == StreamEventType.MESSAGE:
-                content = event.content
-                
-                # 检查是否遇到引用的开始标记
-                if not in_reference_section and re.search(r'\n\n\[\d+\]', content):
-                    # 找到引用的开始位置
-                    ref_start = content.find('\n\n[')
-                    if ref_start >= 0:
-                        # 分割当前块为引用前和引用部分
-                        before_ref = content[:ref_start]
-                        ref_part = content[ref_start:]
-                        
-                        # 将引用部分添加到引用累积器
-                        references_content += ref_part
-                        in_reference_section = True
-                        
-                        # 只发送引用前的部分
-                        if before_ref:
-                            yield StreamEvent(
-                                type=StreamEventType.MESSAGE,
-                                content=before_ref,
-                                done=False
-                            )
-                        continue  # 跳过原始事件的发送
-                elif in_reference_section:
-                    # 已经在引用部分，继续累积引用内容
-                    references_content += content
-                    continue  # 不发送给前端
-                else:
-                    # 正常的内容，直接发送
-                    yield event
-                    
-            elif event.type == StreamEventType.COMPLETE:
-                # 存储累积的引用内容
-                if references_content:
-                    self._references_cache[conversation_id] = references_content.strip()
-                    logger.info(f"[{request_id}] 缓存引用文本，长度:{len(references_content)}")
-                
-                # 发送完成事件
-                yield event
-            else:
-                # 其他事件类型直接传递
-                yield event
-    
     async def get_references(self, conversation_id: str) -> Dict[str, Any]:
         """
         获取特定对话的引用文献
@@ -428,7 +573,7 @@ class CozeService:
             引用文献内容
         """
         try:
-            references = self._references_cache.get(conversation_id, "")
+            references = await self._get_references_store().get(conversation_id) or ""
             
             return {
                 "conversation_id": conversation_id,
@@ -454,84 +599,42 @@ class CozeService:
         Returns:
             ChatResponse: 聊天响应
         """
+        request = self.bind_conversation(request)
+        conversation_id = request.conversation_id
+        logger.info(f"开始单次聊天 - 用户: {request.user_id}, 对话: {conversation_id}")
+        
+        # 在内部消费上游流，对话完成即返回，无需轮询状态和再拉取消息列表
+        parts: List[str] = []
+        usage_info = None
+        error = None
         try:
-            doctor_type = request.doctor_type
-            client = self._get_client(doctor_type)
-            config = self._get_config(doctor_type)
-            
-            logger.info(f"使用医生配置: {doctor_type or 'default'}")
-            
-            conversation_id = request.conversation_id or str(uuid4())
-            
-            # 构建消息
-            additional_messages = [Message.build_user_question_text(request.message)]
-            
-            logger.info(f"开始单次聊天 - 用户: {request.user_id}, 对话: {conversation_id}")
-            
-            # 调用Coze聊天API
-            chat_response = client.chat.create(
-                bot_id=config.bot_id,
-                user_id=request.user_id or config.default_user_id,
-                additional_messages=additional_messages,
-            )
-            
-            # 等待聊天完成
-            while hasattr(chat_response, 'status') and chat_response.status in ["in_progress", "created"]:
-                await asyncio.sleep(1)
-                chat_response = client.chat.retrieve(
-                    conversation_id=chat_response.conversation_id,
-                    chat_id=chat_response.id
-                )
-            
-            if hasattr(chat_response, 'status') and chat_response.status == "completed":
-                # 获取聊天消息
-                try:
-                    messages = client.chat.message.list(
-                        conversation_id=chat_response.conversation_id,
-                        chat_id=chat_response.id
-                    )
-                    
-                    # 提取助手回复
-                    content = ""
-                    for message in messages:
-                        if message.role == "assistant" and message.type == MessageContentType.TEXT:
-                            content += message.content
-                except Exception as e:
-                    logger.warning(f"获取消息列表失败: {e}")
-                    # 使用流式方式获取内容
-                    content = await self._get_content_from_stream(client, config, additional_messages, request.user_id)
-                
-                usage_info = None
-                if hasattr(chat_response, 'usage') and chat_response.usage:
-                    usage_info = {
-                        "token_count": getattr(chat_response.usage, 'token_count', 0),
-                        "input_count": getattr(chat_response.usage, 'input_count', 0),
-                        "output_count": getattr(chat_response.usage, 'output_count', 0)
-                    }
-                
-                logger.info(f"单次聊天完成 - 对话: {conversation_id}")
-                
-                return ChatResponse(
-                    content=content,
-                    conversation_id=conversation_id,
-                    user_id=request.user_id,
-                    usage=usage_info
-                )
-            else:
-                # 使用流式方式作为后备
-                content = await self._get_content_from_stream(client, config, additional_messages, request.user_id)
-                return ChatResponse(
-                    content=content,
-                    conversation_id=conversation_id,
-                    user_id=request.user_id
-                )
-                
+            # 完成和错误事件都是流的最后一个事件
+            async for event in self.chat_stream(request, paced=False):
+                if event.type == StreamEventType.MESSAGE:
+                    parts.append(event.content)
+                elif event.type == StreamEventType.COMPLETE:
+                    usage_info = event.usage
+                elif event.type == StreamEventType.ERROR:
+                    error = event.error
         except Exception as e:
-            logger.error(f"单次聊天错误: {e}")
+            error = str(e)
+        
+        if error:
+            logger.error(f"单次聊天错误: {error}")
             return ChatResponse(
-                content="",
-                error=str(e)
+                content="".join(parts),
+                conversation_id=conversation_id,
+                user_id=request.user_id,
+                error=error
             )
+        
+        logger.info(f"单次聊天完成 - 对话: {conversation_id}")
+        return ChatResponse(
+            content="".join(parts),
+            conversation_id=conversation_id,
+            user_id=request.user_id,
+            usage=usage_info
+        )
     
     async def chat_single_without_references(self, request: ChatRequest) -> ChatResponse:
         """
@@ -552,7 +655,7 @@ class CozeService:
             # 缓存引用文本
             conversation_id = response.conversation_id
             if conversation_id:
-                self._references_cache[conversation_id] = references
+                await self._save_references(conversation_id, references)
             
             # 更新响应内容，只包含主体部分
             response.content = main_content
@@ -573,7 +676,7 @@ class CozeService:
             client = self._get_client(doctor_type)
             config = self._get_config(doctor_type)
             
-            bot_info = client.bot.retrieve(bot_id=config.bot_id)
+            bot_info = await client.bots.retrieve(bot_id=config.bot_id)
             
             # 提取关键信息
             result = {
@@ -591,31 +694,148 @@ class CozeService:
                 "error": str(e)
             }
     
-    async def _get_content_from_stream(self, client, config, additional_messages, user_id):
-        """获取流式内容作为后备方案"""
-        try:
-            stream_response = client.chat.stream(
-                bot_id=config.bot_id,
-                user_id=user_id or config.default_user_id,
-                additional_messages=additional_messages,
-            )
+    async def _warm_up_doctor(self, doctor_type: Optional[str], connections: int, timeout: float) -> Dict[str, Any]:
+        """
+        预热单个医生的客户端和上游连接
+        
+        Args:
+            doctor_type: 医生类型
+            connections: 预先建立的连接数
+            timeout: 建立连接超时时间(秒)
             
-            content = ""
-            for event in stream_response:
-                if hasattr(event, 'message') and hasattr(event.message, 'content'):
-                    content += event.message.content
-                elif hasattr(event, 'content'):
-                    content += event.content
-            return content
+        Returns:
+            预热耗时信息
+        """
+        start = time.perf_counter()
+        result: Dict[str, Any] = {"success": True}
+        try:
+            self._get_client(doctor_type)
+            config = self._get_config(doctor_type)
+            result["client_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            
+            # 并行发起轻量请求，让共享连接池提前完成DNS解析和TLS握手
+            http_client = self._http_clients.get(doctor_type)
+            if http_client is not None and connections > 0:
+                connect_start = time.perf_counter()
+                await asyncio.wait_for(
+                    asyncio.gather(*(http_client.head(config.base_url) for _ in range(connections))),
+                    timeout=timeout
+                )
+                result["connect_ms"] = round((time.perf_counter() - connect_start) * 1000, 2)
         except Exception as e:
-            logger.error(f"流式获取内容错误: {e}")
-            return "无法获取回复内容，请重试。"
+            result["success"] = False
+            result["error"] = str(e) or type(e).__name__
+            logger.warning(f"医生 {doctor_type or 'default'} 预热失败: {result['error']}")
+        
+        result["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return result
+    
+    async def warm_up(self, connections: int = 1, timeout: float = 10.0) -> Dict[str, Any]:
+        """
+        并行预热所有已配置医生的客户端和上游连接
+        
+        Args:
+            connections: 每个医生预先建立的连接数
+            timeout: 建立连接超时时间(秒)
+            
+        Returns:
+            预热结果，包含每个医生的耗时
+        """
+        doctor_types = config_service.get_config().coze.doctor_types()
+        self._warmup_status = {"ready": False, "state": "running", "doctors": {}}
+        start = time.perf_counter()
+        
+        results = await asyncio.gather(
+            *(self._warm_up_doctor(doctor_type, connections, timeout) for doctor_type in doctor_types)
+        )
+        
+        self._warmup_status = {
+            "ready": True,
+            "state": "completed",
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+            "doctors": {(doctor_type or "default"): result for doctor_type, result in zip(doctor_types, results)},
+        }
+        for name, result in self._warmup_status["doctors"].items():
+            logger.info(f"医生 {name} 预热{'完成' if result['success'] else '失败'}: {result}")
+        return self._warmup_status
+    
+    def get_warmup_status(self) -> Dict[str, Any]:
+        """
+        获取预热状态
+        
+        Returns:
+            预热状态，ready为False表示预热尚未完成
+        """
+        return self._warmup_status
+    
+    def get_breaker_stats(self) -> Dict[str, Any]:
+        """
+        获取各机器人的熔断器状态
+        
+        Returns:
+            以bot_id为键的熔断器统计
+        """
+        return {bot_id: breaker.get_stats() for bot_id, breaker in self._breakers.items()}
+    
+    async def get_references_stats(self) -> Dict[str, Any]:
+        """
+        获取引用文本存储统计
+        
+        Returns:
+            条目数、字节数及命中、过期、淘汰计数
+        """
+        return await self._get_references_store().get_stats()
+    
+    def get_answer_cache_stats(self) -> Dict[str, Any]:
+        """
+        获取回答缓存统计
+        
+        Returns:
+            条目数、字节数及命中、淘汰计数
+        """
+        return self._get_answer_cache().get_stats()
+    
+    def get_single_flight_stats(self) -> Dict[str, Any]:
+        """
+        获取相同请求合并统计
+        
+        Returns:
+            进行中的上游流数、订阅者数及累计共用次数
+        """
+        return self._single_flight.get_stats()
     
     def reload_client(self) -> None:
         """重新加载客户端"""
         self._coze_clients = {}
+        self._http_clients = {}
         self._configs = {}
+        self._breakers = {}
+        if self._answer_cache is not None:
+            # 机器人或提示词可能已变化，缓存的回答不再可信
+            self._answer_cache.invalidate(config_service.get_config().answer_cache)
         logger.info("Coze客户端已重置")
+    
+    async def reload_references_store(self) -> None:
+        """按新配置更新引用文本存储，后端类型或地址变化时重建"""
+        store = self._references_store
+        if store is None:
+            return
+        config = config_service.get_config().references
+        if store.name == config.backend and store.config.sqlite_path == config.sqlite_path \
+                and store.config.redis_url == config.redis_url:
+            store.configure(config)
+            return
+        self._references_store = create_references_backend(config)
+        await store.aclose()
+        logger.info(f"引用文本存储已切换为 {config.backend}")
+    
+    async def aclose(self) -> None:
+        """等待进行中的取消对话请求并关闭引用文本存储"""
+        if self._cancel_tasks:
+            await asyncio.gather(*self._cancel_tasks, return_exceptions=True)
+        if self._references_store is not None:
+            await self._references_store.aclose()
+            self._references_store = None
 
 
 # 全局服务实例
@@ -0,0 +1,149 @@
+"""
+Coze流式事件解码器
+
+按ChatEventType查表分发。每种事件的内容、建议问题和使用统计访问路径只在首次遇到时
+探测一次，随后把已解析的访问器直接装入分发表，避免在逐token的热循环中重复hasattr探测
+和属性路径字符串切分；事件结构变化导致访问器失效时自动重新探测。
+"""
+
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cozepy import ChatEventType
+
+# 解码结果类型
+IGNORED = 0
+CONTENT = 1
+FOLLOW_UP = 2
+COMPLETE = 3
+
+DecodeResult = Tuple[int, Any]
+Handler = Callable[[Any], DecodeResult]
+
+IGNORED_RESULT: DecodeResult = (IGNORED, None)
+
+
+def _compile(*paths) -> List[Callable[[Any], Any]]:
+    return [attrgetter(*path) if isinstance(path, tuple) else attrgetter(path) for path in paths]
+
+
+# 各字段的候选访问器，按优先级排列，模块加载时编译一次
+DELTA_CONTENT_GETTERS = _compile("message.content", "data.content", "delta.content", "content")
+FOLLOW_UP_GETTERS = _compile(("message.type", "message.content"), ("data.type", "data.content"), ("type", "content"))
+USAGE_GETTERS = _compile("chat.usage", "data.usage", "usage")
+UNTYPED_CONTENT_GETTERS = _compile("content", "message.content", "delta.content")
+
+
+def _usage_to_dict(usage: Any) -> Dict[str, Any]:
+    return {
+        "token_count": getattr(usage, 'token_count', 0),
+        "input_count": getattr(usage, 'input_count', 0),
+        "output_count": getattr(usage, 'output_count', 0)
+    }
+
+
+def _resolve(event: Any, getters, accept: Callable[[Any], bool]) -> Tuple[Optional[Callable[[Any], Any]], Any]:
+    """
+    依次尝试候选访问器
+
+    Returns:
+        (第一个可用的访问器, 取到的值)，均不可用时返回(None, None)
+    """
+    for getter in getters:
+        try:
+            value = getter(event)
+        except AttributeError:
+            continue
+        if accept(value):
+            return getter, value
+    return None, None
+
+
+def _accept_any(value: Any) -> bool:
+    return True
+
+
+class ChatEventDecoder:
+    """按事件类型查表的流式事件解码器"""
+
+    def __init__(self):
+        """初始化解码器，分发表中先放入探测函数，首次解码后替换为直接访问器"""
+        self._resolvers: Dict[Any, Handler] = {
+            ChatEventType.CONVERSATION_MESSAGE_DELTA: self._resolve_delta,
+            ChatEventType.CONVERSATION_MESSAGE_COMPLETED: self._resolve_message_completed,
+            ChatEventType.CONVERSATION_CHAT_COMPLETED: self._resolve_chat_completed,
+        }
+        self._handlers: Dict[Any, Handler] = dict(self._resolvers)
+
+    def _resolve_delta(self, event: Any) -> DecodeResult:
+        getter, content = _resolve(event, DELTA_CONTENT_GETTERS, _accept_any)
+        if getter is not None:
+            def handler(event: Any) -> DecodeResult:
+                content = getter(event)
+                return (CONTENT, content) if content else IGNORED_RESULT
+
+            self._handlers[ChatEventType.CONVERSATION_MESSAGE_DELTA] = handler
+        return (CONTENT, content) if content else IGNORED_RESULT
+
+    def _resolve_message_completed(self, event: Any) -> DecodeResult:
+        getter, value = _resolve(event, FOLLOW_UP_GETTERS, _accept_any)
+        if getter is None:
+            return IGNORED_RESULT
+
+        def handler(event: Any) -> DecodeResult:
+            message_type, content = getter(event)
+            return (FOLLOW_UP, content) if message_type == 'follow_up' else IGNORED_RESULT
+
+        self._handlers[ChatEventType.CONVERSATION_MESSAGE_COMPLETED] = handler
+        return handler(event)
+
+    def _resolve_chat_completed(self, event: Any) -> DecodeResult:
+        getter, usage = _resolve(event, USAGE_GETTERS, bool)
+        if getter is not None:
+            def handler(event: Any) -> DecodeResult:
+                usage = getter(event)
+                if usage:
+                    return COMPLETE, _usage_to_dict(usage)
+                return self._resolve_chat_completed(event)
+
+            self._handlers[ChatEventType.CONVERSATION_CHAT_COMPLETED] = handler
+            return COMPLETE, _usage_to_dict(usage)
+        return COMPLETE, None
+
+    def _decode_untyped(self, event: Any) -> DecodeResult:
+        _, content = _resolve(event, UNTYPED_CONTENT_GETTERS, lambda value: isinstance(value, str))
+        return (CONTENT, content) if content else IGNORED_RESULT
+
+    def decode(self, event: Any) -> DecodeResult:
+        """
+        解码单个上游事件
+
+        Args:
+            event: 上游事件
+
+        Returns:
+            (结果类型, 值): CONTENT对应增量文本，FOLLOW_UP对应建议问题，
+            COMPLETE对应使用统计(可能为None)，IGNORED表示无需处理
+        """
+        try:
+            event_type = event.event
+        except AttributeError:
+            return self._decode_untyped(event)
+
+        handler = self._handlers.get(event_type)
+        if handler is None:
+            return IGNORED_RESULT
+        try:
+            return handler(event)
+        except AttributeError:
+            # 事件结构与已解析的访问路径不符，重新探测
+            return self._resolvers[event_type](event)
+
+    def decode_all(self, events: List[Any]) -> List[DecodeResult]:
+        """批量解码，主要用于测试和基准对比"""
+        decode = self.decode
+        return [decode(event) for event in events]
+
+
+# 全局解码器实例
+chat_event_decoder = ChatEventDecoder()
@@ -0,0 +1,216 @@
+"""
+共享HTTP连接池服务
+
+所有医生的Coze客户端共用同一个httpx传输层(连接池)，统一控制连接数、keep-alive
+和超时，避免每个客户端各自建立TCP/TLS连接。
+"""
+
+import importlib.util
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from cozepy import AsyncHTTPClient
+
+from ..models.config import CozeConfig, HttpPoolConfig
+from ..services.config_service import config_service
+from ..utils.logger import get_logger
+from ..utils.tracing import SPAN_KIND_CLIENT, add_span
+
+logger = get_logger("http_pool_service")
+
+
+def http2_available() -> bool:
+    """是否安装了HTTP/2支持(h2)"""
+    return importlib.util.find_spec("h2") is not None
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """响应体包装，关闭时通知传输层该请求已结束"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, transport: "PooledTransport"):
+        self._stream = stream
+        self._transport = transport
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                await self._transport._release()
+
+
+class PooledTransport(httpx.AsyncHTTPTransport):
+    """带统计信息的共享传输层"""
+
+    def __init__(self, pool_config: HttpPoolConfig):
+        self.pool_config = pool_config
+        self.http2 = pool_config.http2 and http2_available()
+        super().__init__(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=pool_config.max_connections,
+                max_keepalive_connections=pool_config.max_keepalive_connections,
+                keepalive_expiry=pool_config.keepalive_expiry,
+            ),
+        )
+        self.requests_total = 0
+        self.requests_failed = 0
+        self.connections_opened = 0
+        self.in_flight = 0  # 响应体尚未关闭的请求数
+        self.retired = False
+        self.closed = False
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests_total += 1
+        self.in_flight += 1
+        self._count_connections(request)
+        start = time.perf_counter()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            self.requests_failed += 1
+            await self._release()
+            raise
+        response.stream = _TrackedStream(response.stream, self)
+        # 建立(或复用)连接、发送请求到收到响应头的耗时
+        add_span("coze.connect", start, kind=SPAN_KIND_CLIENT, **{
+            "http.method": request.method, "http.url": str(request.url.copy_with(query=None)),
+            "http.status_code": response.status_code, "http.flavor": response.extensions.get("http_version", b"").decode(),
+        })
+        return response
+
+    async def _release(self) -> None:
+        self.in_flight -= 1
+        if self.retired and self.in_flight == 0:
+            # 已退役的连接池在最后一个流结束后关闭
+            await self.aclose()
+
+    async def retire(self) -> None:
+        """停止使用该连接池，没有进行中的请求时立即关闭，否则在最后一个流结束后关闭"""
+        self.retired = True
+        if self.in_flight == 0:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        if not self.closed:
+            self.closed = True
+            await super().aclose()
+
+    def _count_connections(self, request: httpx.Request) -> None:
+        """
+        通过httpx公开的trace扩展记录新建立的连接数，用于观察连接复用率
+
+        只依赖公开接口，不读取httpcore连接池的内部状态；请求已带有trace回调时一并调用。
+        """
+        trace = request.extensions.get("trace")
+
+        async def count(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                self.connections_opened += 1
+            if trace is not None:
+                await trace(event_name, info)
+
+        request.extensions["trace"] = count
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池统计"""
+        return {
+            "http2": self.http2,
+            "max_connections": self.pool_config.max_connections,
+            "max_keepalive_connections": self.pool_config.max_keepalive_connections,
+            "keepalive_expiry": self.pool_config.keepalive_expiry,
+            "in_flight": self.in_flight,
+            "requests_total": self.requests_total,
+            "requests_failed": self.requests_failed,
+            "connections_opened": self.connections_opened,
+            "connection_reuse_ratio": round(1 - self.connections_opened / self.requests_total, 3)
+            if self.requests_total else 0.0,
+        }
+
+
+class HttpPoolService:
+    """共享HTTP连接池"""
+
+    def __init__(self):
+        """初始化连接池服务"""
+        self._transport: Optional[PooledTransport] = None
+        self._retired: List[PooledTransport] = []
+
+    def _get_pool_config(self) -> HttpPoolConfig:
+        return config_service.get_config().http_pool
+
+    def get_transport(self) -> PooledTransport:
+        """
+        获取共享传输层
+
+        Returns:
+            PooledTransport: 共享传输层
+        """
+        if self._transport is None:
+            pool_config = self._get_pool_config()
+            self._transport = PooledTransport(pool_config)
+            logger.info(
+                f"共享连接池初始化完成 - 最大连接数: {pool_config.max_connections}, "
+                f"keep-alive连接数: {pool_config.max_keepalive_connections}, HTTP/2: {self._transport.http2}"
+            )
+        return self._transport
+
+    def create_client(self, config: CozeConfig) -> AsyncHTTPClient:
+        """
+        为医生配置创建使用共享连接池的HTTP客户端
+
+        Args:
+            config: Coze配置
+
+        Returns:
+            AsyncHTTPClient: 共享连接池的HTTP客户端，超时取自配置
+        """
+        pool_config = self._get_pool_config()
+        return AsyncHTTPClient(
+            transport=self.get_transport(),
+            timeout=httpx.Timeout(config.timeout, connect=pool_config.connect_timeout),
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取连接池统计
+
+        Returns:
+            连接池统计信息
+        """
+        self._retired = [transport for transport in self._retired if not transport.closed]
+        retired = {"retired_pools": len(self._retired),
+                   "retired_in_flight": sum(transport.in_flight for transport in self._retired)}
+        if self._transport is None:
+            return {"initialized": False, **retired}
+        return {"initialized": True, **self._transport.get_stats(), **retired}
+
+    async def reload(self) -> None:
+        """连接池配置变化时切换到新的传输层，旧传输层在其上的流全部结束后关闭"""
+        if self._transport is not None and self._transport.pool_config != self._get_pool_config():
+            transport = self._transport
+            self._transport = None
+            await transport.retire()
+            self._retired = [retired for retired in self._retired if not retired.closed]
+            if not transport.closed:
+                self._retired.append(transport)
+            logger.info(f"连接池配置已变更，将使用新的连接池，旧连接池进行中的请求: {transport.in_flight}")
+
+    async def aclose(self) -> None:
+        """关闭所有连接"""
+        for transport in self._retired + ([self._transport] if self._transport else []):
+            await transport.aclose()
+        self._transport = None
+        self._retired = []
+        logger.info("共享连接池已关闭")
+
+
+# 全局服务实例
+http_pool_service = HttpPoolService()
@@ -0,0 +1,197 @@
+"""
+Prometheus指标
+
+进程内的计数器、仪表和直方图，按doctor_type和endpoint标签区分。所有更新都在事件循环线程中进行，
+只是整数和浮点数的加法，不加锁；直方图按固定分桶计数，导出时再累加为Prometheus的累计桶。
+流在开始时取得自己标签对应的子指标并缓存，逐token更新时不再查找标签。
+"""
+
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ..services.config_service import config_service
+
+# 当前请求的接口路径，由聊天路由的依赖设置，服务层的上游指标据此打标签
+endpoint_var: ContextVar[str] = ContextVar("metrics_endpoint", default="-")
+
+LABEL_NAMES = ("doctor_type", "endpoint")
+
+
+def doctor_label(doctor_type: Optional[str]) -> str:
+    """
+    客户端传入的医生类型对应的标签值
+
+    未配置的类型归入default，客户端无法借此制造任意多的标签组合。
+    """
+    return config_service.resolve_doctor_type(doctor_type) or "default"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # 最后一个桶为超过最大上界的观测值
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric:
+    """带标签的指标"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = LABEL_NAMES):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values: str):
+        """获取标签对应的子指标，可缓存后重复使用"""
+        key = tuple(value or "default" for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: Tuple[str, ...], child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, values)} {_format_value(child.value)}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type_name = "counter"
+
+
+class Gauge(_Metric):
+    """可增可减的当前值"""
+
+    type_name = "gauge"
+
+
+class Histogram(_Metric):
+    """固定分桶的直方图"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float],
+                 label_names: Sequence[str] = LABEL_NAMES):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, values: Tuple[str, ...], child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = f'le="{_format_value(float(bound))}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, values, le)} {cumulative}")
+        labels = _format_labels(self.label_names, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表，按Prometheus文本格式导出"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """导出为Prometheus文本格式(0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局注册表和聊天流指标
+registry = MetricsRegistry()
+
+time_to_first_token = registry.register(Histogram(
+    "chat_time_to_first_token_seconds", "收到请求到发出第一个消息帧的时间",
+    (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60),
+))
+inter_token_gap = registry.register(Histogram(
+    "chat_inter_token_gap_seconds", "相邻消息帧之间的间隔",
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+))
+stream_duration = registry.register(Histogram(
+    "chat_stream_duration_seconds", "流从收到请求到结束的总时间",
+    (1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300),
+))
+stream_frames = registry.register(Histogram(
+    "chat_stream_frames", "每个流发出的消息和事件帧数",
+    (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+))
+active_streams = registry.register(Gauge(
+    "chat_active_streams", "正在进行的流数",
+))
+upstream_errors = registry.register(Counter(
+    "chat_upstream_errors_total", "上游请求最终失败的次数(重试用尽或不可重试)",
+))
+upstream_retries = registry.register(Counter(
+    "chat_upstream_retries_total", "上游请求的重试次数",
+))
+upstream_timeouts = registry.register(Counter(
+    "chat_upstream_timeouts_total", "上游在事件间隔超时内没有发出事件而被中止的次数",
+))
@@ -0,0 +1,121 @@
+"""
+流式引用段落分离器
+
+在流式输出中识别引用段落的起始标记(形如"\\n\\n[1]")，标记之前的内容正常输出，标记及之后的内容
+收集为引用文本。标记可能被拆分到多个增量中，因此跨增量保留一小段可能构成标记前缀的文本，
+确认不是标记后再输出。每个字符至多处理两次，整体为O(总长度)。
+"""
+
+from typing import List
+
+# 状态: 已暂存的文本是标记的哪一段前缀
+_NONE = 0        # 无暂存
+_NEWLINE = 1     # "\n"
+_TWO_NEWLINES = 2  # "\n\n"
+_BRACKET = 3     # "\n\n["
+_DIGITS = 4      # "\n\n[" + 至少一位数字
+
+
+class ReferenceSplitter:
+    """引用段落起始标记的增量识别状态机"""
+
+    def __init__(self):
+        """初始化分离器"""
+        self._state = _NONE
+        self._held: List[str] = []
+        self._references: List[str] = []
+        self.in_references = False
+
+    @property
+    def references(self) -> str:
+        """已收集的引用文本(含起始标记)"""
+        return "".join(self._references)
+
+    def feed(self, chunk: str) -> str:
+        """
+        输入一段增量文本
+
+        Args:
+            chunk: 增量文本
+
+        Returns:
+            可以立即输出的正文部分，可能为空字符串
+        """
+        if self.in_references:
+            self._references.append(chunk)
+            return ""
+
+        output: List[str] = []
+        held = self._held
+        state = self._state
+        length = len(chunk)
+        i = 0
+
+        while i < length:
+            if state == _NONE:
+                # 快速跳到下一个换行符，其间的文本直接输出
+                newline = chunk.find("\n", i)
+                if newline < 0:
+                    output.append(chunk[i:])
+                    break
+                if newline > i:
+                    output.append(chunk[i:newline])
+                held.append("\n")
+                state = _NEWLINE
+                i = newline + 1
+                continue
+
+            char = chunk[i]
+            if state == _NEWLINE:
+                if char == "\n":
+                    held.append(char)
+                    state = _TWO_NEWLINES
+                    i += 1
+                    continue
+            elif state == _TWO_NEWLINES:
+                if char == "[":
+                    held.append(char)
+                    state = _BRACKET
+                    i += 1
+                    continue
+                if char == "\n":
+                    # "\n\n\n": 最早的换行不可能再是标记的一部分
+                    output.append("\n")
+                    i += 1
+                    continue
+            elif char.isdigit() and char.isascii():
+                held.append(char)
+                state = _DIGITS
+                i += 1
+                continue
+            elif state == _DIGITS and char == "]":
+                # 识别到完整标记，之后的内容全部归入引用
+                held.append(char)
+                self._references.append("".join(held))
+                self._references.append(chunk[i + 1:])
+                held.clear()
+                self._state = _NONE
+                self.in_references = True
+                return "".join(output)
+
+            # 暂存内容不构成标记，输出后从初始状态重新处理当前字符
+            output.append("".join(held))
+            held.clear()
+            state = _NONE
+
+        self._state = state
+        return "".join(output)
+
+    def flush(self) -> str:
+        """
+        流结束时取出仍暂存的正文
+
+        Returns:
+            暂存的正文，未进入引用段落时才可能非空
+        """
+        if self.in_references or not self._held:
+            return ""
+        remaining = "".join(self._held)
+        self._held.clear()
+        self._state = _NONE
+        return remaining
@@ -0,0 +1,318 @@
+"""
+对话引用文本存储
+
+以conversation_id为键保存无引用接口剥离出的引用文本。条目按写入时间过期，
+超出条目数或总字节数上限时淘汰最久未访问的条目，内存占用有确定上限。
+
+存储后端可配置: memory为进程内存，只适用于单worker；sqlite供同一台机器上的多个worker共用；
+redis供多台机器共用，任何worker都能返回其他worker缓存的引用。
+"""
+
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from ..models.config import ReferencesConfig
+from ..utils.resp_client import RespClient
+from ..utils.ttl_store import TTLStore
+
+
+class ReferencesStore(TTLStore):
+    """以conversation_id为键的进程内引用文本存储"""
+
+    @classmethod
+    def from_config(cls, config: ReferencesConfig) -> "ReferencesStore":
+        """根据配置创建存储"""
+        return cls(ttl_seconds=config.ttl_seconds, max_entries=config.max_entries, max_bytes=config.max_bytes)
+
+    def configure(self, config: ReferencesConfig) -> None:
+        """应用新的配置，保留现有条目并按新上限淘汰"""
+        self.ttl_seconds = config.ttl_seconds
+        self.max_entries = config.max_entries
+        self.max_bytes = config.max_bytes
+        self._evict()
+
+
+class ReferencesBackend(ABC):
+    """引用文本存储后端接口"""
+
+    name = "base"
+
+    def __init__(self, config: ReferencesConfig):
+        self.config = config
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @abstractmethod
+    async def get(self, conversation_id: str) -> Optional[str]:
+        """读取引用文本，不存在或已过期时返回None"""
+
+    @abstractmethod
+    async def set(self, conversation_id: str, references: str) -> bool:
+        """保存引用文本，返回是否保存成功"""
+
+    @abstractmethod
+    async def delete(self, conversation_id: str) -> None:
+        """删除引用文本"""
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """获取存储统计，计数器为当前进程的值"""
+        return {"backend": self.name, "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+    def configure(self, config: ReferencesConfig) -> None:
+        """应用同一后端的新配置"""
+        self.config = config
+
+    async def aclose(self) -> None:
+        """释放后端资源"""
+
+    def _record_lookup(self, references: Optional[str]) -> Optional[str]:
+        if references is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return references
+
+
+class MemoryReferencesBackend(ReferencesBackend):
+    """进程内存后端，仅适用于单worker部署"""
+
+    name = "memory"
+
+    def __init__(self, config: ReferencesConfig):
+        super().__init__(config)
+        self.store = ReferencesStore.from_config(config)
+
+    async def get(self, conversation_id: str) -> Optional[str]:
+        return self.store.get(conversation_id)
+
+    async def set(self, conversation_id: str, references: str) -> bool:
+        return self.store.set(conversation_id, references)
+
+    async def delete(self, conversation_id: str) -> None:
+        self.store.delete(conversation_id)
+
+    async def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, **self.store.get_stats()}
+
+    def configure(self, config: ReferencesConfig) -> None:
+        super().configure(config)
+        self.store.configure(config)
+
+
+class SQLiteReferencesBackend(ReferencesBackend):
+    """
+    SQLite文件后端
+
+    同一台机器上的多个worker共用一个数据库文件(WAL模式)。过期时间使用墙上时钟，
+    各进程一致；写入时顺带清理过期条目，并按最近访问时间淘汰超出上限的条目。
+    """
+
+    name = "sqlite"
+
+    def __init__(self, config: ReferencesConfig, clock: Callable[[], float] = time.time):
+        super().__init__(config)
+        self._clock = clock
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(config.sqlite_path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(config.sqlite_path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_references ("
+            " conversation_id TEXT PRIMARY KEY,"
+            " content TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_references_accessed ON conversation_references (accessed_at)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_references_expires ON conversation_references (expires_at)"
+        )
+        self.expirations = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        # sqlite调用会短暂阻塞，放到线程中执行，避免占用事件循环
+        return await asyncio.to_thread(self._locked, func, *args)
+
+    def _locked(self, func: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            return func(*args)
+
+    def _get(self, conversation_id: str) -> Optional[str]:
+        now = self._clock()
+        row = self._conn.execute(
+            "SELECT content, expires_at FROM conversation_references WHERE conversation_id = ?",
+            (conversation_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        content, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            return None
+        self._conn.execute(
+            "UPDATE conversation_references SET accessed_at = ? WHERE conversation_id = ?",
+            (now, conversation_id),
+        )
+        return content
+
+    def _set(self, conversation_id: str, references: str) -> bool:
+        config = self.config
+        size = TTLStore._entry_size(conversation_id, references)
+        if config.max_bytes and size > config.max_bytes:
+            self.rejected += 1
+            return False
+
+        now = self._clock()
+        expires_at = now + config.ttl_seconds if config.ttl_seconds > 0 else None
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversation_references"
+                " (conversation_id, content, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, references, size, expires_at, now),
+            )
+            self.expirations += self._conn.execute(
+                "DELETE FROM conversation_references WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            ).rowcount
+            if config.max_entries:
+                self.evictions += self._conn.execute(
+                    "DELETE FROM conversation_references WHERE conversation_id IN ("
+                    " SELECT conversation_id FROM conversation_references"
+                    " ORDER BY accessed_at DESC, rowid DESC LIMIT -1 OFFSET ?)",
+                    (config.max_entries,),
+                ).rowcount
+            if config.max_bytes:
+                self.evictions += self._conn.execute(
+                    "DELETE FROM conversation_references WHERE conversation_id IN ("
+                    " SELECT conversation_id FROM ("
+                    "  SELECT conversation_id, SUM(size) OVER (ORDER BY accessed_at DESC, rowid DESC) AS running"
+                    "  FROM conversation_references) WHERE running > ?)",
+                    (config.max_bytes,),
+                ).rowcount
+        return True
+
+    def _delete(self, conversation_id: str) -> None:
+        self._conn.execute("DELETE FROM conversation_references WHERE conversation_id = ?", (conversation_id,))
+
+    def _totals(self) -> Tuple[int, int]:
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM conversation_references"
+            " WHERE expires_at IS NULL OR expires_at > ?",
+            (self._clock(),),
+        ).fetchone()
+        return count, total
+
+    async def get(self, conversation_id: str) -> Optional[str]:
+        return self._record_lookup(await self._run(self._get, conversation_id))
+
+    async def set(self, conversation_id: str, references: str) -> bool:
+        return await self._run(self._set, conversation_id, references)
+
+    async def delete(self, conversation_id: str) -> None:
+        await self._run(self._delete, conversation_id)
+
+    async def get_stats(self) -> Dict[str, Any]:
+        entries, total_bytes = await self._run(self._totals)
+        stats = await super().get_stats()
+        stats.update({
+            "path": self.config.sqlite_path,
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_entries": self.config.max_entries,
+            "max_bytes": self.config.max_bytes,
+            "ttl_seconds": self.config.ttl_seconds,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+        })
+        return stats
+
+    async def aclose(self) -> None:
+        await self._run(self._conn.close)
+
+
+class RedisReferencesBackend(ReferencesBackend):
+    """
+    Redis协议后端
+
+    多台机器上的worker共用。过期由服务端的EX参数保证；总量上限交给服务端的
+    maxmemory和淘汰策略(建议allkeys-lru)，这里只拒绝超过max_bytes的单条引用。
+    """
+
+    name = "redis"
+
+    def __init__(self, config: ReferencesConfig):
+        super().__init__(config)
+        self.client = RespClient(config.redis_url, timeout=config.redis_timeout)
+        self.rejected = 0
+
+    def _key(self, conversation_id: str) -> str:
+        return f"{self.config.key_prefix}{conversation_id}"
+
+    async def get(self, conversation_id: str) -> Optional[str]:
+        value = await self.client.execute("GET", self._key(conversation_id))
+        return self._record_lookup(value.decode("utf-8") if value is not None else None)
+
+    async def set(self, conversation_id: str, references: str) -> bool:
+        size = TTLStore._entry_size(conversation_id, references)
+        if self.config.max_bytes and size > self.config.max_bytes:
+            self.rejected += 1
+            return False
+        args = ["SET", self._key(conversation_id), references]
+        if self.config.ttl_seconds > 0:
+            args += ["EX", max(1, math.ceil(self.config.ttl_seconds))]
+        await self.client.execute(*args)
+        return True
+
+    async def delete(self, conversation_id: str) -> None:
+        await self.client.execute("DEL", self._key(conversation_id))
+
+    async def get_stats(self) -> Dict[str, Any]:
+        stats = await super().get_stats()
+        stats.update({
+            "url": f"redis://{self.client.host}:{self.client.port}",
+            "key_prefix": self.config.key_prefix,
+            "ttl_seconds": self.config.ttl_seconds,
+            "rejected": self.rejected,
+        })
+        return stats
+
+    def configure(self, config: ReferencesConfig) -> None:
+        super().configure(config)
+        self.client.timeout = config.redis_timeout
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+REFERENCES_BACKENDS = {
+    MemoryReferencesBackend.name: MemoryReferencesBackend,
+    SQLiteReferencesBackend.name: SQLiteReferencesBackend,
+    RedisReferencesBackend.name: RedisReferencesBackend,
+}
+
+
+def create_references_backend(config: ReferencesConfig) -> ReferencesBackend:
+    """
+    根据配置创建引用文本存储后端
+
+    Raises:
+        ValueError: 未知的后端类型
+    """
+    backend_class = REFERENCES_BACKENDS.get(config.backend)
+    if backend_class is None:
+        raise ValueError(f"未知的引用存储后端: {config.backend}，可选: {', '.join(REFERENCES_BACKENDS)}")
+    return backend_class(config)
@@ -0,0 +1,190 @@
+"""
+相同请求的上游流合并(single-flight)
+
+同一时刻发出的相同请求只打开一个上游流，由广播器把事件分发给所有订阅者。
+广播器保留已产出的事件，每个订阅者维护自己的读取位置，后加入的订阅者先收到
+已产出的前缀，再与其他订阅者同步接收后续事件。所有订阅者都离开后取消上游流。
+广播器也用于可续传的SSE流(见stream_resume)，此时只保留最近的事件，并在订阅者断开后
+保留一段宽限期等待重连。
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Deque, Dict, List, Optional
+
+
+class StreamBroadcaster:
+    """把一个异步迭代器的事件分发给多个订阅者"""
+
+    def __init__(self, source: AsyncIterator[Any], on_finish: Optional[Callable[[], None]] = None,
+                 max_events: int = 0, idle_grace: float = 0.0):
+        """
+        Args:
+            source: 上游异步迭代器
+            on_finish: 上游结束后的回调
+            max_events: 最多保留的事件数，超出后丢弃最早的事件，0表示全部保留
+            idle_grace: 没有订阅者后继续读取上游的时间(秒)，期间有新订阅者加入则不取消
+        """
+        self._source = source
+        self._on_finish = on_finish
+        self._events: Deque[Any] = deque(maxlen=max_events or None)
+        self._waiters: List[asyncio.Future] = []
+        self._error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+        self._idle_grace = idle_grace
+        self._idle_handle: Optional[asyncio.TimerHandle] = None
+        self.done = False
+        self.subscribers = 0
+        # 已丢弃的事件数，即保留的第一个事件的序号
+        self.offset = 0
+
+    @property
+    def produced(self) -> int:
+        """已产出的事件总数"""
+        return self.offset + len(self._events)
+
+    def start(self) -> None:
+        """启动读取上游的任务"""
+        self._task = asyncio.ensure_future(self._pump())
+        if self._idle_grace > 0:
+            # 在宽限期内无人订阅同样取消上游
+            self._schedule_idle_cancel()
+
+    async def _pump(self) -> None:
+        try:
+            events = self._events
+            async for event in self._source:
+                if len(events) == events.maxlen:
+                    self.offset += 1
+                events.append(event)
+                self._wake()
+        except asyncio.CancelledError:
+            self._error = RuntimeError("上游流已取消")
+        except Exception as e:
+            self._error = e
+        finally:
+            self.done = True
+            self._cancel_idle_timer()
+            self._wake()
+            aclose = getattr(self._source, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception:
+                    pass
+            if self._on_finish:
+                self._on_finish()
+
+    def _wake(self) -> None:
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def subscribe(self, start: int = 0) -> AsyncGenerator[Any, None]:
+        """
+        订阅事件
+
+        Args:
+            start: 从第几个事件开始读取(从0开始)，之前的事件已产出的部分不再发出
+
+        Returns:
+            订阅者的异步迭代器，已保留的事件会先依次发出
+
+        Raises:
+            LookupError: 起始事件已被丢弃
+        """
+        if start < self.offset:
+            raise LookupError(f"事件 {start} 已被丢弃，当前最早保留的事件为 {self.offset}")
+        # 订阅时立即计数，避免订阅者开始读取前上游流因无人订阅被取消
+        self.subscribers += 1
+        self._cancel_idle_timer()
+        return self._iterate(start)
+
+    async def _iterate(self, cursor: int) -> AsyncGenerator[Any, None]:
+        try:
+            while True:
+                index = cursor - self.offset
+                if index < 0:
+                    raise LookupError(f"订阅者读取过慢，事件 {cursor} 已被丢弃")
+                if index < len(self._events):
+                    event = self._events[index]
+                    cursor += 1
+                    yield event
+                    continue
+                if self.done:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+                await waiter
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done and self._task is not None:
+                if self._idle_grace > 0:
+                    self._schedule_idle_cancel()
+                else:
+                    # 没有订阅者了，不再读取上游
+                    self._task.cancel()
+
+    def _schedule_idle_cancel(self) -> None:
+        self._cancel_idle_timer()
+        self._idle_handle = asyncio.get_running_loop().call_later(self._idle_grace, self._cancel_if_idle)
+
+    def _cancel_idle_timer(self) -> None:
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+
+    def _cancel_if_idle(self) -> None:
+        self._idle_handle = None
+        if self.subscribers == 0 and not self.done and self._task is not None:
+            self._task.cancel()
+
+
+class SingleFlight:
+    """按键合并进行中的流"""
+
+    def __init__(self):
+        self._flights: Dict[str, StreamBroadcaster] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def stream(self, key: str, factory: Callable[[], AsyncIterator[Any]]) -> AsyncGenerator[Any, None]:
+        """
+        订阅键对应的流，没有进行中的流时用factory创建
+
+        Args:
+            key: 请求键
+            factory: 创建上游流的函数
+
+        Returns:
+            订阅者的异步迭代器
+        """
+        flight = self._flights.get(key)
+        if flight is None or flight.done:
+            flight = StreamBroadcaster(factory(), on_finish=lambda: self._finish(key, flight))
+            self._flights[key] = flight
+            flight.start()
+            self.leaders += 1
+        else:
+            self.followers += 1
+        return flight.subscribe()
+
+    def _finish(self, key: str, flight: StreamBroadcaster) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def __contains__(self, key: str) -> bool:
+        flight = self._flights.get(key)
+        return flight is not None and not flight.done
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计"""
+        return {
+            "in_flight": len(self._flights),
+            "subscribers": sum(flight.subscribers for flight in self._flights.values()),
+            "upstream_streams": self.leaders,
+            "shared_requests": self.followers,
+        }
@@ -0,0 +1,457 @@
+"""
+流式响应处理管道
+
+流式接口由一组阶段组成，按接口选择：表单数据拼接、引用分离、增量合并、指标、日志记录和SSE编码。
+消息增量以文本形式依次交给各阶段，每个阶段只处理一次，返回交给下一阶段的文本，返回None表示
+暂存或丢弃；中间不重建StreamEvent。其他事件到达前，各阶段先按顺序交出暂存的文本，保证顺序不变。
+
+开启阶段计时后，记录每个阶段处理消息和事件的累计耗时，可通过统计接口查看每个token的CPU花在哪里。
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from ..models.chat import ChatRequest, StreamEvent, StreamEventType
+from ..services import metrics
+from ..services.reference_splitter import ReferenceSplitter
+from ..services.stream_stats import stream_stats
+from ..utils.logger import get_logger, StreamLogger
+from ..utils.sse_encoder import SSEEncoder
+from ..utils.stream_utils import TIMEOUT, TimedReader
+
+logger = get_logger("stream_pipeline")
+
+_MESSAGE = StreamEventType.MESSAGE
+
+
+def merge_form_data(request: ChatRequest) -> None:
+    """将表单数据拼接到消息前面"""
+    if request.form_data:
+        form_str = json.dumps(request.form_data, ensure_ascii=False, indent=2)
+        request.message = f"表单数据:\n{form_str}\n\n用户问题:\n{request.message}"
+
+
+class Stage:
+    """管道阶段，默认原样传递"""
+
+    name = "stage"
+
+    def __init__(self):
+        self.calls = 0
+        self.elapsed_ns = 0
+
+    def prepare(self, request: ChatRequest) -> None:
+        """请求上游前调整请求"""
+    
+    def message(self, text: str) -> Optional[str]:
+        """处理消息增量，返回交给下一阶段的文本，None表示暂存或丢弃"""
+        return text
+
+    def flush(self) -> Optional[str]:
+        """交出暂存的文本"""
+        return None
+
+    async def event(self, event: StreamEvent) -> None:
+        """处理非消息事件，事件本身原样交给下一阶段"""
+
+    def deadline(self) -> Optional[float]:
+        """需要定时交出暂存文本的时间点(事件循环时间)，None表示没有"""
+        return None
+    
+    def start(self) -> None:
+        """开始读取上游前调用"""
+    
+    def close(self) -> None:
+        """流结束(完成、出错或客户端断开)后调用"""
+
+
+class FormDataStage(Stage):
+    """将表单数据拼接到消息前面"""
+
+    name = "form_data"
+
+    def __init__(self, request_id: str = ""):
+        super().__init__()
+        self.request_id = request_id
+
+    def prepare(self, request: ChatRequest) -> None:
+        original_message = request.message
+        try:
+            merge_form_data(request)
+            if request.message != original_message:
+                logger.info(f"[{self.request_id}] 拼接表单数据到消息，原始长度: {len(original_message)}，新长度: {len(request.message)}")
+        except Exception as e:
+            logger.error(f"[{self.request_id}] 处理表单数据失败: {e}", exc_info=True)
+            # 如果处理失败，恢复原始消息
+            request.message = original_message
+
+
+class ReferencesStage(Stage):
+    """去除回答末尾的引用段落，完成时保存引用文本"""
+
+    name = "references"
+
+    def __init__(self, conversation_id: str, save: Callable[[str, str], Awaitable[None]], request_id: str = ""):
+        super().__init__()
+        self.conversation_id = conversation_id
+        self.request_id = request_id
+        self._save = save
+        # 引用标记可能跨增量拆分，由分离器跨块识别
+        self._splitter = ReferenceSplitter()
+
+    def message(self, text: str) -> Optional[str]:
+        splitter = self._splitter
+        if splitter.in_references:
+            splitter.feed(text)
+            return None  # 不发送给前端
+        # 只发送引用前的部分，可能暂存的标记前缀留待后续确认
+        return splitter.feed(text) or None
+
+    def flush(self) -> Optional[str]:
+        # 流结束前发出暂存的、最终未构成引用标记的正文
+        return self._splitter.flush() or None
+
+    async def event(self, event: StreamEvent) -> None:
+        if event.type == StreamEventType.COMPLETE:
+            references_content = self._splitter.references
+            if references_content:
+                await self._save(self.conversation_id, references_content.strip())
+                logger.info(f"[{self.request_id}] 缓存引用文本，长度:{len(references_content)}")
+
+
+class CoalesceStage(Stage):
+    """在时间窗口内合并相邻的消息增量"""
+
+    name = "coalesce"
+
+    def __init__(self, window_ms: int, max_bytes: int = 0):
+        super().__init__()
+        self._window = window_ms / 1000
+        self._max_bytes = max_bytes
+        self._parts: List[str] = []
+        self._size = 0
+        self._deadline: Optional[float] = None
+
+    def message(self, text: str) -> Optional[str]:
+        if not self._parts:
+            # 第一个增量到达后开始计时
+            self._deadline = asyncio.get_running_loop().time() + self._window
+        self._parts.append(text)
+        if self._max_bytes:
+            self._size += len(text.encode("utf-8"))
+            if self._size >= self._max_bytes:
+                return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        if not self._parts:
+            return None
+        merged = "".join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        self._deadline = None
+        return merged
+
+    def deadline(self) -> Optional[float]:
+        return self._deadline
+
+
+class LoggingStage(Stage):
+    """记录发送的事件，完成时计入流式统计"""
+
+    name = "logging"
+
+    def __init__(self, request_id: str, stream_logger: StreamLogger, label: str = "流式聊天"):
+        super().__init__()
+        self.request_id = request_id
+        self.stream_logger = stream_logger
+        self.label = label
+        self.event_count = 0
+        self.output_chars = 0
+        loop = asyncio.get_event_loop()
+        self._time = loop.time
+        self.start_time = self.last_event_time = loop.time()
+
+    def message(self, text: str) -> Optional[str]:
+        self.event_count += 1
+        self.output_chars += len(text)
+        current_time = self._time()
+        self.stream_logger.log_event("message", content=text)
+        logger.debug("[{}] 发送流式消息事件 #{}, 间隔: {:.3f}秒", self.request_id, self.event_count, current_time - self.last_event_time)
+        self.last_event_time = current_time
+        return text
+
+    async def event(self, event: StreamEvent) -> None:
+        self.event_count += 1
+        current_time = self._time()
+        # 只有记录逐事件明细的流才序列化事件内容
+        self.stream_logger.log_event(event.type.value, metadata=event.model_dump(mode="json") if self.stream_logger.tracing else None)
+        if event.type == StreamEventType.FOLLOW_UP:
+            logger.info(f"[{self.request_id}] 发送建议问题事件 #{self.event_count}, 问题数量: {len(event.follow_up_questions) if event.follow_up_questions else 0}")
+        else:
+            logger.info(f"[{self.request_id}] 发送流式{event.type}事件 #{self.event_count}")
+        self.last_event_time = current_time
+
+        # 如果是完成或错误事件，流随之结束
+        if event.done:
+            if event.type == StreamEventType.COMPLETE:
+                stream_stats.record_completed()
+            self.stream_logger.log_summary("完成")
+            logger.info(f"[{self.request_id}] {self.label}结束，共发送 {self.event_count} 个事件，总耗时: {current_time - self.start_time:.2f}秒")
+
+    def abandon(self) -> None:
+        """客户端中途断开"""
+        stream_stats.record_abandoned(self.output_chars)
+        self.stream_logger.log_summary("客户端断开")
+        logger.info(f"[{self.request_id}] 客户端已断开，停止{self.label}，已发送 {self.output_chars} 个字符")
+
+
+class MetricsStage(Stage):
+    """记录首token时间、token间隔、流时长和帧数等Prometheus指标"""
+
+    name = "metrics"
+
+    def __init__(self, doctor_type: Optional[str], endpoint: str):
+        super().__init__()
+        # 按标签取得子指标后缓存，逐token更新时不再查找
+        labels = (metrics.doctor_label(doctor_type), endpoint)
+        self._first_token = metrics.time_to_first_token.labels(*labels)
+        self._gap = metrics.inter_token_gap.labels(*labels)
+        self._duration = metrics.stream_duration.labels(*labels)
+        self._frames = metrics.stream_frames.labels(*labels)
+        self._active = metrics.active_streams.labels(*labels)
+        self._time = asyncio.get_event_loop().time
+        self.start_time = self._time()
+        self.last_message_time: Optional[float] = None
+        self.frames = 0
+        self._started = False
+
+    def start(self) -> None:
+        self._started = True
+        self._active.inc()
+
+    def message(self, text: str) -> Optional[str]:
+        now = self._time()
+        if self.last_message_time is None:
+            self._first_token.observe(now - self.start_time)
+        else:
+            self._gap.observe(now - self.last_message_time)
+        self.last_message_time = now
+        self.frames += 1
+        return text
+
+    async def event(self, event: StreamEvent) -> None:
+        self.frames += 1
+
+    def close(self) -> None:
+        if not self._started:
+            return
+        self._started = False
+        self._active.dec()
+        self._duration.observe(self._time() - self.start_time)
+        self._frames.observe(self.frames)
+
+
+class Sink(Stage):
+    """管道末端，收集输出"""
+
+    def __init__(self):
+        super().__init__()
+        self.out: List[Any] = []
+
+    def keepalive(self) -> None:
+        """上游静默时的心跳"""
+
+
+class SSESink(Sink):
+    """编码为SSE字节帧"""
+
+    name = "sse_encode"
+
+    def __init__(self, encoder: SSEEncoder):
+        super().__init__()
+        self._encode_message = encoder.encode_message
+        self._encoder = encoder
+
+    def message(self, text: str) -> Optional[str]:
+        self.out.append(self._encode_message(text))
+        return None
+
+    async def event(self, event: StreamEvent) -> None:
+        self.out.append(self._encoder.encode(event))
+
+    def keepalive(self) -> None:
+        # 上游静默期间定时发送注释帧，防止代理和浏览器因空闲断开连接
+        self.out.append(self._encoder.comment(f"heartbeat {int(asyncio.get_running_loop().time())}"))
+
+
+class StreamPipeline:
+    """按顺序执行各阶段的流式处理管道"""
+
+    def __init__(self, stages: List[Stage], sink: Sink, timing: bool = False):
+        self.stages = stages + [sink]
+        self.sink = sink
+        self.timing = timing
+        self.finished = False
+        # 从第i个阶段开始的后续阶段，供暂存文本从中间阶段继续传递
+        self._tails = [self.stages[index:] for index in range(len(self.stages) + 1)]
+        self._scheduled = [(index, stage) for index, stage in enumerate(self.stages)
+                           if type(stage).deadline is not Stage.deadline]
+
+    def prepare(self, request: ChatRequest) -> None:
+        """请求上游前由各阶段调整请求"""
+        for stage in self.stages:
+            stage.prepare(request)
+
+    def _message(self, text: str, start: int = 0) -> None:
+        if self.timing:
+            self._timed_message(text, start)
+            return
+        for stage in self._tails[start]:
+            text = stage.message(text)
+            if text is None:
+                return
+
+    def _timed_message(self, text: str, start: int) -> None:
+        clock = time.perf_counter_ns
+        for stage in self._tails[start]:
+            begin = clock()
+            text = stage.message(text)
+            stage.elapsed_ns += clock() - begin
+            stage.calls += 1
+            if text is None:
+                return
+
+    async def _event(self, event: StreamEvent) -> None:
+        clock = time.perf_counter_ns
+        for index, stage in enumerate(self.stages):
+            # 事件之前先交出该阶段暂存的文本
+            text = stage.flush()
+            if text:
+                self._message(text, index + 1)
+            begin = clock() if self.timing else 0
+            await stage.event(event)
+            if self.timing:
+                stage.elapsed_ns += clock() - begin
+                stage.calls += 1
+        if event.done:
+            self.finished = True
+
+    def _flush(self, index: int) -> None:
+        text = self.stages[index].flush()
+        if text:
+            self._message(text, index + 1)
+
+    def _next_deadline(self) -> Optional[float]:
+        deadlines = [stage.deadline() for _, stage in self._scheduled]
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        return min(deadlines) if deadlines else None
+
+    async def run(self, events: AsyncIterator[StreamEvent], keepalive_interval: float = 0
+                  ) -> AsyncGenerator[Any, None]:
+        """
+        处理事件流
+
+        Args:
+            events: 服务层的流式事件
+            keepalive_interval: 上游静默期间心跳间隔(秒)，0表示不发送
+
+        Yields:
+            管道末端的输出，完成或错误事件之后结束
+        """
+        loop = asyncio.get_running_loop()
+        reader = TimedReader(events)
+        out = self.sink.out
+        last_output = loop.time()
+        for stage in self.stages:
+            stage.start()
+        try:
+            while not self.finished:
+                timeout = None
+                if self._scheduled:
+                    deadline = self._next_deadline()
+                    if deadline is not None:
+                        timeout = deadline - loop.time()
+                if keepalive_interval > 0:
+                    keepalive_in = last_output + keepalive_interval - loop.time()
+                    timeout = keepalive_in if timeout is None else min(timeout, keepalive_in)
+
+                try:
+                    event = await reader.next(timeout)
+                except StopAsyncIteration:
+                    break
+
+                if event is TIMEOUT:
+                    now = loop.time()
+                    for index, stage in self._scheduled:
+                        deadline = stage.deadline()
+                        if deadline is not None and deadline <= now:
+                            self._flush(index)
+                    if not out and keepalive_interval > 0 and now - last_output >= keepalive_interval:
+                        self.sink.keepalive()
+                elif event.type == _MESSAGE:
+                    if event.content:
+                        self._message(event.content)
+                else:
+                    await self._event(event)
+
+                if out:
+                    for item in out:
+                        yield item
+                    out.clear()
+                    last_output = loop.time()
+
+            if not self.finished:
+                # 上游未发出完成事件就结束时，交出各阶段暂存的文本
+                for index in range(len(self.stages)):
+                    self._flush(index)
+                for item in out:
+                    yield item
+                out.clear()
+        finally:
+            await reader.aclose()
+            for stage in self.stages:
+                stage.close()
+
+    def stage_timings(self) -> Dict[str, Dict[str, int]]:
+        """各阶段的调用次数和累计耗时"""
+        return {stage.name: {"calls": stage.calls, "elapsed_ns": stage.elapsed_ns} for stage in self.stages}
+
+
+class PipelineStats:
+    """按接口汇总各阶段耗时"""
+
+    def __init__(self):
+        self._routes: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, route: str, pipeline: StreamPipeline) -> None:
+        """记录一个流的阶段耗时，仅在开启阶段计时时有数据"""
+        if not pipeline.timing:
+            return
+        route_stats = self._routes.setdefault(route, {"streams": 0, "stages": {}})
+        route_stats["streams"] += 1
+        for name, timing in pipeline.stage_timings().items():
+            stage_stats = route_stats["stages"].setdefault(name, {"calls": 0, "elapsed_ns": 0})
+            stage_stats["calls"] += timing["calls"]
+            stage_stats["elapsed_ns"] += timing["elapsed_ns"]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各接口的阶段耗时，含每次调用的平均纳秒数"""
+        result = {}
+        for route, route_stats in self._routes.items():
+            stages = {}
+            for name, stage_stats in route_stats["stages"].items():
+                calls = stage_stats["calls"]
+                stages[name] = {
+                    "calls": calls,
+                    "total_ms": round(stage_stats["elapsed_ns"] / 1e6, 3),
+                    "avg_ns": round(stage_stats["elapsed_ns"] / calls) if calls else 0,
+                }
+            result[route] = {"streams": route_stats["streams"], "stages": stages}
+        return result
+
+
+# 全局统计实例
+pipeline_stats = PipelineStats()
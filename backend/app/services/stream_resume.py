@@ -0,0 +1,142 @@
+"""
+可续传的SSE流
+
+每个流由后台任务读取并保存最近的SSE帧，数据帧带有单调递增的id。客户端断线后可以带着
+Last-Event-ID重新连接，先补发错过的帧再继续接收实时内容，上游请求不会重新发起。
+客户端断开后上游继续生成一段宽限期，期间无人重连才取消；流结束后帧再保留一段时间。
+续传须带上打开流时生成的随机令牌，request_id本身可被猜出，不能作为凭据。
+"""
+
+import asyncio
+import secrets
+from collections import OrderedDict
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from ..services.config_service import config_service
+from ..services.single_flight import StreamBroadcaster
+from ..utils.logger import get_logger
+
+logger = get_logger("stream_resume")
+
+
+async def number_frames(frames: AsyncIterator[bytes]) -> AsyncGenerator[bytes, None]:
+    """
+    为数据帧加上id行
+
+    id为帧在流中的序号(从1开始)，注释帧(心跳等)也占用序号但不带id，
+    因此id单调递增，客户端用最后收到的id续传即可从下一帧开始。
+    """
+    seq = 0
+    async for frame in frames:
+        seq += 1
+        if frame.startswith(b"data:"):
+            yield b"id: %d\n" % seq + frame
+        else:
+            yield frame
+
+
+class ResumableStreams:
+    """按request_id保存进行中和刚结束的流及其续传令牌"""
+
+    def __init__(self):
+        self._streams: "OrderedDict[str, Tuple[str, StreamBroadcaster]]" = OrderedDict()
+        self.opened = 0
+        self.resumed = 0
+        self.misses = 0
+
+    @staticmethod
+    def new_token() -> str:
+        """生成续传令牌(128位随机数)"""
+        return secrets.token_urlsafe(16)
+
+    def open(self, stream_id: str, token: str, frames: AsyncIterator[bytes],
+             on_finish: Optional[Callable[[], None]] = None) -> AsyncGenerator[bytes, None]:
+        """
+        在后台开始读取流，并返回第一个订阅者
+
+        Args:
+            stream_id: 流ID，即request_id
+            token: 续传令牌，见new_token
+            frames: SSE帧
+            on_finish: 流结束(完成、出错或无人重连被取消)后的回调
+
+        Returns:
+            带id的SSE帧
+        """
+        config = config_service.get_config().stream.resume
+
+        def finish() -> None:
+            if on_finish:
+                on_finish()
+            # 结束后保留一段时间，供刚断线的客户端补齐最后的帧
+            asyncio.get_running_loop().call_later(config.retention_seconds, self._expire, stream_id, broadcaster)
+
+        broadcaster = StreamBroadcaster(number_frames(frames), on_finish=finish,
+                                        max_events=config.buffer_frames, idle_grace=config.grace_seconds)
+        self._register(stream_id, token, broadcaster, config.max_streams)
+        broadcaster.start()
+        self.opened += 1
+        return broadcaster.subscribe()
+
+    def resume(self, stream_id: str, token: str, last_event_id: int) -> AsyncGenerator[bytes, None]:
+        """
+        从Last-Event-ID之后继续订阅
+
+        Args:
+            stream_id: 流ID
+            token: 打开流时返回给客户端的续传令牌
+            last_event_id: 客户端最后收到的帧id，0表示从头开始
+
+        Returns:
+            补发的帧和后续实时帧
+
+        Raises:
+            KeyError: 流不存在、已过期或令牌不匹配
+            LookupError: 需要补发的帧已不在缓冲区中
+        """
+        entry = self._streams.get(stream_id)
+        if entry is None or not secrets.compare_digest(entry[0], token or ""):
+            # 令牌不匹配时与流不存在的表现相同，不暴露流是否存在
+            self.misses += 1
+            raise KeyError(stream_id)
+        broadcaster = entry[1]
+        try:
+            subscriber = broadcaster.subscribe(max(last_event_id, 0))
+        except LookupError:
+            self.misses += 1
+            raise
+        self.resumed += 1
+        logger.info(f"[{stream_id}] 客户端续传，从第 {last_event_id + 1} 帧开始，已产出 {broadcaster.produced} 帧")
+        return subscriber
+
+    def _register(self, stream_id: str, token: str, broadcaster: StreamBroadcaster, max_streams: int) -> None:
+        self._streams[stream_id] = (token, broadcaster)
+        self._streams.move_to_end(stream_id)
+        if len(self._streams) > max_streams:
+            # 优先丢弃已结束的流；进行中的流数量受准入控制约束
+            for key in [key for key, (_, stream) in self._streams.items() if stream.done]:
+                del self._streams[key]
+                if len(self._streams) <= max_streams:
+                    break
+
+    def _expire(self, stream_id: str, broadcaster: StreamBroadcaster) -> None:
+        entry = self._streams.get(stream_id)
+        if entry is not None and entry[1] is broadcaster:
+            del self._streams[stream_id]
+
+    def __contains__(self, stream_id: str) -> bool:
+        return stream_id in self._streams
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取续传统计"""
+        return {
+            "streams": len(self._streams),
+            "live": sum(1 for _, stream in self._streams.values() if not stream.done),
+            "opened": self.opened,
+            "resumed": self.resumed,
+            "misses": self.misses,
+        }
+
+
+# 全局实例
+resumable_streams = ResumableStreams()
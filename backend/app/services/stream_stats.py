@@ -0,0 +1,58 @@
+"""
+流式请求统计
+
+记录正常完成和客户端中途断开的流，以及断开后向Coze发出的取消对话请求的结果。
+"""
+
+from typing import Any, Dict
+
+
+class StreamStats:
+    """流式请求的完成和断开统计"""
+
+    def __init__(self):
+        self.completed = 0
+        self.abandoned = 0
+        self.abandoned_output_chars = 0
+        self.upstream_cancelled = 0
+        self.upstream_cancel_failed = 0
+
+    def record_completed(self) -> None:
+        """记录正常完成的流"""
+        self.completed += 1
+
+    def record_abandoned(self, output_chars: int) -> None:
+        """
+        记录客户端中途断开的流
+
+        Args:
+            output_chars: 断开前已输出的消息字符数
+        """
+        self.abandoned += 1
+        self.abandoned_output_chars += output_chars
+
+    def record_upstream_cancel(self, success: bool) -> None:
+        """
+        记录断开后取消上游对话的结果
+
+        Args:
+            success: Coze是否接受了取消请求
+        """
+        if success:
+            self.upstream_cancelled += 1
+        else:
+            self.upstream_cancel_failed += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            "completed": self.completed,
+            "abandoned": self.abandoned,
+            "abandoned_output_chars": self.abandoned_output_chars,
+            "upstream_cancelled": self.upstream_cancelled,
+            "upstream_cancel_failed": self.upstream_cancel_failed,
+        }
+
+
+# 全局统计实例
+stream_stats = StreamStats()
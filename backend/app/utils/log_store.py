@@ -0,0 +1,299 @@
+"""
+按请求ID索引的结构化日志
+
+每条日志写成一行JSON(app.jsonl)，同时在索引文件(app.jsonl.idx)中追加"键\\t偏移"，键为
+r:<request_id>或c:<conversation_id>。文件超过大小上限后轮转为带时间戳的文件，并在后台按块压缩：
+每约64KB的内容压成一个独立的gzip成员，索引改为记录成员的压缩偏移和成员内偏移，查询时只解压
+命中的成员。按请求或对话查询时只读取命中的行，不扫描整个日志。
+"""
+
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+import traceback
+import zlib
+from bisect import bisect_right
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .sse_encoder import get_dumps
+
+# 压缩时每个gzip成员包含的原始字节数
+GZIP_BLOCK_SIZE = 64 * 1024
+
+# 写入JSON时不重复输出的extra字段
+_RESERVED_EXTRA = ("request_id", "conversation_id", "name")
+
+
+def _index_keys(request_id: str, conversation_id: Optional[str]) -> List[str]:
+    keys = []
+    if request_id and request_id != "-":
+        keys.append(f"r:{request_id}")
+    if conversation_id:
+        keys.append(f"c:{conversation_id}")
+    return keys
+
+
+class LogStore:
+    """JSON-lines日志写入器，loguru在sync模式下直接调用write，batched模式下由后台线程调用write_messages"""
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backups: int = 10, compress: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self._dumps = get_dumps("auto")
+        self._lock = threading.Lock()
+        self._compressing: List[threading.Thread] = []
+        self._open()
+
+    def _open(self) -> None:
+        self._file = open(self.path, "ab")
+        self._index = open(self.path + ".idx", "ab")
+        self._offset = self._file.tell()
+        # 当前文件的索引同时保存在内存中，本进程查询时不必重新读取索引文件
+        self.live_index: Dict[str, List[Tuple[int, ...]]] = {}
+
+    def _serialize(self, record: Dict[str, Any]) -> Tuple[bytes, List[str]]:
+        extra = record["extra"]
+        request_id = extra.get("request_id", "-")
+        conversation_id = extra.get("conversation_id")
+        entry = {
+            "time": record["time"].isoformat(timespec="milliseconds"),
+            "level": record["level"].name,
+            "request_id": request_id,
+            "conversation_id": conversation_id,
+            "logger": extra.get("name"),
+            "module": record["name"],
+            "function": record["function"],
+            "line": record["line"],
+            "message": record["message"],
+        }
+        others = {key: value for key, value in extra.items() if key not in _RESERVED_EXTRA}
+        if others:
+            entry["extra"] = others
+        if record["exception"] is not None:
+            exc_type, exc_value, exc_tb = record["exception"]
+            entry["exception"] = "".join(traceback.format_exception(exc_type, exc_value, exc_tb))
+        try:
+            line = self._dumps(entry)
+        except TypeError:
+            # extra中有无法直接序列化的值时转为字符串
+            line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        return line + b"\n", _index_keys(request_id, conversation_id)
+
+    def write(self, message) -> None:
+        """写入一条loguru消息"""
+        self.write_messages((message,))
+
+    def write_messages(self, messages) -> None:
+        """写入多条loguru消息，batched模式下丢弃提示等没有record的行不写入"""
+        lines = []
+        index_lines = []
+        offset = self._offset
+        for message in messages:
+            record = getattr(message, "record", None)
+            if record is None:
+                continue
+            line, keys = self._serialize(record)
+            for key in keys:
+                index_lines.append((key, offset))
+            lines.append(line)
+            offset += len(line)
+        if not lines:
+            return
+        with self._lock:
+            self._file.write(b"".join(lines))
+            self._file.flush()
+            self._index.write("".join(f"{key}\t{position}\n" for key, position in index_lines).encode("utf-8"))
+            self._index.flush()
+            live_index = self.live_index
+            for key, position in index_lines:
+                positions = live_index.get(key)
+                if positions is None:
+                    live_index[key] = [(position,)]
+                else:
+                    positions.append((position,))
+            self._offset = offset
+            if offset >= self.max_bytes:
+                self._rotate()
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._index.close()
+        base, ext = os.path.splitext(self.path)
+        now = time.time()
+        rotated = f"{base}.{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1e6) % 1000000:06d}{ext}"
+        os.replace(self.path + ".idx", rotated + ".idx")
+        os.replace(self.path, rotated)
+        self._open()
+        if self.compress:
+            thread = threading.Thread(target=self._compress_and_prune, args=(rotated,), name="log-compress", daemon=True)
+            self._compressing = [t for t in self._compressing if t.is_alive()] + [thread]
+            thread.start()
+        else:
+            self._prune()
+
+    def _compress_and_prune(self, path: str) -> None:
+        compress_file(path)
+        self._prune()
+
+    def _prune(self) -> None:
+        # 只保留最近的backups个轮转文件
+        for path in rotated_files(self.path)[:-self.backups or None]:
+            _index_cache.pop(path + ".idx", None)
+            for suffix in ("", ".idx"):
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+
+    def stop(self) -> None:
+        """关闭文件，等待进行中的压缩完成，logger.remove()时由loguru调用"""
+        with self._lock:
+            self._file.close()
+            self._index.close()
+        for thread in self._compressing:
+            thread.join()
+
+
+def compress_file(path: str) -> str:
+    """
+    将轮转的日志按块压缩为gzip文件，并把索引转换为压缩偏移
+
+    Args:
+        path: 轮转后的.jsonl文件
+
+    Returns:
+        压缩文件路径
+    """
+    target = path + ".gz"
+    members: List[Tuple[int, int]] = []  # (原始起始偏移, 压缩偏移)
+    with open(path, "rb") as source, open(target + ".tmp", "wb") as out:
+        plain_offset = 0
+        while True:
+            # 按整行分块，保证每行只在一个成员中
+            block = source.read(GZIP_BLOCK_SIZE)
+            if not block:
+                break
+            block += source.readline()
+            members.append((plain_offset, out.tell()))
+            out.write(gzip.compress(block, mtime=0))
+            plain_offset += len(block)
+    starts = [start for start, _ in members]
+
+    with open(path + ".idx", "r", encoding="utf-8") as index, open(target + ".idx.tmp", "w", encoding="utf-8") as out:
+        for entry in index:
+            key, offset = entry.rstrip("\n").rsplit("\t", 1)
+            start, compressed = members[bisect_right(starts, int(offset)) - 1]
+            out.write(f"{key}\t{compressed}\t{int(offset) - start}\n")
+    # 先替换索引，压缩文件出现时索引已就绪
+    os.replace(target + ".idx.tmp", target + ".idx")
+    os.replace(target + ".tmp", target)
+    os.remove(path)
+    os.remove(path + ".idx")
+    return target
+
+
+def rotated_files(path: str) -> List[str]:
+    """按时间从旧到新列出轮转后的日志文件(压缩或未压缩)"""
+    base, ext = os.path.splitext(path)
+    files = {}
+    for candidate in glob.glob(glob.escape(base) + ".*" + ext) + glob.glob(glob.escape(base) + ".*" + ext + ".gz"):
+        # 压缩完成前两种文件可能同时存在，以压缩文件为准
+        name = candidate[:-3] if candidate.endswith(".gz") else candidate
+        if candidate.endswith(".gz") or name not in files:
+            files[name] = candidate
+    return [files[name] for name in sorted(files)]
+
+
+_index_cache: Dict[str, Tuple[float, Dict[str, List[Tuple[int, ...]]]]] = {}
+
+
+def _load_index(path: str, cache: bool) -> Dict[str, List[Tuple[int, ...]]]:
+    index_path = path + ".idx"
+    try:
+        mtime = os.path.getmtime(index_path)
+    except FileNotFoundError:
+        return {}
+    cached = _index_cache.get(index_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    index: Dict[str, List[Tuple[int, ...]]] = {}
+    with open(index_path, "r", encoding="utf-8") as file:
+        for entry in file:
+            key, *positions = entry.rstrip("\n").split("\t")
+            index.setdefault(key, []).append(tuple(int(position) for position in positions))
+    if cache:
+        # 轮转后的文件不再变化，索引缓存在进程内
+        _index_cache[index_path] = (mtime, index)
+    return index
+
+
+def _read_lines(path: str, positions: List[Tuple[int, ...]]) -> Iterator[Tuple[Tuple[int, ...], bytes]]:
+    with open(path, "rb") as file:
+        if not path.endswith(".gz"):
+            for position in positions:
+                file.seek(position[0])
+                yield position, file.readline()
+            return
+        members: Dict[int, bytes] = {}
+        for position in positions:
+            compressed, inner = position
+            block = members.get(compressed)
+            if block is None:
+                file.seek(compressed)
+                decompressor = zlib.decompressobj(wbits=31)
+                parts = []
+                while not decompressor.eof:
+                    chunk = file.read(16 * 1024)
+                    if not chunk:
+                        break
+                    parts.append(decompressor.decompress(chunk))
+                block = members[compressed] = b"".join(parts)
+            yield position, block[inner:block.index(b"\n", inner) + 1]
+
+
+def _lookup(files: List[Tuple[str, Any]], key: str) -> List[Tuple[int, Tuple[int, ...], Dict[str, Any]]]:
+    found = []
+    for order, (path, index) in enumerate(files):
+        # index为True时缓存索引文件，为字典时直接使用内存中的索引
+        positions = (index if isinstance(index, dict) else _load_index(path, index)).get(key)
+        if positions:
+            for position, line in _read_lines(path, positions):
+                found.append((order, position, json.loads(line)))
+    return found
+
+
+def query_logs(path: str, request_id: Optional[str] = None, conversation_id: Optional[str] = None,
+               store: Optional[LogStore] = None) -> List[Dict[str, Any]]:
+    """
+    查询请求或对话的全部日志
+
+    按对话查询时，先找到带有该对话ID的日志，再补充这些请求的全部日志(包括对话ID确定前的日志)。
+
+    Args:
+        path: 当前日志文件路径，如logs/app.jsonl
+        request_id: 请求ID
+        conversation_id: 对话ID
+        store: 本进程正在写入的日志，查询期间暂停写入以读到完整的行
+
+    Returns:
+        按写入顺序排列的日志
+    """
+    lock = store._lock if store else threading.Lock()
+    with lock:
+        files = [(file, True) for file in rotated_files(path)] + [(path, store.live_index if store else False)]
+        found = {}
+        request_ids = [request_id] if request_id else []
+        if conversation_id:
+            for order, position, entry in _lookup(files, f"c:{conversation_id}"):
+                found[(order, position)] = entry
+                if entry["request_id"] not in request_ids:
+                    request_ids.append(entry["request_id"])
+        for current in request_ids:
+            for order, position, entry in _lookup(files, f"r:{current}"):
+                found[(order, position)] = entry
+    return [found[key] for key in sorted(found)]
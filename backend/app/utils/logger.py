@@ -2,23 +2,214 @@
 日志工具类
 """
 
+import copy
 import sys
 import os
 import uuid
 import time
+import random
+import threading
+from bisect import bisect_left
+from collections import deque
 from loguru import logger
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, List, TYPE_CHECKING
 from contextvars import ContextVar
 
+from .log_store import LogStore
+
+if TYPE_CHECKING:
+    from ..models.config import LogConfig
+
 # 请求上下文ID变量
 request_id_var: ContextVar[str] = ContextVar('request_id', default='')
+# 对话ID变量，结构化日志按对话建立索引
+conversation_id_var: ContextVar[str] = ContextVar('conversation_id', default='')
+
+# WARNING及以上级别的日志在队列满时优先保留
+_IMPORTANT_LEVEL = 30
+
+# batched模式下当前使用的输出
+_batched_sinks: List["BatchedSink"] = []
+
+# 记录逐事件明细日志的流所占比例
+_stream_trace_sample_rate = 0.0
+
+# 结构化日志，未启用时为None
+_log_store: Optional[LogStore] = None
+
+
+class BatchedSink:
+    """
+    有界队列日志输出
+    
+    loguru在调用线程(事件循环)中格式化日志后只放入内存队列，由后台线程按批写入目标，
+    事件循环不等待磁盘和终端IO。队列满时按策略丢弃而不阻塞：
+    - drop: 丢弃新日志
+    - drop_oldest: 丢弃最早的日志
+    - sample: 队列过半后WARNING以下的日志每sample_rate条保留1条，满后同drop
+    WARNING及以上的日志在队列满时挤掉最早的日志，不会被丢弃。
+    """
+    
+    def __init__(
+        self,
+        write: Callable[[str], None],
+        name: str = "sink",
+        queue_size: int = 10000,
+        batch_size: int = 512,
+        flush_interval: float = 0.05,
+        overflow: str = "drop",
+        sample_rate: int = 10,
+        close: Optional[Callable[[], None]] = None,
+        join: bool = True,
+    ):
+        if overflow not in ("drop", "drop_oldest", "sample"):
+            raise ValueError(f"未知的日志队列溢出策略: {overflow}")
+        self.name = name
+        self._write = write
+        self._close = close
+        # join为False时write收到消息列表而不是拼接后的文本
+        self._join = join
+        self._queue: deque = deque()
+        self._queue_size = queue_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._overflow = overflow
+        self._sample_rate = sample_rate
+        # 达到该长度后开始按策略处理新日志
+        self._limit = queue_size // 2 if overflow == "sample" else queue_size
+        self._sampled = 0
+        self._reported = 0
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self._stopped = False
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"log-writer-{name}", daemon=True)
+        self._thread.start()
+    
+    def write(self, message) -> None:
+        """loguru调用的写入方法，只入队"""
+        queue = self._queue
+        size = len(queue)
+        if size >= self._limit and not self._admit(message, size):
+            self.dropped += 1
+            return
+        queue.append(message)
+        if size + 1 == self._batch_size:
+            self._wakeup.set()
+    
+    def _admit(self, message, size: int) -> bool:
+        # 非loguru消息(如链路导出的文本行)没有级别，按普通日志处理
+        record = getattr(message, "record", None)
+        important = record is not None and record["level"].no >= _IMPORTANT_LEVEL
+        if size < self._queue_size:
+            # sample策略在队列过半后采样
+            if important:
+                return True
+            self._sampled += 1
+            return self._sampled % self._sample_rate == 0
+        if important or self._overflow == "drop_oldest":
+            try:
+                self._queue.popleft()
+                self.dropped += 1
+            except IndexError:
+                pass
+            return True
+        return False
+    
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            self._drain()
+        self._drain()
+    
+    def _drain(self) -> None:
+        queue = self._queue
+        while queue:
+            batch = []
+            try:
+                while len(batch) < self._batch_size:
+                    batch.append(queue.popleft())
+            except IndexError:
+                pass
+            dropped = self.dropped
+            if dropped != self._reported:
+                batch.append(f"日志队列已满，累计丢弃 {dropped} 条日志\n")
+                self._reported = dropped
+            try:
+                self._write("".join(batch) if self._join else batch)
+                self.written += len(batch)
+            except Exception:
+                self.write_errors += 1
+    
+    def stop(self) -> None:
+        """写完队列中的日志后停止，logger.remove()时由loguru调用"""
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        if self._close:
+            self._close()
+        if self in _batched_sinks:
+            _batched_sinks.remove(self)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取队列统计"""
+        return {
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+        }
+
+
+def _file_writer(base, log_file: str, rotation: str, retention: str):
+    """
+    创建供后台线程写入的文件输出，轮转和保留仍由loguru的文件输出处理
+    
+    Args:
+        base: 没有任何输出的独立logger副本
+        
+    Returns:
+        (写入函数, 关闭函数)
+    """
+    writer = copy.deepcopy(base)
+    writer.add(log_file, level=0, format="{message}", rotation=rotation, retention=retention, encoding="utf-8")
+    raw = writer.opt(raw=True)
+    return (lambda text: raw.info(text)), writer.remove
+
+
+def _add_batched(sink: BatchedSink, **kwargs) -> None:
+    _batched_sinks.append(sink)
+    logger.add(sink, **kwargs)
+
+
+def get_log_store() -> Optional[LogStore]:
+    """
+    获取正在写入的结构化日志
+    
+    Returns:
+        LogStore，未启用logging.structured时为None
+    """
+    return _log_store
+
+
+def get_log_stats() -> Dict[str, Any]:
+    """
+    获取batched模式下各输出的队列统计
+    
+    Returns:
+        各输出的排队、已写入和丢弃条数，sync模式下为空
+    """
+    return {sink.name: sink.get_stats() for sink in _batched_sinks}
 
 
 def setup_logger(
     level: str = "INFO",
     log_file: Optional[str] = None,
     rotation: str = "1 day",
-    retention: str = "30 days"
+    retention: str = "30 days",
+    log_config: Optional["LogConfig"] = None,
 ) -> None:
     """
     设置日志记录器
@@ -28,57 +219,111 @@ def setup_logger(
         log_file: 日志文件路径
         rotation: 日志轮转
         retention: 日志保留时间
+        log_config: 日志输出配置，mode为batched时各输出经有界队列由后台线程批量写入
     """
+    global _stream_trace_sample_rate, _log_store
+    
     # 清除默认处理器
     logger.remove()
+    _log_store = None
+    
+    _stream_trace_sample_rate = log_config.stream_trace_sample_rate if log_config is not None else 0.0
+    batched = log_config is not None and log_config.mode == "batched"
+    # 移除全部输出后复制出独立的logger，供后台线程写文件，不会收到应用日志
+    writer_base = copy.deepcopy(logger) if batched else None
+    
+    def batched_sink(name: str, write: Callable, close: Optional[Callable[[], None]] = None,
+                     join: bool = True) -> BatchedSink:
+        return BatchedSink(
+            write, name=name, close=close, join=join,
+            queue_size=log_config.queue_size,
+            batch_size=log_config.batch_size,
+            flush_interval=log_config.flush_interval,
+            overflow=log_config.overflow,
+            sample_rate=log_config.sample_rate,
+        )
+    
+    def add_file(name: str, path: str, **kwargs) -> None:
+        if batched:
+            write, close = _file_writer(writer_base, path, rotation, retention)
+            _add_batched(batched_sink(name, write, close), **kwargs)
+        else:
+            logger.add(
+                path,
+                rotation=rotation,
+                retention=retention,
+                encoding="utf-8",
+                enqueue=True,  # 启用队列模式，确保线程安全
+                **kwargs
+            )
     
     # 添加控制台输出
-    logger.add(
-        sys.stderr,
+    console_format = (
+        "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | "
+        "<level>{level: <8}</level> | "
+        "{extra[request_id]} | "
+        "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
+        "<level>{message}</level>"
+    )
+    console_options = dict(
         level=level,
-        format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | "
-               "<level>{level: <8}</level> | "
-               "{extra[request_id]} | "
-               "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
-               "<level>{message}</level>",
+        format=console_format,
         colorize=True,
         backtrace=True,  # 显示异常追溯
         diagnose=True,   # 显示诊断信息
     )
+    if batched:
+        stderr = sys.stderr
+        
+        def write_console(text: str) -> None:
+            stderr.write(text)
+            stderr.flush()
+        
+        _add_batched(batched_sink("console", write_console), **console_options)
+    else:
+        logger.add(sys.stderr, **console_options)
     
     # 如果指定了日志文件，添加文件输出
+    stream_log_file = None
     if log_file:
         # 确保日志目录存在
         log_dir = os.path.dirname(log_file)
         if log_dir and not os.path.exists(log_dir):
             os.makedirs(log_dir)
-            
-        logger.add(
+        
+        add_file(
+            "file",
             log_file,
             level=level,
             format="{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {extra[request_id]} | {name}:{function}:{line} - {message}",
-            rotation=rotation,
-            retention=retention,
-            encoding="utf-8",
-            enqueue=True,  # 启用队列模式，确保线程安全
         )
-    
-    # 单独的流式日志
-    stream_log_file = None
-    if log_file:
+        
+        # 单独的流式日志
         stream_log_file = log_file.replace('.log', '_stream.log')
-        logger.add(
+        add_file(
+            "stream_file",
             stream_log_file,
             level=level,
             format="{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {extra[request_id]} | STREAM - {message}",
             filter=lambda record: "stream" in record["name"],
-            rotation=rotation,
-            retention=retention,
-            encoding="utf-8",
-            enqueue=True,
         )
+        
+        # 按请求ID索引的JSON-lines日志
+        if log_config is not None and log_config.structured:
+            _log_store = LogStore(
+                log_file.replace('.log', '.jsonl'),
+                max_bytes=log_config.structured_max_bytes,
+                backups=log_config.structured_backups,
+                compress=log_config.structured_compress,
+            )
+            if batched:
+                _add_batched(batched_sink("structured", _log_store.write_messages, _log_store.stop, join=False),
+                             level=level, format="{message}")
+            else:
+                # 与文件输出相同经loguru队列由后台线程写入，事件循环不等待写文件和更新索引
+                logger.add(_log_store, level=level, format="{message}", enqueue=True)
     
-    logger.info(f"日志记录器已设置，级别: {level}, 主日志: {log_file or 'stdout'}, 流日志: {stream_log_file or 'None'}")
+    logger.info(f"日志记录器已设置，级别: {level}, 模式: {'batched' if batched else 'sync'}, 主日志: {log_file or 'stdout'}, 流日志: {stream_log_file or 'None'}")
 
 
 def set_request_id(request_id: Optional[str] = None) -> str:
@@ -97,6 +342,16 @@ def set_request_id(request_id: Optional[str] = None) -> str:
     return request_id
 
 
+def set_conversation_id(conversation_id: str) -> None:
+    """
+    为当前请求设置对话ID，之后的日志带有conversation_id
+    
+    Args:
+        conversation_id: 对话ID
+    """
+    conversation_id_var.set(conversation_id)
+
+
 def get_request_id() -> str:
     """
     获取当前请求ID
@@ -122,6 +377,9 @@ def get_logger(name: str = None):
     # 总是添加请求ID
     def request_context_filter(record):
         record["extra"]["request_id"] = get_request_id() or "-"
+        conversation_id = conversation_id_var.get()
+        if conversation_id:
+            record["extra"]["conversation_id"] = conversation_id
         return True
     
     logger.configure(patcher=request_context_filter)
@@ -130,44 +388,106 @@ def get_logger(name: str = None):
 
 
 class StreamLogger:
-    """流式日志记录器，用于记录流式传输的内容"""
+    """
+    流式日志记录器
+    
+    每个流只在内存中累计各类型事件数、内容字符数和事件间隔分布(固定大小的直方图)，
+    结束时写一条结构化摘要日志。按 stream_trace_sample_rate 抽中的流额外逐事件写DEBUG明细，
+    明细在DEBUG级别未启用时不会格式化。
+    """
+    
+    # 事件间隔直方图的分桶上界(秒)，最后一个桶为超过最大上界的间隔
+    GAP_BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
     
-    def __init__(self, logger_name: str = "stream"):
-        self.logger = get_logger(logger_name)
+    def __init__(self, logger_name: str = "stream", trace: Optional[bool] = None):
+        self.logger = _get_stream_logger(logger_name)
         self.event_count = 0
-        self.start_time = time.time()
+        self.content_chars = 0
+        self.type_counts: Dict[str, int] = {}
+        self.gap_histogram = [0] * (len(self.GAP_BOUNDS) + 1)
+        self.max_gap = 0.0
+        self.start_time = time.perf_counter()
+        self._last_time = self.start_time
+        # 是否记录逐事件明细，默认按配置的比例抽样
+        if trace is None:
+            trace = _stream_trace_sample_rate > 0 and random.random() < _stream_trace_sample_rate
+        self.tracing = trace
         
     def log_event(self, event_type: str, content: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None):
         """记录流式事件"""
+        now = time.perf_counter()
+        gap = now - self._last_time
+        self._last_time = now
         self.event_count += 1
-        elapsed = time.time() - self.start_time
+        self.type_counts[event_type] = self.type_counts.get(event_type, 0) + 1
+        if content:
+            self.content_chars += len(content)
+        self.gap_histogram[bisect_left(self.GAP_BOUNDS, gap)] += 1
+        if gap > self.max_gap:
+            self.max_gap = gap
         
+        if self.tracing:
+            self.logger.opt(lazy=True).debug(
+                "{}", lambda: self._format_event(now - self.start_time, self.event_count, event_type, content, metadata)
+            )
+    
+    @staticmethod
+    def _format_event(elapsed: float, index: int, event_type: str, content: Optional[str],
+                      metadata: Optional[Dict[str, Any]]) -> str:
         if content and len(content) > 100:
             # 对于长内容，只记录摘要
-            content_summary = f"{content[:50]}...{content[-50:]}"
-        else:
-            content_summary = content
-            
-        log_message = f"[{elapsed:.2f}s] 事件 #{self.event_count} | 类型: {event_type}"
+            content = f"{content[:50]}...{content[-50:]}"
         
-        if content_summary:
-            log_message += f" | 内容: {content_summary}"
+        log_message = f"[{elapsed:.2f}s] 事件 #{index} | 类型: {event_type}"
+        
+        if content:
+            log_message += f" | 内容: {content}"
             
         if metadata:
             log_message += f" | 元数据: {metadata}"
-            
-        self.logger.debug(log_message)
+        
+        return log_message
+    
+    def get_summary(self) -> Dict[str, Any]:
+        """流的汇总数据"""
+        labels = [f"<={bound * 1000:g}ms" for bound in self.GAP_BOUNDS] + [f">{self.GAP_BOUNDS[-1] * 1000:g}ms"]
+        return {
+            "events": self.event_count,
+            "elapsed_s": round(time.perf_counter() - self.start_time, 3),
+            "content_chars": self.content_chars,
+            "types": dict(self.type_counts),
+            "gap_histogram": {label: count for label, count in zip(labels, self.gap_histogram) if count},
+            "max_gap_ms": round(self.max_gap * 1000, 1),
+        }
         
     def log_summary(self, status: str = "完成", error: Optional[str] = None):
-        """记录流式传输摘要"""
-        elapsed = time.time() - self.start_time
-        log_message = f"流式传输{status}，共处理 {self.event_count} 个事件，耗时 {elapsed:.2f}秒"
+        """记录流式传输摘要，每个流一条"""
+        summary = self.get_summary()
+        log_message = (
+            f"流式传输{status}，共处理 {summary['events']} 个事件，耗时 {summary['elapsed_s']:.2f}秒"
+            f" | 类型: {' '.join(f'{name}={count}' for name, count in summary['types'].items()) or '-'}"
+            f" | 内容: {summary['content_chars']}字符"
+            f" | 事件间隔: {' '.join(f'{label}:{count}' for label, count in summary['gap_histogram'].items()) or '-'}"
+            f" | 最大间隔: {summary['max_gap_ms']}ms"
+        )
         
+        log = self.logger.bind(stream_summary=summary)
         if error:
             log_message += f"，错误: {error}"
-            self.logger.error(log_message)
+            log.error(log_message)
         else:
-            self.logger.info(log_message)
+            log.info(log_message)
+
+
+def _get_stream_logger(name: str):
+    """按名称复用流日志记录器，避免每个流重新配置logger"""
+    log = _stream_loggers.get(name)
+    if log is None:
+        log = _stream_loggers[name] = get_logger(name)
+    return log
+
+
+_stream_loggers: Dict[str, Any] = {}
 
 
 # 默认日志记录器
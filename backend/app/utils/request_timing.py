@@ -0,0 +1,173 @@
+"""
+请求计时中间件
+
+纯ASGI实现，只包装send回调，不像BaseHTTPMiddleware那样为每个响应额外创建任务和内存流，
+流式响应的每个数据块只多一次类型判断和长度累加。记录响应头发出时间、首个响应体字节时间、
+响应真正结束的总耗时和发送字节数，流式响应的"完成请求"日志在流结束时才输出。
+启用链路追踪时同时创建请求的Trace，在响应头中附带Server-Timing，请求结束后导出。
+"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict, MutableMapping, Optional
+
+from .logger import get_logger, set_request_id
+from .tracing import tracer
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+logger = get_logger("http")
+
+_REQUEST_ID_HEADER = b"x-request-id"
+_SERVER_TIMING_HEADER = b"server-timing"
+
+
+class RequestTimingStats:
+    """按路由汇总请求耗时"""
+
+    def __init__(self):
+        self._routes: Dict[str, Dict[str, float]] = {}
+
+    def record(self, route: str, status: int, headers_s: Optional[float], first_byte_s: Optional[float],
+               total_s: float, bytes_sent: int) -> None:
+        """
+        记录一个已结束的请求
+
+        Args:
+            route: 路由模板，如'/api/chat/stream'
+            status: 状态码，未发出响应时为0
+            headers_s: 发出响应头的耗时(秒)
+            first_byte_s: 发出首个响应体字节的耗时(秒)
+            total_s: 响应结束的总耗时(秒)
+            bytes_sent: 响应体字节数
+        """
+        stats = self._routes.get(route)
+        if stats is None:
+            stats = self._routes[route] = {
+                "requests": 0, "errors": 0, "headers_s": 0.0, "first_byte_s": 0.0,
+                "first_byte_count": 0, "total_s": 0.0, "max_total_s": 0.0, "bytes_sent": 0,
+            }
+        stats["requests"] += 1
+        if status == 0 or status >= 500:
+            stats["errors"] += 1
+        if headers_s is not None:
+            stats["headers_s"] += headers_s
+        if first_byte_s is not None:
+            stats["first_byte_s"] += first_byte_s
+            stats["first_byte_count"] += 1
+        stats["total_s"] += total_s
+        stats["max_total_s"] = max(stats["max_total_s"], total_s)
+        stats["bytes_sent"] += bytes_sent
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各路由的请求数和平均耗时(毫秒)"""
+        result = {}
+        for route, stats in self._routes.items():
+            requests = stats["requests"]
+            first_byte_count = stats["first_byte_count"]
+            result[route] = {
+                "requests": requests,
+                "errors": stats["errors"],
+                "avg_headers_ms": round(stats["headers_s"] / requests * 1000, 2),
+                "avg_first_byte_ms": round(stats["first_byte_s"] / first_byte_count * 1000, 2) if first_byte_count else None,
+                "avg_total_ms": round(stats["total_s"] / requests * 1000, 2),
+                "max_total_ms": round(stats["max_total_s"] * 1000, 2),
+                "bytes_sent": stats["bytes_sent"],
+            }
+        return result
+
+
+# 全局统计实例
+request_timing_stats = RequestTimingStats()
+
+
+class RequestTimingMiddleware:
+    """记录请求日志和耗时，并在响应头中返回X-Request-ID"""
+
+    def __init__(self, app: ASGIApp, stats: RequestTimingStats = request_timing_stats):
+        self.app = app
+        self.stats = stats
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # 生成请求ID
+        request_id = set_request_id()
+        request_id_header = request_id.encode("latin-1")
+        method = scope["method"]
+        path = scope["path"]
+        client = scope.get("client")
+        client_host = client[0] if client else "unknown"
+        logger.info(f"[{request_id}] 开始请求: {method} {path} - 客户端: {client_host}")
+        trace = tracer.start(f"{method} {path}", _get_header(scope, b"traceparent"), **{
+            "http.method": method, "http.target": path, "request_id": request_id,
+        })
+        server_timing = trace is not None and tracer.server_timing
+
+        clock = time.perf_counter
+        start = clock()
+        status = 0
+        headers_at: Optional[float] = None
+        first_byte_at: Optional[float] = None
+        bytes_sent = 0
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status, headers_at, first_byte_at, bytes_sent
+            if message["type"] == "http.response.body":
+                body = message.get("body")
+                if body:
+                    if first_byte_at is None:
+                        first_byte_at = clock()
+                    bytes_sent += len(body)
+            elif message["type"] == "http.response.start":
+                headers_at = clock()
+                status = message["status"]
+                headers = list(message.get("headers", ()))
+                # 流式接口自带的请求ID用于续传，保留接口设置的值
+                if not any(name.lower() == _REQUEST_ID_HEADER for name, _ in headers):
+                    headers.append((_REQUEST_ID_HEADER, request_id_header))
+                # 响应头发出前已结束的span，流式响应的其余span在流末尾的timing事件中
+                if server_timing:
+                    headers.append((_SERVER_TIMING_HEADER, trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except Exception as e:
+            # 记录异常
+            logger.error(
+                f"[{request_id}] 请求异常: {method} {path} "
+                f"- 错误: {str(e)} - 耗时: {clock() - start:.3f}秒"
+            )
+            raise
+        finally:
+            total = clock() - start
+            headers_s = headers_at - start if headers_at is not None else None
+            first_byte_s = first_byte_at - start if first_byte_at is not None else None
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.stats.record(route, status, headers_s, first_byte_s, total, bytes_sent)
+            if trace is not None:
+                tracer.finish(trace, f"{method} {route}", **{
+                    "http.route": route, "http.status_code": status, "http.response_size": bytes_sent,
+                })
+
+        # 记录请求结果，流式响应在流结束后才记录
+        logger.info(
+            f"[{request_id}] 完成请求: {method} {path} - 状态码: {status} "
+            f"- 响应头: {headers_s if headers_s is not None else 0:.3f}秒 "
+            f"- 首字节: {first_byte_s if first_byte_s is not None else 0:.3f}秒 "
+            f"- 耗时: {total:.3f}秒 - 发送: {bytes_sent}字节"
+        )
+
+
+def _get_header(scope: Scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
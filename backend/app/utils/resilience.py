@@ -0,0 +1,170 @@
+"""
+重试策略与熔断器
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+from cozepy import CozeAPIError
+
+# 可重试的Coze业务错误码: 限流以及服务端内部错误
+RETRYABLE_COZE_CODES = {4013, 5000}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    判断错误是否值得重试
+
+    Args:
+        error: 异常
+
+    Returns:
+        网络错误、超时、限流和服务端错误返回True，鉴权、参数等错误返回False
+    """
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    if isinstance(error, CozeAPIError):
+        return error.code in RETRYABLE_COZE_CODES or (error.code or 0) > 5000
+    return False
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+    def __init__(self, name: str, retry_in: float):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"上游服务 {name} 暂不可用(熔断中)，请在 {retry_in:.0f} 秒后重试")
+
+
+class RetryState:
+    """单次调用的重试进度"""
+
+    def __init__(self, policy: "RetryPolicy"):
+        self._policy = policy
+        self.attempt = 0
+        self.deadline = time.monotonic() + policy.deadline
+
+    def next_delay(self, error: BaseException) -> Optional[float]:
+        """
+        计算下一次重试前的等待时间
+
+        Args:
+            error: 本次失败的异常
+
+        Returns:
+            等待秒数；不可重试、次数用尽或超出截止时间时返回None
+        """
+        if not is_retryable(error) or self.attempt >= self._policy.max_retries:
+            return None
+        delay = self._policy.backoff(self.attempt)
+        if time.monotonic() + delay >= self.deadline:
+            return None
+        self.attempt += 1
+        return delay
+
+
+class RetryPolicy:
+    """指数退避+抖动的重试策略，总耗时受截止时间约束"""
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 4.0, deadline: float = 30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    @classmethod
+    def from_config(cls, config) -> "RetryPolicy":
+        """根据Coze配置创建重试策略，截止时间取请求超时时间"""
+        return cls(
+            max_retries=config.max_retries,
+            base_delay=config.retry_base_delay,
+            max_delay=config.retry_max_delay,
+            deadline=config.timeout,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """第attempt次重试的等待时间(full jitter)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def begin(self) -> RetryState:
+        """开始一次调用"""
+        return RetryState(self)
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败达到阈值后打开，打开期间请求立即失败；冷却时间过后进入半开状态，
+    放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+
+    def before_call(self) -> None:
+        """
+        调用上游前检查熔断状态
+
+        Raises:
+            CircuitOpenError: 熔断器打开或半开探测进行中
+        """
+        if self.state == self.CLOSED:
+            return
+        now = time.monotonic()
+        remaining = self.opened_at + self.reset_timeout - now
+        if self.state == self.OPEN and remaining <= 0:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        # 探测请求被取消而未上报结果时，超过冷却时间后允许新的探测
+        probe_lost = self._probe_in_flight and now - self._probe_started_at > self.reset_timeout
+        if self.state == self.HALF_OPEN and (not self._probe_in_flight or probe_lost):
+            self._probe_in_flight = True
+            self._probe_started_at = now
+            return
+        self.rejected += 1
+        raise CircuitOpenError(self.name, max(remaining, 1.0))
+
+    def record_success(self) -> None:
+        """记录成功调用"""
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        """记录失败调用"""
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取熔断器统计"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
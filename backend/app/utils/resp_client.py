@@ -0,0 +1,139 @@
+"""
+最小的Redis协议(RESP2)异步客户端
+
+只依赖asyncio流，实现单连接上的顺序命令执行，满足引用文本共享存储的GET/SET/DEL需求；
+兼容Redis以及实现了RESP协议的替代服务。
+"""
+
+import asyncio
+from typing import Any, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+
+class RespError(Exception):
+    """服务端返回的错误回复"""
+
+
+def parse_redis_url(url: str) -> Tuple[str, int, Optional[str], int]:
+    """
+    解析redis://[:password@]host[:port][/db]形式的地址
+
+    Returns:
+        (主机, 端口, 密码, 数据库编号)
+    """
+    parsed = urlparse(url)
+    if parsed.scheme != "redis":
+        raise ValueError(f"不支持的Redis地址: {url}")
+    password = unquote(parsed.password) if parsed.password else None
+    db = int(parsed.path.lstrip("/") or 0)
+    return parsed.hostname or "localhost", parsed.port or 6379, password, db
+
+
+def encode_command(*args: Any) -> bytes:
+    """按RESP数组格式编码命令"""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    """
+    读取一个RESP回复
+
+    Raises:
+        RespError: 错误回复
+        ConnectionError: 连接被关闭
+    """
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Redis连接已关闭")
+    prefix, payload = line[:1], line[1:-2]
+    if prefix == b"+":
+        return payload.decode("utf-8")
+    if prefix == b"-":
+        raise RespError(payload.decode("utf-8"))
+    if prefix == b":":
+        return int(payload)
+    if prefix == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if prefix == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise ConnectionError(f"无法解析的Redis回复: {line!r}")
+
+
+class RespClient:
+    """单连接的RESP客户端，命令按顺序执行，连接异常后下次调用自动重连"""
+
+    def __init__(self, url: str, timeout: float = 1.0):
+        self.host, self.port, self._password, self._db = parse_redis_url(url)
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self._password:
+            await self._roundtrip(("AUTH", self._password))
+        if self._db:
+            await self._roundtrip(("SELECT", self._db))
+
+    async def _roundtrip(self, args: Tuple[Any, ...]) -> Any:
+        self._writer.write(encode_command(*args))
+        await self._writer.drain()
+        return await read_reply(self._reader)
+
+    async def _execute(self, args: Tuple[Any, ...]) -> Any:
+        if self._writer is None:
+            await self._connect()
+        return await self._roundtrip(args)
+
+    async def execute(self, *args: Any) -> Any:
+        """
+        执行一条命令
+
+        Args:
+            args: 命令及参数
+
+        Returns:
+            解析后的回复，bulk字符串为bytes
+
+        Raises:
+            RespError: 服务端错误回复
+            ConnectionError / asyncio.TimeoutError: 连接失败或超时
+        """
+        async with self._lock:
+            try:
+                return await asyncio.wait_for(self._execute(args), self.timeout)
+            except RespError:
+                raise
+            except BaseException:
+                # 回复可能只读了一半，丢弃连接避免后续命令错位
+                await self._close_connection()
+                raise
+
+    async def _close_connection(self) -> None:
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def aclose(self) -> None:
+        """关闭连接"""
+        async with self._lock:
+            await self._close_connection()
@@ -0,0 +1,93 @@
+"""
+SSE帧编码器
+
+消息增量是流中最多的事件，直接按固定模板拼接为UTF-8字节帧：只序列化增量文本本身，
+request_id每个流只序列化一次，其余字段为常量。其他事件按字段顺序序列化，输出的键与
+StreamEvent.dict()加上request_id一致。安装orjson时可使用orjson序列化。
+"""
+
+import importlib.util
+import json
+from typing import Any, Callable, Dict, Optional
+
+from ..models.chat import StreamEvent, StreamEventType
+
+_MESSAGE = StreamEventType.MESSAGE
+
+
+def orjson_available() -> bool:
+    """是否安装了orjson"""
+    return importlib.util.find_spec("orjson") is not None
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def get_dumps(backend: str = "auto") -> Callable[[Any], bytes]:
+    """
+    获取JSON序列化函数
+
+    Args:
+        backend: auto(安装orjson时使用orjson)、orjson 或 json
+
+    Returns:
+        将值序列化为UTF-8字节的函数
+    """
+    if backend == "orjson" or (backend == "auto" and orjson_available()):
+        import orjson
+        return orjson.dumps
+    if backend not in ("auto", "json"):
+        raise ValueError(f"未知的JSON序列化后端: {backend}")
+    return _json_dumps
+
+
+class SSEEncoder:
+    """单个流的SSE帧编码器"""
+
+    def __init__(self, request_id: str, backend: str = "auto"):
+        self._dumps = get_dumps(backend)
+        self.request_id = request_id
+        encoded_id = self._dumps(request_id)
+        self._message_prefix = b'data: {"type":"message","content":'
+        self._message_suffix = (
+            b',"done":false,"usage":null,"error":null,"follow_up_questions":null,"request_id":'
+            + encoded_id + b'}\n\n'
+        )
+
+    def encode(self, event: StreamEvent) -> bytes:
+        """
+        编码流式事件
+
+        Args:
+            event: 流式事件
+
+        Returns:
+            完整的SSE帧
+        """
+        if event.type == _MESSAGE and not event.done and event.usage is None \
+                and event.error is None and event.follow_up_questions is None:
+            return self.encode_message(event.content)
+        return self.encode_data({
+            "type": event.type.value,
+            "content": event.content,
+            "done": event.done,
+            "usage": event.usage,
+            "error": event.error,
+            "follow_up_questions": event.follow_up_questions,
+            "request_id": self.request_id,
+        })
+
+    def encode_message(self, content: Optional[str]) -> bytes:
+        """编码消息增量，与encode(StreamEvent(type=message, content=content))相同"""
+        return self._message_prefix + self._dumps(content) + self._message_suffix
+
+    def encode_data(self, data: Dict[str, Any]) -> bytes:
+        """编码任意数据帧，如初始化和错误事件"""
+        return b"data: " + self._dumps(data) + b"\n\n"
+
+    @staticmethod
+    def comment(text: str) -> bytes:
+        """编码注释帧(心跳等)，客户端会忽略"""
+        return f": {text}\n\n".encode("utf-8")
+
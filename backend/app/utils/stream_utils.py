@@ -0,0 +1,177 @@
+"""
+流式处理工具
+"""
+
+import asyncio
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Optional
+
+# TimedReader.next 等待超时时的返回值
+TIMEOUT = object()
+
+# 读取任务放入队列的结束标记
+_END = object()
+
+
+async def _await_with_timeout(awaitable: Awaitable[Any], timeout: float) -> Any:
+    """
+    在当前任务中带超时等待
+
+    到期时由定时器取消当前任务的这次等待并抛出asyncio.TimeoutError，
+    不像asyncio.wait_for(Python 3.9-3.11)那样为每次等待创建新任务，
+    被等待的异步生成器在当前任务中运行，各次等待之间的contextvar写入对当前任务可见。
+    超时会中断被等待的对象，只适用于可以安全取消的等待或超时即放弃的场景。
+
+    Args:
+        awaitable: 要等待的对象
+        timeout: 最长等待秒数
+
+    Returns:
+        等待结果
+
+    Raises:
+        asyncio.TimeoutError: 等待超时
+    """
+    task = asyncio.current_task()
+    expired = False
+
+    def expire() -> None:
+        nonlocal expired
+        expired = True
+        task.cancel()
+
+    handle = asyncio.get_running_loop().call_later(max(timeout, 0), expire)
+    try:
+        return await awaitable
+    except asyncio.CancelledError:
+        # Python 3.11+ 可区分外部同时发起的取消，此时保留取消
+        uncancel = getattr(task, "uncancel", None)
+        if expired and (uncancel is None or uncancel() == 0):
+            raise asyncio.TimeoutError() from None
+        raise
+    finally:
+        handle.cancel()
+
+
+class TimedReader:
+    """
+    可带超时读取的异步迭代器包装
+
+    等待超时时只返回TIMEOUT，不会取消底层迭代，下一次调用继续等待同一个元素，
+    因此可以在上游静默期间插入定时动作(合并刷新、心跳等)。
+    第一次带超时读取时启动一个读取任务，之后整个流都由它把元素放入长度为1的队列，
+    每次读取只在当前任务中带超时等待队列，不再为每个元素创建任务。
+    读取任务运行在创建时复制的上下文中，底层迭代器此后写入的contextvar对调用方不可见，
+    调用方日志需要的上下文(如对话ID)应在开始读取前设置，见coze_service.bind_conversation。
+    """
+
+    def __init__(self, iterator: AsyncIterator[Any]):
+        self._iterator = iterator
+        self._queue: Optional[asyncio.Queue] = None
+        self._pump: Optional[asyncio.Task] = None
+
+    async def _run_pump(self) -> None:
+        """持续读取底层迭代器，结束或出错时放入对应标记"""
+        queue = self._queue
+        while True:
+            try:
+                item = await self._iterator.__anext__()
+            except StopAsyncIteration:
+                await queue.put((_END, None))
+                return
+            except Exception as e:
+                await queue.put((None, e))
+                return
+            await queue.put((item, None))
+
+    async def next(self, timeout: Optional[float] = None) -> Any:
+        """
+        读取下一个元素
+
+        Args:
+            timeout: 最长等待秒数，None表示一直等待
+
+        Returns:
+            下一个元素，超时返回TIMEOUT
+
+        Raises:
+            StopAsyncIteration: 迭代结束
+        """
+        if self._queue is None:
+            if timeout is None:
+                # 无需超时时直接等待，省去创建读取任务的开销
+                return await self._iterator.__anext__()
+            self._queue = asyncio.Queue(maxsize=1)
+            self._pump = asyncio.ensure_future(self._run_pump())
+        if timeout is None:
+            item, error = await self._queue.get()
+        elif timeout <= 0 and self._queue.empty():
+            return TIMEOUT
+        else:
+            try:
+                # 取消Queue.get不会丢失元素
+                item, error = await _await_with_timeout(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return TIMEOUT
+        if error is not None:
+            raise error
+        if item is _END:
+            raise StopAsyncIteration
+        return item
+
+    async def aclose(self) -> None:
+        """停止读取任务并关闭底层迭代器"""
+        if self._pump is not None:
+            self._pump.cancel()
+            try:
+                await self._pump
+            except BaseException:
+                pass
+            self._pump = None
+        aclose = getattr(self._iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+class StreamIdleTimeout(Exception):
+    """上游在限定时间内没有产出任何事件"""
+
+    def __init__(self, timeout: float):
+        super().__init__(f"上游响应超时: {timeout:g}秒内未收到事件")
+        self.timeout = timeout
+
+
+async def with_idle_timeout(events: AsyncIterator[Any], timeout: float) -> AsyncGenerator[Any, None]:
+    """
+    为上游事件流加上空闲超时
+
+    两个事件之间的间隔超过timeout时中断并关闭上游迭代器，抛出StreamIdleTimeout，
+    避免卡住的上游一直占用连接和并发名额。等待在调用方任务中进行，不为每个事件创建任务。
+
+    Args:
+        events: 上游事件
+        timeout: 空闲超时(秒)，0表示不限制
+
+    Yields:
+        上游事件
+
+    Raises:
+        StreamIdleTimeout: 空闲超时
+    """
+    if timeout <= 0:
+        async for event in events:
+            yield event
+        return
+
+    try:
+        while True:
+            try:
+                event = await _await_with_timeout(events.__anext__(), timeout)
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                raise StreamIdleTimeout(timeout) from None
+            yield event
+    finally:
+        aclose = getattr(events, "aclose", None)
+        if aclose is not None:
+            await aclose()
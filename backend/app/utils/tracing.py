@@ -0,0 +1,252 @@
+"""
+请求级链路追踪
+
+每个HTTP请求对应一个Trace，由请求计时中间件创建并放入上下文，路由和CozeService在关键步骤记录span
+(准入排队、获取客户端、上游响应头、首个上游事件、首个内容token、完成等)。span以两种方式返回:
+- Server-Timing响应头：响应头发出前已结束的span；流式响应的其余span在流末尾以timing事件发送
+- OTLP JSON：请求结束后按OpenTelemetry的ExportTraceServiceRequest格式逐行写入本地文件，
+  可由OpenTelemetry Collector的otlpjsonfile接收器读取后转发
+
+未启用追踪时上下文中没有Trace，各记录函数直接返回。
+"""
+
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, TYPE_CHECKING
+
+from .logger import BatchedSink
+
+if TYPE_CHECKING:
+    from ..models.config import TracingConfig
+
+# OpenTelemetry的SpanKind
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class Span:
+    """一个已结束或进行中的span，时间为perf_counter秒"""
+
+    __slots__ = ("name", "span_id", "kind", "start", "end", "attributes")
+
+    def __init__(self, name: str, start: float, end: Optional[float] = None, kind: int = SPAN_KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.attributes = attributes or {}
+
+
+class Trace:
+    """一个请求的全部span，第一个span为HTTP请求本身"""
+
+    def __init__(self, name: str, traceparent: Optional[str] = None, **attributes: Any):
+        match = _TRACEPARENT.match(traceparent or "")
+        # 带有W3C traceparent头时沿用调用方的trace
+        self.trace_id = match.group(1) if match else os.urandom(16).hex()
+        self.parent_span_id = match.group(2) if match else ""
+        start = time.perf_counter()
+        # perf_counter与Unix时间的差值，导出时换算为纳秒时间戳
+        self._epoch_offset = time.time() - start
+        self.root = Span(name, start, kind=SPAN_KIND_SERVER, attributes=attributes)
+        self.spans: List[Span] = [self.root]
+
+    def add_span(self, name: str, start: float, end: Optional[float] = None, kind: int = SPAN_KIND_INTERNAL,
+                 **attributes: Any) -> Span:
+        """记录一个span，end为空表示到现在为止"""
+        span = Span(name, start, end if end is not None else time.perf_counter(), kind, attributes)
+        self.spans.append(span)
+        return span
+
+    def finished_spans(self) -> Iterator[Span]:
+        """已结束的子span"""
+        return (span for span in self.spans[1:] if span.end is not None)
+
+    def server_timing(self, total: bool = True) -> str:
+        """
+        生成Server-Timing头的值
+
+        Args:
+            total: 是否附带从请求开始到现在的总耗时
+
+        Returns:
+            如 'chat.admission;dur=0.4, coze.first_token;dur=812.3, trace;desc="..."'
+        """
+        parts = [f"{span.name};dur={(span.end - span.start) * 1000:.1f}" for span in self.finished_spans()]
+        if total:
+            parts.append(f"total;dur={(time.perf_counter() - self.root.start) * 1000:.1f}")
+        parts.append(f'trace;desc="{self.trace_id}"')
+        return ", ".join(parts)
+
+    def timing_event(self, request_id: str) -> Dict[str, Any]:
+        """流式响应末尾的timing事件，各span的开始时间相对于请求开始"""
+        root_start = self.root.start
+        return {
+            "type": "timing",
+            "request_id": request_id,
+            "trace_id": self.trace_id,
+            "spans": [
+                {
+                    "name": span.name,
+                    "start_ms": round((span.start - root_start) * 1000, 1),
+                    "duration_ms": round((span.end - span.start) * 1000, 1),
+                }
+                for span in self.finished_spans()
+            ],
+            "server_timing": self.server_timing(),
+        }
+
+    def _unix_nanos(self, perf_time: float) -> str:
+        return str(int((perf_time + self._epoch_offset) * 1e9))
+
+    def to_otlp(self, service_name: str) -> Dict[str, Any]:
+        """转换为OTLP JSON的ExportTraceServiceRequest"""
+        spans = []
+        for span in self.spans:
+            parent = self.parent_span_id if span is self.root else self.root.span_id
+            spans.append({
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": parent,
+                "name": span.name,
+                "kind": span.kind,
+                "startTimeUnixNano": self._unix_nanos(span.start),
+                "endTimeUnixNano": self._unix_nanos(span.end if span.end is not None else time.perf_counter()),
+                "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+            })
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", service_name)]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }]
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+# 当前请求的Trace，未启用追踪时为None
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def add_span(name: str, start: float, end: Optional[float] = None, kind: int = SPAN_KIND_INTERNAL,
+             **attributes: Any) -> None:
+    """
+    在当前请求的Trace中记录span
+
+    Args:
+        name: span名称，如'coze.first_token'
+        start: 开始时间(time.perf_counter())
+        end: 结束时间，为空表示到现在为止
+        kind: SpanKind，上游HTTP请求为SPAN_KIND_CLIENT
+        attributes: span属性
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_span(name, start, end, kind, **attributes)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """记录代码块耗时的span"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, start, **attributes)
+
+
+class Tracer:
+    """创建Trace并在请求结束后导出"""
+
+    def __init__(self):
+        self.enabled = False
+        self.server_timing = False
+        self.service_name = "johnson-backend"
+        self._exporter: Optional[BatchedSink] = None
+        self.exported = 0
+
+    def configure(self, config: "TracingConfig", base_dir: str = "") -> None:
+        """
+        按配置启用追踪和文件导出
+
+        Args:
+            config: 追踪配置
+            base_dir: export_file为相对路径时的基准目录
+        """
+        self.close()
+        self.enabled = config.enabled
+        self.server_timing = config.server_timing
+        self.service_name = config.service_name
+        if config.enabled and config.export_file:
+            path = os.path.join(base_dir, config.export_file)
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            file = open(path, "a", encoding="utf-8")
+
+            def write(text: str) -> None:
+                file.write(text)
+                file.flush()
+
+            # 由后台线程批量写入，队列满时丢弃
+            self._exporter = BatchedSink(write, name="traces", queue_size=config.export_queue_size, close=file.close)
+
+    def start(self, name: str, traceparent: Optional[str] = None, **attributes: Any) -> Optional[Trace]:
+        """开始一个请求的Trace并放入上下文，未启用时返回None"""
+        if not self.enabled:
+            return None
+        trace = Trace(name, traceparent, **attributes)
+        current_trace.set(trace)
+        return trace
+
+    def finish(self, trace: Trace, name: Optional[str] = None, **attributes: Any) -> None:
+        """结束请求的Trace并导出"""
+        root = trace.root
+        root.end = time.perf_counter()
+        if name:
+            root.name = name
+        root.attributes.update(attributes)
+        if self._exporter is not None:
+            line = json.dumps(trace.to_otlp(self.service_name), ensure_ascii=False, separators=(",", ":"))
+            self._exporter.write(line + "\n")
+            self.exported += 1
+
+    def close(self) -> None:
+        """写完待导出的Trace并关闭文件"""
+        if self._exporter is not None:
+            self._exporter.stop()
+            self._exporter = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取导出统计"""
+        stats = {"enabled": self.enabled, "exported": self.exported}
+        if self._exporter is not None:
+            stats.update(self._exporter.get_stats())
+        return stats
+
+
+# 全局实例
+tracer = Tracer()
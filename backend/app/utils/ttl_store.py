@@ -0,0 +1,145 @@
+"""
+带TTL和LRU淘汰的有界字符串存储
+
+条目按写入时间过期，超出条目数或总字节数上限时淘汰最久未访问的条目，内存占用有确定上限。
+引用文本存储和回答缓存共用这一实现。
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class TTLStore:
+    """带TTL和LRU淘汰的有界字符串存储"""
+
+    def __init__(self, ttl_seconds: float = 3600.0, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._clock = clock
+
+        # 访问顺序(LRU)，值为(字符串, 字节数)
+        self._entries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        # 写入顺序，TTL统一时即过期顺序
+        self._expires_at: "OrderedDict[str, float]" = OrderedDict()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _entry_size(key: str, value: str) -> int:
+        return len(key.encode("utf-8")) + len(value.encode("utf-8"))
+
+    def _remove(self, key: str) -> None:
+        _, size = self._entries.pop(key)
+        self._expires_at.pop(key, None)
+        self.total_bytes -= size
+
+    def _expire(self) -> None:
+        """移除已过期的条目，只检查写入最早的一段"""
+        if self.ttl_seconds <= 0:
+            return
+        now = self._clock()
+        while self._expires_at:
+            key, expires_at = next(iter(self._expires_at.items()))
+            if expires_at > now:
+                break
+            self._remove(key)
+            self.expirations += 1
+
+    def _evict(self) -> None:
+        """按LRU顺序淘汰，直到满足条目数和字节数上限"""
+        while self._entries and (
+            (self.max_entries and len(self._entries) > self.max_entries)
+            or (self.max_bytes and self.total_bytes > self.max_bytes)
+        ):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取条目
+
+        Args:
+            key: 键
+
+        Returns:
+            值，不存在或已过期时返回None
+        """
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: str, value: str) -> bool:
+        """
+        保存条目
+
+        Args:
+            key: 键
+            value: 值
+
+        Returns:
+            是否保存成功，单条超过总字节数上限时不保存
+        """
+        size = self._entry_size(key, value)
+        if key in self._entries:
+            self._remove(key)
+        if self.max_bytes and size > self.max_bytes:
+            self.rejected += 1
+            return False
+
+        self._entries[key] = (value, size)
+        self._expires_at[key] = self._clock() + self.ttl_seconds
+        self.total_bytes += size
+        self._expire()
+        self._evict()
+        return True
+
+    def delete(self, key: str) -> None:
+        """删除条目"""
+        if key in self._entries:
+            self._remove(key)
+
+    def __contains__(self, key: str) -> bool:
+        """是否存在未过期的条目，不影响访问顺序和命中统计"""
+        self._expire()
+        return key in self._entries
+
+    def clear(self) -> None:
+        """清空所有条目"""
+        self._entries.clear()
+        self._expires_at.clear()
+        self.total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取存储统计"""
+        self._expire()
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+单次聊天延迟基准测试
+
+对比两种非流式实现在不同生成时长下的端到端延迟和上游请求次数:
+- polling: 旧实现，create后每秒调用一次retrieve查询状态，完成后再调用message.list
+- stream:  当前实现，CozeService.chat_single 在内部消费上游流，完成事件到达即返回
+
+上游由 mock_coze 模拟，生成时长相同，不访问真实网络。
+
+用法:
+    python scripts/benchmark_chat_single.py --generation-times 0.3 1.2 2.5 --latency 0.03
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+from mock_coze import build_chat_events, install_mock_client, polling_transport
+
+from cozepy import Message
+
+from app.models.chat import ChatRequest
+from app.services.coze_service import CozeService
+from app.utils.logger import setup_logger
+
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    """统计上游请求次数的传输层包装"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+        self.requests = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        return await self._transport.handle_async_request(request)
+
+
+def paced_transport(events, generation_time: float, latency: float) -> httpx.MockTransport:
+    """按绝对时间表逐个发送事件，避免逐事件sleep的累积误差使流式耗时偏大"""
+
+    async def stream():
+        loop = asyncio.get_running_loop()
+        start = loop.time() + latency
+        for index, event in enumerate(events, 1):
+            await asyncio.sleep(max(0.0, start + generation_time * index / len(events) - loop.time()))
+            yield event.encode("utf-8")
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=stream())
+
+    return httpx.MockTransport(handler)
+
+
+async def legacy_chat_single(client, config, message: str) -> str:
+    """旧chat_single的上游调用序列"""
+    chat = await client.chat.create(
+        bot_id=config.bot_id,
+        user_id=config.default_user_id,
+        additional_messages=[Message.build_user_question_text(message)],
+    )
+    while chat.status in ["in_progress", "created"]:
+        await asyncio.sleep(1)
+        chat = await client.chat.retrieve(conversation_id=chat.conversation_id, chat_id=chat.id)
+    messages = await client.chat.messages.list(conversation_id=chat.conversation_id, chat_id=chat.id)
+    return "".join(m.content for m in messages if m.role == "assistant")
+
+
+async def run_polling(generation_time: float, latency: float):
+    service = CozeService()
+    transport = CountingTransport(polling_transport(generation_time=generation_time, request_latency=latency))
+    install_mock_client(service, transport)
+    start = time.perf_counter()
+    content = await legacy_chat_single(service._get_client(None), service._get_config(None), "基准测试")
+    return time.perf_counter() - start, transport.requests, content
+
+
+async def run_stream(generation_time: float, latency: float):
+    events = build_chat_events()
+    service = CozeService()
+    transport = CountingTransport(paced_transport(events, generation_time, latency))
+    install_mock_client(service, transport)
+    start = time.perf_counter()
+    response = await service.chat_single(ChatRequest(message="基准测试", user_id="bench"))
+    if response.error:
+        raise RuntimeError(response.error)
+    return time.perf_counter() - start, transport.requests, response.content
+
+
+def main():
+    parser = argparse.ArgumentParser(description="单次聊天延迟基准测试")
+    parser.add_argument("--generation-times", type=float, nargs="+", default=[0.3, 1.2, 2.5],
+                        help="模拟的回答生成时长(秒)")
+    parser.add_argument("--latency", type=float, default=0.03, help="每次上游请求的往返延迟(秒)")
+    args = parser.parse_args()
+
+    setup_logger(level="WARNING")
+    print(f"{'生成时长':>8} {'实现':<8} {'延迟':>8} {'请求数':>6}")
+    for generation_time in args.generation_times:
+        contents = set()
+        for name, runner in (("polling", run_polling), ("stream", run_stream)):
+            elapsed, requests, content = asyncio.run(runner(generation_time, args.latency))
+            contents.add(content)
+            print(f"{generation_time:7.2f}s {name:<8} {elapsed:7.3f}s {requests:>6}")
+        assert len(contents) == 1, "两种实现返回的内容不一致"
+
+
+if __name__ == "__main__":
+    main()
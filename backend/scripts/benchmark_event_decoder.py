@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+流式事件解码微基准
+
+在录制的事件序列上对比:
+- legacy:  原chat_stream中逐事件的hasattr/getattr探测链和属性路径字符串切分
+- decoder: app.services.event_decoder 的查表解码器
+
+事件序列由 mock_coze 生成的SSE文本经cozepy的事件处理函数解析得到，与线上流的对象结构一致。
+
+用法:
+    python scripts/benchmark_event_decoder.py --repeat 200
+"""
+
+import argparse
+import timeit
+
+import httpx
+from mock_coze import build_chat_events
+
+from cozepy import ChatEventType
+from cozepy.chat import _chat_stream_handler
+
+from app.services.event_decoder import COMPLETE, CONTENT, FOLLOW_UP, IGNORED, ChatEventDecoder
+
+
+def record_events(chunk_chars: int):
+    """将SSE文本解析为cozepy的ChatEvent对象序列"""
+    raw_response = httpx.Response(200)
+    events = []
+    for block in build_chat_events(chunk_chars=chunk_chars):
+        fields = dict(line.split(":", 1) for line in block.strip().split("\n"))
+        event = _chat_stream_handler({"event": fields["event"], "data": fields["data"]}, raw_response)
+        if event is not None:
+            events.append(event)
+    return events
+
+
+def legacy_decode(event):
+    """原chat_stream中的事件提取逻辑(逐字保留探测顺序)"""
+    content = None
+    usage_info = None
+    follow_up_content = None
+    is_complete = False
+
+    if hasattr(event, 'event'):
+        event_type = getattr(event, 'event', None)
+
+        if event_type == ChatEventType.CONVERSATION_MESSAGE_DELTA:
+            if hasattr(event, 'message') and hasattr(event.message, 'content'):
+                content = event.message.content
+            elif hasattr(event, 'data') and hasattr(event.data, 'content'):
+                content = event.data.content
+            elif hasattr(event, 'delta') and hasattr(event.delta, 'content'):
+                content = event.delta.content
+            elif hasattr(event, 'content'):
+                content = event.content
+
+        elif event_type == ChatEventType.CONVERSATION_MESSAGE_COMPLETED:
+            if hasattr(event, 'message') and hasattr(event.message, 'type'):
+                msg_type = getattr(event.message, 'type', None)
+                if msg_type == 'follow_up' and hasattr(event.message, 'content'):
+                    follow_up_content = event.message.content
+            elif hasattr(event, 'data') and hasattr(event.data, 'type'):
+                msg_type = getattr(event.data, 'type', None)
+                if msg_type == 'follow_up' and hasattr(event.data, 'content'):
+                    follow_up_content = event.data.content
+            elif hasattr(event, 'type') and event.type == 'follow_up':
+                if hasattr(event, 'content'):
+                    follow_up_content = event.content
+
+        elif event_type == ChatEventType.CONVERSATION_CHAT_COMPLETED:
+            is_complete = True
+            for attr_path in ['chat.usage', 'data.usage', 'usage']:
+                parts = attr_path.split('.')
+                obj = event
+                found = True
+                for part in parts:
+                    if hasattr(obj, part):
+                        obj = getattr(obj, part)
+                    else:
+                        found = False
+                        break
+                if found and obj:
+                    usage_info = {
+                        "token_count": getattr(obj, 'token_count', 0),
+                        "input_count": getattr(obj, 'input_count', 0),
+                        "output_count": getattr(obj, 'output_count', 0)
+                    }
+                    break
+    else:
+        for attr_name in ['content', 'message.content', 'delta.content']:
+            parts = attr_name.split('.')
+            obj = event
+            found = True
+            for part in parts:
+                if hasattr(obj, part):
+                    obj = getattr(obj, part)
+                else:
+                    found = False
+                    break
+            if found and isinstance(obj, str):
+                content = obj
+                break
+
+    if content:
+        return CONTENT, content
+    if follow_up_content is not None:
+        return FOLLOW_UP, follow_up_content
+    if is_complete:
+        return COMPLETE, usage_info
+    return IGNORED, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式事件解码微基准")
+    parser.add_argument("--repeat", type=int, default=200, help="每轮解码整段序列的次数")
+    parser.add_argument("--chunk-chars", type=int, default=1, help="每个delta事件的字符数")
+    args = parser.parse_args()
+
+    events = record_events(args.chunk_chars)
+    decoder = ChatEventDecoder()
+
+    # 两种实现的解码结果必须一致
+    expected = [legacy_decode(event) for event in events]
+    assert decoder.decode_all(events) == expected, "解码结果与原实现不一致"
+
+    total = len(events) * args.repeat
+    print(f"录制序列 {len(events)} 个事件，每种实现解码 {total} 次")
+
+    results = {}
+    for name, func in (("legacy", lambda: [legacy_decode(event) for event in events]),
+                       ("decoder", lambda: decoder.decode_all(events))):
+        best = min(timeit.repeat(func, number=args.repeat, repeat=5))
+        results[name] = best / total * 1e9
+        print(f"{name:<8} {results[name]:8.1f} ns/事件")
+
+    print(f"单事件解码耗时降低 {(1 - results['decoder'] / results['legacy']) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+日志输出模式基准测试
+
+模拟大量并发流在事件循环中逐token写日志(与chat_stream相同的debug日志和StreamLogger事件)，
+对比两种输出模式:
+- sync:    控制台同步写入，文件由loguru的enqueue队列写入
+- batched: 所有输出经有界队列，由后台线程批量写入
+
+统计总耗时、事件循环最大延迟(以1ms定时任务的超时衡量)和丢弃的日志条数。控制台输出重定向到
+临时文件，避免终端速度影响结果。
+
+用法:
+    python scripts/benchmark_logging.py --streams 1000 --tokens 50
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from app.models.config import LogConfig  # noqa: E402
+from app.utils.logger import StreamLogger, get_log_stats, get_logger, setup_logger  # noqa: E402
+
+logger = get_logger("benchmark_stream")
+
+
+async def one_stream(index: int, tokens: int, token_delay: float) -> None:
+    stream_logger = StreamLogger("benchmark_stream")
+    for token in range(tokens):
+        await asyncio.sleep(token_delay)
+        content = f"第{token}个字"
+        logger.debug("[stream_{}] 收到事件: conversation.message.delta, 内容长度: {}", index, len(content))
+        stream_logger.log_event("message", content=content)
+    stream_logger.log_summary("完成")
+
+
+async def measure(streams: int, tokens: int, token_delay: float):
+    lag = 0.0
+    running = True
+
+    async def probe():
+        nonlocal lag
+        while running:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag = max(lag, time.perf_counter() - start - 0.001)
+
+    probe_task = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(one_stream(i, tokens, token_delay) for i in range(streams)))
+    elapsed = time.perf_counter() - start
+    running = False
+    await probe_task
+    return elapsed, lag
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志输出模式基准测试")
+    parser.add_argument("--streams", type=int, default=1000, help="并发流数量")
+    parser.add_argument("--tokens", type=int, default=50, help="每个流的token数")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="token间隔(秒)")
+    parser.add_argument("--queue-size", type=int, default=10000, help="batched模式的队列容量")
+    parser.add_argument("--overflow", default="drop", help="batched模式的溢出策略")
+    args = parser.parse_args()
+
+    lines = args.streams * (args.tokens + 1)
+    print(f"并发 {args.streams} 个流，每流 {args.tokens} 个token，共约 {lines} 条日志(每流一条摘要)")
+
+    original_stderr = sys.stderr
+    for mode in ("sync", "batched"):
+        with tempfile.TemporaryDirectory() as log_dir, open(os.path.join(log_dir, "console.log"), "w") as console:
+            sys.stderr = console
+            config = LogConfig(mode=mode, queue_size=args.queue_size, overflow=args.overflow)
+            setup_logger(level="DEBUG", log_file=os.path.join(log_dir, "app.log"), log_config=config)
+            elapsed, lag = asyncio.run(measure(args.streams, args.tokens, args.token_delay))
+            dropped = sum(stats["dropped"] for stats in get_log_stats().values())
+            # 移除输出时等待队列写完
+            flush_start = time.perf_counter()
+            setup_logger(level="WARNING")
+            flush = time.perf_counter() - flush_start
+            sys.stderr = original_stderr
+        print(f"{mode:<8} 总耗时 {elapsed:6.2f}秒  事件循环最大延迟 {lag * 1000:8.1f}ms  "
+              f"丢弃 {dropped:>7} 条  关闭时写完剩余日志 {flush:5.2f}秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+SSE帧编码微基准
+
+对比流式接口中每个事件编码为SSE帧的CPU耗时:
+- legacy:  原generate_stream中的 event.dict() + 添加request_id + json.dumps + f-string，再由Starlette编码为UTF-8
+- json:    app.utils.sse_encoder.SSEEncoder，标准库json序列化增量文本
+- orjson:  同上，使用orjson序列化(需安装orjson)
+
+事件序列按 mock_coze 的默认回答逐段切分，与线上消息增量的长度相近；末尾带完成事件和建议问题事件。
+同时按给定的输出速率换算单核可承载的并发流数。
+
+用法:
+    python scripts/benchmark_sse_encoder.py --chunk-chars 1 4 16 --tokens-per-second 40
+"""
+
+import argparse
+import json
+import timeit
+import warnings
+from typing import List
+
+from mock_coze import DEFAULT_ANSWER, DEFAULT_FOLLOW_UPS
+
+from app.models.chat import StreamEvent, StreamEventType
+from app.utils.sse_encoder import SSEEncoder, orjson_available
+
+REQUEST_ID = "8f14e45f"
+
+
+def build_stream_events(chunk_chars: int) -> List[StreamEvent]:
+    """按字符数切分默认回答，构建一次对话的流式事件序列"""
+    events = [
+        StreamEvent(type=StreamEventType.MESSAGE, content=DEFAULT_ANSWER[i:i + chunk_chars])
+        for i in range(0, len(DEFAULT_ANSWER), chunk_chars)
+    ]
+    events.append(StreamEvent(type=StreamEventType.FOLLOW_UP, follow_up_questions=DEFAULT_FOLLOW_UPS))
+    events.append(StreamEvent(type=StreamEventType.COMPLETE, done=True,
+                              usage={"token_count": 412, "input_count": 230, "output_count": 182}))
+    return events
+
+
+def legacy_frame(event: StreamEvent, request_id: str) -> bytes:
+    """原generate_stream中的编码方式(逐字保留)"""
+    event_data = event.dict()
+    event_data["request_id"] = request_id
+    sse_message = f"data: {json.dumps(event_data, ensure_ascii=False)}\n\n"
+    return sse_message.encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE帧编码微基准")
+    parser.add_argument("--chunk-chars", type=int, nargs="+", default=[1, 4, 16], help="每个消息增量的字符数")
+    parser.add_argument("--tokens-per-second", type=float, default=40, help="单个流每秒输出的消息事件数")
+    parser.add_argument("--repeat", type=int, default=200, help="每轮编码整段序列的次数")
+    args = parser.parse_args()
+    # legacy路径逐字保留了event.dict()，忽略其弃用警告
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    backends = ["json"] + (["orjson"] if orjson_available() else [])
+    if len(backends) == 1:
+        print("未安装orjson，跳过orjson后端")
+
+    for chunk_chars in args.chunk_chars:
+        events = build_stream_events(chunk_chars)
+        total = len(events) * args.repeat
+        print(f"\n每个增量 {chunk_chars} 字符，序列 {len(events)} 个事件，每种实现编码 {total} 次")
+
+        results = {}
+        candidates = [("legacy", lambda: [legacy_frame(event, REQUEST_ID) for event in events])]
+        for backend in backends:
+            encoder = SSEEncoder(REQUEST_ID, backend)
+            # 编码结果解析后必须与原实现一致
+            for event in events:
+                assert json.loads(encoder.encode(event)[6:]) == json.loads(legacy_frame(event, REQUEST_ID)[6:])
+            candidates.append((backend, lambda encoder=encoder: [encoder.encode(event) for event in events]))
+
+        for name, func in candidates:
+            best = min(timeit.repeat(func, number=args.repeat, repeat=5))
+            results[name] = best / total * 1e9
+            cpu_share = results[name] * 1e-9 * args.tokens_per_second
+            print(f"{name:<8} {results[name]:8.1f} ns/事件  单核可承载 {1 / cpu_share:10.0f} 个流"
+                  f" (每流 {args.tokens_per_second:g} 事件/秒)")
+
+        for backend in backends:
+            print(f"{backend} 相比 legacy 单事件耗时降低 {(1 - results[backend] / results['legacy']) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
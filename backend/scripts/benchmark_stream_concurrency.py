@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+流式聊天并发基准测试
+
+对比两种上游读取方式在单个事件循环内的并发吞吐:
+- blocking: 旧实现，在async函数中同步迭代cozepy的同步流，阻塞事件循环
+- async:    当前实现，CozeService.chat_stream 逐个await上游事件
+
+上游由 mock_coze 模拟，每个SSE事件之间有固定延迟，不访问真实网络。
+
+用法:
+    python scripts/benchmark_stream_concurrency.py --concurrency 20 --event-delay 0.005
+"""
+
+import argparse
+import asyncio
+import time
+
+from mock_coze import async_transport, build_chat_events, install_mock_client, mock_config, sync_client, sync_transport
+
+from cozepy import Message
+
+from app.models.chat import ChatRequest, StreamEventType
+from app.services.coze_service import CozeService
+from app.utils.logger import setup_logger
+
+
+async def run_blocking(events, concurrency: int, event_delay: float) -> float:
+    """旧实现：同步迭代上游流"""
+    client = sync_client(sync_transport(events, event_delay))
+    config = mock_config()
+
+    async def one_stream():
+        count = 0
+        stream_response = client.chat.stream(
+            bot_id=config.bot_id,
+            user_id=config.default_user_id,
+            additional_messages=[Message.build_user_question_text("基准测试")],
+        )
+        for event in stream_response:
+            count += 1
+        return count
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_stream() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def run_async(events, concurrency: int, event_delay: float) -> float:
+    """当前实现：CozeService.chat_stream"""
+    service = CozeService()
+    install_mock_client(service, async_transport(events, event_delay))
+
+    async def one_stream(index: int):
+        request = ChatRequest(message="基准测试", user_id=f"bench_{index}")
+        async for event in service.chat_stream(request):
+            if event.type == StreamEventType.ERROR:
+                raise RuntimeError(event.error)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_stream(i) for i in range(concurrency)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式聊天并发基准测试")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发流数量")
+    parser.add_argument("--event-delay", type=float, default=0.005, help="上游事件间隔(秒)")
+    args = parser.parse_args()
+
+    setup_logger(level="WARNING")
+    events = build_chat_events()
+    print(f"每个流 {len(events)} 个上游事件，事件间隔 {args.event_delay * 1000:.1f}ms，并发 {args.concurrency}")
+
+    for name, runner in (("blocking", run_blocking), ("async", run_async)):
+        elapsed = asyncio.run(runner(events, args.concurrency, args.event_delay))
+        print(f"{name:<9} 总耗时 {elapsed:7.2f}秒  吞吐 {args.concurrency / elapsed:8.2f} 流/秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""
+本地模拟的Coze上游，用于基准测试脚本
+
+通过httpx.MockTransport模拟 /v3/chat 的SSE流式响应，不访问真实网络。
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import List, Optional
+
+import httpx
+
+# 将backend目录加入模块搜索路径，便于脚本直接导入app包
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from cozepy import AsyncCoze, AsyncTokenAuth, AsyncHTTPClient, Coze, TokenAuth, SyncHTTPClient  # noqa: E402
+
+from app.models.config import CozeConfig  # noqa: E402
+
+MOCK_BASE_URL = "https://mock.coze.local"
+
+# 默认回复：模拟逐字输出的中文回答，末尾带引用段落
+DEFAULT_ANSWER = (
+    "根据手术记录，本例腹腔镜胆囊切除术整体操作规范。"
+    "术中对胆囊三角的解剖较为清晰，但夹闭胆囊管前未充分确认关键安全视野。"
+    "建议在后续手术中严格执行CVS标准，并注意电凝能量的使用时长。"
+    "\n\n[1] [腹腔镜胆囊切除术安全共识](https://example.org/cvs)"
+)
+DEFAULT_FOLLOW_UPS = ["如何确认关键安全视野？", "术后胆漏如何处理？"]
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event:{event}\ndata:{json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def build_chat_events(
+    answer: str = DEFAULT_ANSWER,
+    follow_ups: Optional[List[str]] = None,
+    chunk_chars: int = 1,
+) -> List[str]:
+    """
+    构建一次完整对话的SSE事件文本列表
+
+    Args:
+        answer: 回答全文
+        follow_ups: 建议问题列表
+        chunk_chars: 每个delta事件包含的字符数
+
+    Returns:
+        SSE事件字符串列表
+    """
+    follow_ups = DEFAULT_FOLLOW_UPS if follow_ups is None else follow_ups
+    chat = {"id": "chat_mock", "conversation_id": "conv_mock", "bot_id": "bot_mock"}
+    message = {
+        "id": "msg_mock",
+        "conversation_id": "conv_mock",
+        "chat_id": "chat_mock",
+        "role": "assistant",
+        "type": "answer",
+        "content_type": "text",
+    }
+
+    events = [
+        _sse("conversation.chat.created", {**chat, "status": "created"}),
+        _sse("conversation.chat.in_progress", {**chat, "status": "in_progress"}),
+    ]
+    for i in range(0, len(answer), chunk_chars):
+        events.append(_sse("conversation.message.delta", {**message, "content": answer[i:i + chunk_chars]}))
+    events.append(_sse("conversation.message.completed", {**message, "content": answer}))
+    for question in follow_ups:
+        events.append(_sse("conversation.message.completed", {**message, "type": "follow_up", "content": question}))
+    events.append(_sse("conversation.chat.completed", {
+        **chat,
+        "status": "completed",
+        "usage": {"token_count": len(answer) + 100, "output_count": len(answer), "input_count": 100},
+    }))
+    events.append('event:done\ndata:"[DONE]"\n\n')
+    return events
+
+
+def async_transport(events: List[str], event_delay: float = 0.01, first_byte_delay: float = 0.0) -> httpx.MockTransport:
+    """构建以asyncio.sleep模拟逐事件延迟的异步传输层"""
+
+    async def stream():
+        if first_byte_delay:
+            await asyncio.sleep(first_byte_delay)
+        for event in events:
+            await asyncio.sleep(event_delay)
+            yield event.encode("utf-8")
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=stream())
+
+    return httpx.MockTransport(handler)
+
+
+def sync_transport(events: List[str], event_delay: float = 0.01, first_byte_delay: float = 0.0) -> httpx.MockTransport:
+    """构建以time.sleep模拟逐事件延迟的同步传输层（对应旧的同步SDK路径）"""
+
+    def stream():
+        if first_byte_delay:
+            time.sleep(first_byte_delay)
+        for event in events:
+            time.sleep(event_delay)
+            yield event.encode("utf-8")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=stream())
+
+    return httpx.MockTransport(handler)
+
+
+def polling_transport(answer: str = DEFAULT_ANSWER, generation_time: float = 1.0,
+                      request_latency: float = 0.0) -> httpx.MockTransport:
+    """
+    构建模拟非流式接口(创建对话、查询状态、拉取消息列表)的异步传输层
+
+    Args:
+        answer: 回答全文
+        generation_time: 对话创建后多久变为completed(秒)
+        request_latency: 每次请求的往返延迟(秒)
+    """
+    created_at = {}
+    chat = {"conversation_id": "conv_mock", "bot_id": "bot_mock"}
+    usage = {"token_count": len(answer) + 100, "output_count": len(answer), "input_count": 100}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request_latency:
+            await asyncio.sleep(request_latency)
+        path = request.url.path
+        if path == "/v3/chat":
+            chat_id = f"chat_{len(created_at)}"
+            created_at[chat_id] = time.monotonic()
+            data = {**chat, "id": chat_id, "status": "in_progress"}
+        elif path == "/v3/chat/retrieve":
+            chat_id = request.url.params["chat_id"]
+            done = time.monotonic() - created_at[chat_id] >= generation_time
+            data = {**chat, "id": chat_id, "status": "completed" if done else "in_progress"}
+            if done:
+                data["usage"] = usage
+        elif path == "/v3/chat/message/list":
+            data = [{
+                "id": "msg_mock",
+                "conversation_id": "conv_mock",
+                "chat_id": request.url.params["chat_id"],
+                "bot_id": "bot_mock",
+                "role": "assistant",
+                "type": "answer",
+                "content": answer,
+                "content_type": "text",
+            }]
+        else:
+            return httpx.Response(404)
+        return httpx.Response(200, json={"code": 0, "msg": "", "data": data})
+
+    return httpx.MockTransport(handler)
+
+
+def mock_config(doctor_type: Optional[str] = None) -> CozeConfig:
+    """模拟的医生配置"""
+    return CozeConfig(api_token="mock_token", base_url=MOCK_BASE_URL, bot_id=f"bot_{doctor_type or 'default'}")
+
+
+def install_mock_client(service, transport: httpx.MockTransport, doctor_type: Optional[str] = None) -> None:
+    """
+    将模拟传输层注入到CozeService中
+
+    Args:
+        service: CozeService实例
+        transport: 异步模拟传输层
+        doctor_type: 医生类型
+    """
+    service._configs[doctor_type] = mock_config(doctor_type)
+    service._coze_clients[doctor_type] = AsyncCoze(
+        auth=AsyncTokenAuth(token="mock_token"),
+        base_url=MOCK_BASE_URL,
+        http_client=AsyncHTTPClient(transport=transport),
+    )
+
+
+def sync_client(transport: httpx.MockTransport) -> Coze:
+    """构建使用同步模拟传输层的Coze同步客户端"""
+    return Coze(
+        auth=TokenAuth(token="mock_token"),
+        base_url=MOCK_BASE_URL,
+        http_client=SyncHTTPClient(transport=transport),
+    )
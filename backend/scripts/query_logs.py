@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+"""
+按请求ID或对话ID查询结构化日志
+
+读取logging.structured写入的JSON-lines日志及其索引，包括已轮转和压缩的文件，只读取命中的行。
+
+用法:
+    python scripts/query_logs.py --request-id stream_user-1_123_abcd1234
+    python scripts/query_logs.py --conversation-id conv-1 --json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from app.utils.log_store import query_logs  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按请求ID或对话ID查询结构化日志")
+    parser.add_argument("--request-id", help="请求ID")
+    parser.add_argument("--conversation-id", help="对话ID")
+    parser.add_argument("--log-file", default=os.path.join(BACKEND_DIR, "logs", "app.jsonl"), help="JSON-lines日志文件")
+    parser.add_argument("--json", action="store_true", help="原样输出JSON行")
+    args = parser.parse_args()
+    if not args.request_id and not args.conversation_id:
+        parser.error("需要提供 --request-id 或 --conversation-id")
+
+    for entry in query_logs(args.log_file, args.request_id, args.conversation_id):
+        if args.json:
+            print(json.dumps(entry, ensure_ascii=False))
+        else:
+            print(f"{entry['time']} | {entry['level']: <8} | {entry['request_id']} | "
+                  f"{entry['module']}:{entry['function']}:{entry['line']} - {entry['message']}")
+
+
+if __name__ == "__main__":
+    main()
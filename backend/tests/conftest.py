@@ -0,0 +1,12 @@
+"""
+测试公共配置
+"""
+
+import os
+import sys
+
+# 将backend目录加入模块搜索路径，使测试可以导入app包和scripts中的模拟上游
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (BACKEND_DIR, os.path.join(BACKEND_DIR, "scripts")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,89 @@
+"""
+准入控制测试
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.admission_service import AdmissionRejectedError, AdmissionService, DoctorGate
+from app.services.config_service import config_service
+
+
+def test_queue_full_is_rejected_with_429():
+    async def scenario():
+        gate = DoctorGate("wang", max_concurrency=1, max_queue_size=1, queue_timeout=5)
+        first = await gate.acquire()
+        waiting = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        assert gate.queue_depth == 1
+
+        with pytest.raises(AdmissionRejectedError) as exc_info:
+            await gate.acquire()
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.retry_after >= 1
+
+        # 释放名额后直接转交给队首等待者
+        first.release()
+        second = await waiting
+        assert gate.active == 1
+        second.release()
+        assert gate.active == 0
+        assert gate.get_stats()["rejected_queue_full"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_is_rejected_with_503():
+    async def scenario():
+        gate = DoctorGate(None, max_concurrency=1, max_queue_size=5, queue_timeout=0.05)
+        ticket = await gate.acquire()
+        with pytest.raises(AdmissionRejectedError) as exc_info:
+            await gate.acquire()
+        assert exc_info.value.status_code == 503
+        assert gate.queue_depth == 0
+
+        ticket.release()
+        ticket.release()  # 重复释放不影响计数
+        assert gate.active == 0
+        assert gate.get_stats()["rejected_timeout"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        gate = DoctorGate(None, max_concurrency=1, max_queue_size=5, queue_timeout=5)
+        ticket = await gate.acquire()
+        waiting = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert gate.queue_depth == 0
+
+        ticket.release()
+        assert gate.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_unknown_doctor_types_share_the_default_gate(monkeypatch):
+    default = config_service.get_config().coze.default
+    monkeypatch.setattr(default, "max_concurrency", 1)
+    monkeypatch.setattr(default, "max_queue_size", 0)
+
+    async def scenario():
+        service = AdmissionService()
+        ticket = await service.acquire("default")
+        rejected = []
+        for doctor_type in ["default", None, "x0", "x1", "get_config"]:
+            with pytest.raises(AdmissionRejectedError) as exc_info:
+                await service.acquire(doctor_type)
+            rejected.append(exc_info.value.status_code)
+        ticket.release()
+        return rejected, service.get_stats()
+
+    rejected, stats = asyncio.run(scenario())
+    assert rejected == [429] * 5
+    assert list(stats) == ["default"] and stats["default"]["active"] == 0
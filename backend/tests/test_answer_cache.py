@@ -0,0 +1,117 @@
+"""
+回答缓存测试
+"""
+
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+from mock_coze import DEFAULT_ANSWER, DEFAULT_FOLLOW_UPS, async_transport, build_chat_events, install_mock_client
+
+from app.models.chat import ChatMessage, ChatRequest, MessageRole, StreamEventType
+from app.models.config import AnswerCacheConfig
+from app.services.answer_cache import AnswerCache, CachedAnswer, make_cache_key
+from app.services.coze_service import CozeService
+
+
+def make_request(message="如何确认关键安全视野？", **kwargs):
+    return ChatRequest(message=message, user_id="user-1", **kwargs)
+
+
+def test_cache_key_normalizes_message_and_form_data():
+    base = make_cache_key(make_request("如何确认 关键安全视野？", doctor_type="wang", form_data={"a": 1, "b": 2}))
+
+    assert make_cache_key(make_request("  如何确认\n关键安全视野?", doctor_type="Wang ",
+                                       form_data={"b": 2, "a": 1})) == base
+    assert make_cache_key(make_request("如何确认 关键安全视野？", doctor_type="chen",
+                                       form_data={"a": 1, "b": 2})) != base
+    assert make_cache_key(make_request(context=[ChatMessage(role=MessageRole.USER, content="上一问")])) is None
+
+
+def test_replay_is_chunked_and_ends_with_follow_ups():
+    cache = AnswerCache(AnswerCacheConfig(enabled=True, replay_chunk_chars=4, replay_interval_ms=1))
+    answer = CachedAnswer("0123456789", usage={"token_count": 3}, follow_up_questions=["下一步？"])
+
+    async def collect(paced):
+        return [event async for event in cache.replay(answer, paced)]
+
+    paced = asyncio.run(collect(True))
+    assert [event.content for event in paced[:-1]] == ["0123", "4567", "89"]
+    assert paced[-1].type == StreamEventType.COMPLETE
+    assert paced[-1].follow_up_questions == ["下一步？"]
+    assert paced[-1].usage == {"token_count": 3}
+
+    unpaced = asyncio.run(collect(False))
+    assert [event.content for event in unpaced[:-1]] == ["0123456789"]
+
+
+def make_service(requests):
+    transport = async_transport(build_chat_events(chunk_chars=9), event_delay=0)
+    handler = transport.handler
+
+    def counting_handler(request):
+        requests.append(request.url.path)
+        return handler(request)
+
+    transport.handler = counting_handler
+    service = CozeService()
+    install_mock_client(service, transport)
+    service._answer_cache = AnswerCache(AnswerCacheConfig(enabled=True, replay_interval_ms=0))
+    return service
+
+
+def test_repeated_question_is_replayed_without_upstream_request():
+    requests = []
+    service = make_service(requests)
+
+    async def run():
+        first = [event async for event in service.chat_stream(make_request())]
+        cached = service.get_cached_answer(make_request())
+        second = [event async for event in service.replay_answer(make_request(), cached)]
+        return first, cached, second
+
+    first, cached, second = asyncio.run(run())
+    assert cached is not None
+    assert len(requests) == 1
+
+    def summary(events):
+        content = "".join(event.content for event in events if event.type == StreamEventType.MESSAGE)
+        return content, events[-1].type, events[-1].follow_up_questions
+
+    assert summary(second) == summary(first) == (DEFAULT_ANSWER, StreamEventType.COMPLETE, DEFAULT_FOLLOW_UPS)
+    assert service.get_answer_cache_stats()["hits"] == 1
+
+
+def test_replayed_answer_still_yields_references(monkeypatch):
+    from app.main import app
+
+    requests = []
+    service = make_service(requests)
+    with TestClient(app) as client:
+        monkeypatch.setattr("app.api.chat.coze_service", service)
+        client.post("/api/chat/message", json={"message": make_request().message, "user_id": "user-1",
+                                               "conversation_id": "conv-1"})
+        response = client.post("/api/chat/stream-without-references",
+                               json={"message": make_request().message, "user_id": "user-1",
+                                     "conversation_id": "conv-2"})
+        references = client.get("/api/chat/references/conv-2").json()
+
+    events = [json.loads(line[6:]) for line in response.text.split("\n") if line.startswith("data: ")]
+    assert len(requests) == 1
+    body = "".join(event.get("content") or "" for event in events if event["type"] == "message")
+    assert body == DEFAULT_ANSWER.split("\n\n[1]")[0]
+    assert references["references"].startswith("[1]")
+
+
+def test_reload_invalidates_cache():
+    requests = []
+    service = make_service(requests)
+
+    async def run():
+        await service.chat_single(make_request())
+        service.reload_client()
+        return service.get_cached_answer(make_request())
+
+    # 重载后使用配置文件中的缓存配置(默认未启用)，且原有条目已清空
+    assert asyncio.run(run()) is None
+    assert service.get_answer_cache_stats()["entries"] == 0
@@ -0,0 +1,93 @@
+"""
+批量聊天测试
+"""
+
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from app.models.chat import ChatRequest, ChatResponse
+from app.services.batch_service import BatchService, batch_service
+
+
+class FakeCozeService:
+    """按消息内容决定耗时的假服务，记录每个医生的最大并发"""
+
+    def __init__(self):
+        self.active = {}
+        self.peak = {}
+
+    async def chat_single(self, request):
+        doctor = request.doctor_type
+        self.active[doctor] = self.active.get(doctor, 0) + 1
+        self.peak[doctor] = max(self.peak.get(doctor, 0), self.active[doctor])
+        try:
+            await asyncio.sleep(float(request.message) / 1000)
+        finally:
+            self.active[doctor] -= 1
+        if request.message == "13":
+            return ChatResponse(content="", conversation_id="c", user_id=request.user_id, error="上游错误")
+        return ChatResponse(content=f"答:{request.message}", conversation_id=f"conv-{request.message}",
+                            user_id=request.user_id, usage={"token_count": 1})
+
+    async def chat_single_without_references(self, request):
+        return await self.chat_single(request)
+
+
+def make_requests(delays, doctor_type=None):
+    return [ChatRequest(message=str(delay), user_id="qa", doctor_type=doctor_type) for delay in delays]
+
+
+def test_results_arrive_in_completion_order_with_per_doctor_cap():
+    fake = FakeCozeService()
+    service = BatchService(fake)
+    requests = make_requests([40, 5, 20, 13], "wang") + make_requests([10, 10, 10], "chen")
+
+    async def run():
+        return [line async for line in service.run(requests, concurrency=2)]
+
+    lines = asyncio.run(run())
+    results, summary = lines[:-1], lines[-1]
+
+    assert sorted(result.index for result in results) == list(range(7))
+    wang_order = [result.index for result in results if result.doctor_type == "wang"]
+    assert wang_order.index(1) < wang_order.index(0)
+    assert fake.peak == {"wang": 2, "chen": 2}
+
+    failed = [result for result in results if result.error]
+    assert [result.index for result in failed] == [3]
+    assert all(result.elapsed_ms > 0 for result in results)
+    assert any(result.wait_ms > 0 for result in results)
+    assert (summary.type, summary.total, summary.succeeded, summary.failed) == ("summary", 7, 6, 1)
+
+
+def test_batch_endpoint_streams_ndjson(monkeypatch):
+    from app.main import app
+
+    monkeypatch.setattr(batch_service, "_service", FakeCozeService())
+    payload = {"requests": [{"message": "5", "user_id": "qa"}, {"message": "1", "user_id": "qa"}]}
+
+    with TestClient(app) as client:
+        response = client.post("/api/chat/batch", json=payload)
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["type"] for line in lines] == ["result", "result", "summary"]
+    assert lines[0]["content"] == "答:1"
+    assert lines[0]["usage"] == {"token_count": 1}
+    assert lines[-1]["succeeded"] == 2
+
+
+def test_batch_size_is_capped(monkeypatch):
+    from app.main import app
+    from app.services.config_service import config_service
+
+    monkeypatch.setattr(batch_service, "_service", FakeCozeService())
+    with TestClient(app) as client:
+        monkeypatch.setattr(config_service.get_config().batch, "max_items", 2)
+        over_config = client.post("/api/chat/batch", json={"requests": [{"message": "1", "user_id": "qa"}] * 3})
+        over_model = client.post("/api/chat/batch", json={"requests": [{"message": "1", "user_id": "qa"}] * 1001})
+
+    assert over_config.status_code == 413
+    assert over_model.status_code == 422
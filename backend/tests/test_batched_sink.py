@@ -0,0 +1,63 @@
+"""
+有界队列日志输出测试
+"""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils.logger import BatchedSink
+
+
+def message(text, level=10):
+    line = type("Message", (str,), {})(text + "\n")
+    line.record = {"level": SimpleNamespace(no=level)}
+    return line
+
+
+def blocked_sink(**kwargs):
+    """后台写入被阻塞的输出，便于填满队列"""
+    release = threading.Event()
+    written = []
+
+    def write(text):
+        release.wait()
+        written.append(text)
+
+    sink = BatchedSink(write, flush_interval=0.01, **kwargs)
+    sink.write(message("占住写入线程"))
+    while sink.get_stats()["queued"]:
+        pass
+    return sink, release, written
+
+
+@pytest.mark.parametrize("overflow, kept", [
+    ("drop", ["1", "2", "3", "错误"]),
+    ("drop_oldest", ["3", "4", "5", "错误"]),
+    ("sample", ["1", "3", "5", "错误"]),
+])
+def test_overflow_policies_never_block_and_keep_warnings(overflow, kept):
+    # 队列满时错误日志挤掉最早的一条
+    sink, release, written = blocked_sink(queue_size=4, overflow=overflow, sample_rate=2)
+    for index in range(6):
+        sink.write(message(str(index)))
+    sink.write(message("错误", level=40))
+    release.set()
+    sink.stop()
+
+    lines = "".join(written).splitlines()
+    assert lines[0] == "占住写入线程"
+    assert [line for line in lines[1:] if "丢弃" not in line] == kept
+    assert lines[-1] == f"日志队列已满，累计丢弃 {sink.dropped} 条日志"
+
+
+def test_writes_in_batches_and_flushes_on_stop():
+    batches = []
+    sink = BatchedSink(batches.append, batch_size=3, flush_interval=10)
+    for index in range(7):
+        sink.write(message(str(index)))
+    sink.stop()
+    assert "".join(batches).split() == [str(index) for index in range(7)]
+    assert all(batch.count("\n") <= 3 for batch in batches)
+    assert sink.get_stats() == {"queued": 0, "written": 7, "dropped": 0, "write_errors": 0}
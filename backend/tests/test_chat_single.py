@@ -0,0 +1,96 @@
+"""
+单次聊天测试
+"""
+
+import asyncio
+
+import httpx
+from mock_coze import DEFAULT_ANSWER, async_transport, build_chat_events, install_mock_client
+
+from app.models.chat import ChatRequest
+from app.services.coze_service import CozeService
+from app.utils.logger import get_logger
+
+
+def run_chat(transport, method="chat_single"):
+    service = CozeService()
+    install_mock_client(service, transport)
+    request = ChatRequest(message="问题", user_id="user-1", conversation_id="conv-1")
+    return asyncio.run(getattr(service, method)(request))
+
+
+def test_returns_full_answer_from_single_stream_request():
+    requests = []
+    transport = async_transport(build_chat_events(chunk_chars=7), event_delay=0)
+    handler = transport.handler
+
+    def counting_handler(request):
+        requests.append(request.url.path)
+        return handler(request)
+
+    transport.handler = counting_handler
+    response = run_chat(transport)
+
+    assert response.error is None
+    assert response.content == DEFAULT_ANSWER
+    assert response.conversation_id == "conv-1"
+    assert response.usage["output_count"] == len(DEFAULT_ANSWER)
+    assert requests == ["/v3/chat"]
+
+
+def test_generated_conversation_id_matches_logs():
+    records = []
+    handler_id = get_logger("test").add(lambda message: records.append(message.record["extra"]), level="DEBUG")
+    service = CozeService()
+    install_mock_client(service, async_transport(build_chat_events(chunk_chars=20), event_delay=0))
+    try:
+        response = asyncio.run(service.chat_single(ChatRequest(message="问题", user_id="user-1")))
+    finally:
+        get_logger("test").remove(handler_id)
+
+    logged = {extra["conversation_id"] for extra in records if extra.get("conversation_id")}
+    assert response.conversation_id and logged == {response.conversation_id}
+
+
+def test_without_references_strips_reference_section():
+    response = run_chat(async_transport(build_chat_events(chunk_chars=5), event_delay=0),
+                        method="chat_single_without_references")
+
+    assert response.content == DEFAULT_ANSWER.split("\n\n[1]")[0]
+
+
+def test_upstream_error_is_reported():
+    def handler(request):
+        return httpx.Response(401, json={"code": 4100, "msg": "authentication is invalid"})
+
+    response = run_chat(httpx.MockTransport(handler))
+
+    assert response.content == ""
+    assert "4100" in response.error
+    assert response.conversation_id == "conv-1"
+
+
+def test_stalled_upstream_is_aborted_after_idle_timeout():
+    events = build_chat_events(chunk_chars=7)
+
+    async def stalled_stream():
+        for event in events[:4]:
+            yield event.encode("utf-8")
+        await asyncio.sleep(30)
+
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=stalled_stream())
+
+    service = CozeService()
+    install_mock_client(service, httpx.MockTransport(handler))
+    service._configs[None].timeout = 1
+    request = ChatRequest(message="问题", user_id="user-1", conversation_id="conv-1")
+
+    async def scenario():
+        start = asyncio.get_running_loop().time()
+        response = await service.chat_single(request)
+        return response, asyncio.get_running_loop().time() - start
+
+    response, elapsed = asyncio.run(scenario())
+    assert "上游响应超时" in response.error
+    assert elapsed < 3
@@ -0,0 +1,35 @@
+"""
+流式事件解码器测试
+"""
+
+from types import SimpleNamespace
+
+from benchmark_event_decoder import legacy_decode, record_events
+from cozepy import ChatEventType
+
+from app.services.event_decoder import COMPLETE, CONTENT, FOLLOW_UP, IGNORED, ChatEventDecoder
+
+
+def test_matches_legacy_extraction_on_recorded_stream():
+    for chunk_chars in (1, 7):
+        events = record_events(chunk_chars)
+        assert ChatEventDecoder().decode_all(events) == [legacy_decode(event) for event in events]
+
+
+def test_alternative_event_shapes():
+    decoder = ChatEventDecoder()
+    delta = SimpleNamespace(event=ChatEventType.CONVERSATION_MESSAGE_DELTA, data=SimpleNamespace(content="你好"))
+    follow_up = SimpleNamespace(event=ChatEventType.CONVERSATION_MESSAGE_COMPLETED, type="follow_up", content="下一步？")
+    usage = SimpleNamespace(token_count=3, input_count=1, output_count=2)
+    completed = SimpleNamespace(event=ChatEventType.CONVERSATION_CHAT_COMPLETED, usage=usage)
+
+    assert decoder.decode(delta) == (CONTENT, "你好")
+    assert decoder.decode(follow_up) == (FOLLOW_UP, "下一步？")
+    assert decoder.decode(completed) == (COMPLETE, {"token_count": 3, "input_count": 1, "output_count": 2})
+    assert decoder.decode(SimpleNamespace(content="无类型")) == (CONTENT, "无类型")
+    assert decoder.decode(SimpleNamespace(event=ChatEventType.CONVERSATION_CHAT_CREATED)) == (IGNORED, None)
+
+    # 已解析的访问路径失效后重新探测
+    other_delta = SimpleNamespace(event=ChatEventType.CONVERSATION_MESSAGE_DELTA, delta=SimpleNamespace(content="变"))
+    assert decoder.decode(other_delta) == (CONTENT, "变")
+    assert decoder.decode(delta) == (CONTENT, "你好")
@@ -0,0 +1,92 @@
+"""
+共享HTTP连接池测试
+"""
+
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.models.config import CozeConfig, HttpPoolConfig
+from app.services.http_pool_service import HttpPoolService
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+
+
+def make_service(pool_config):
+    service = HttpPoolService()
+    service._get_pool_config = lambda: pool_config
+    return service
+
+
+def test_clients_share_one_transport(server_url):
+    async def run():
+        service = make_service(HttpPoolConfig(http2=False))
+        clients = [service.create_client(CozeConfig(api_token="t", bot_id=bot_id)) for bot_id in ("a", "b")]
+        for _ in range(3):
+            for client in clients:
+                assert (await client.get(server_url)).text == "ok"
+        stats = service.get_stats()
+        await service.aclose()
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats["initialized"] and stats["requests_total"] == 6
+    assert stats["connections_opened"] == 1 and stats["in_flight"] == 0
+    assert stats["retired_pools"] == 0
+
+
+def test_reload_closes_retired_pool_after_streams_drain(server_url):
+    async def run():
+        pool_config = HttpPoolConfig(http2=False)
+        service = make_service(pool_config)
+        client = service.create_client(CozeConfig(api_token="t", bot_id="a"))
+        old = service.get_transport()
+        response = await client.send(client.build_request("GET", server_url), stream=True)
+
+        service._get_pool_config = lambda: pool_config.model_copy(update={"max_connections": 10})
+        await service.reload()
+        draining = (old.closed, service.get_stats())
+        await response.aclose()
+        drained = (old.closed, service.get_stats())
+
+        # 没有进行中的请求时立即关闭
+        idle = service.get_transport()
+        service._get_pool_config = lambda: pool_config
+        await service.reload()
+        await service.aclose()
+        return draining, drained, idle.closed
+
+    draining, drained, idle_closed = asyncio.run(run())
+    assert draining[0] is False and draining[1]["retired_pools"] == 1 and draining[1]["retired_in_flight"] == 1
+    assert drained[0] is True and drained[1]["retired_pools"] == 0
+    assert idle_closed
+
+
+def test_pool_stats_endpoint():
+    from app.main import app
+
+    with TestClient(app) as client:
+        data = client.get("/api/chat/pool-stats").json()
+    assert data["success"] and "initialized" in data["data"] and data["data"]["retired_pools"] == 0
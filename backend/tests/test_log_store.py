@@ -0,0 +1,83 @@
+"""
+结构化日志存储测试
+"""
+
+import os
+import threading
+
+from loguru import logger
+
+from app.models.config import LogConfig
+from app.utils.log_store import LogStore, query_logs, rotated_files
+from app.utils.logger import get_log_store, request_id_var, set_conversation_id, set_request_id, setup_logger
+
+
+def write_logs(store, count):
+    handler_id = logger.add(store, level="DEBUG", format="{message}")
+    try:
+        for index in range(count):
+            set_request_id(f"req-{index % 3}")
+            set_conversation_id("conv-a" if index % 3 == 0 and index > 50 else "")
+            logger.bind(name="test").info(f"第{index}条日志 " + "x" * 40)
+        request_id_var.set("")
+    finally:
+        logger.remove(handler_id)
+
+
+def test_query_across_compressed_rotations(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.utils.log_store.GZIP_BLOCK_SIZE", 512)
+    path = str(tmp_path / "app.jsonl")
+    store = LogStore(path, max_bytes=4096, backups=100)
+    write_logs(store, 300)
+    store.stop()
+
+    rotated = rotated_files(path)
+    assert len(rotated) > 3 and all(file.endswith(".jsonl.gz") for file in rotated)
+    entries = query_logs(path, request_id="req-1")
+    assert [entry["message"].split()[0] for entry in entries] == [f"第{index}条日志" for index in range(1, 300, 3)]
+    assert entries[0]["logger"] == "test" and entries[0]["level"] == "INFO"
+
+
+def test_conversation_query_includes_earlier_lines_of_its_requests(tmp_path):
+    path = str(tmp_path / "app.jsonl")
+    store = LogStore(path, max_bytes=1 << 30)
+    write_logs(store, 60)
+    entries = query_logs(path, conversation_id="conv-a", store=store)
+    store.stop()
+    # req-0在第51条之后才带有对话ID，之前的日志也一并返回
+    assert [entry["message"].split()[0] for entry in entries] == [f"第{index}条日志" for index in range(0, 60, 3)]
+    assert entries[-1]["conversation_id"] == "conv-a" and entries[0]["conversation_id"] is None
+
+
+def test_prunes_old_rotations(tmp_path):
+    path = str(tmp_path / "app.jsonl")
+    store = LogStore(path, max_bytes=2048, backups=2, compress=False)
+    write_logs(store, 200)
+    store.stop()
+    assert len(rotated_files(path)) == 2
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [os.path.basename(file) + suffix for file in rotated_files(path) + [path] for suffix in ("", ".idx")]
+    )
+
+
+def test_sync_mode_writes_structured_logs_off_the_calling_thread(tmp_path, monkeypatch):
+    threads = []
+    write_messages = LogStore.write_messages
+
+    def recording_write_messages(self, messages):
+        threads.append(threading.current_thread())
+        write_messages(self, messages)
+
+    monkeypatch.setattr(LogStore, "write_messages", recording_write_messages)
+    setup_logger(level="INFO", log_file=str(tmp_path / "app.log"), log_config=LogConfig(mode="sync", structured=True))
+    try:
+        set_request_id("req-sync")
+        logger.bind(name="test").info("同步模式日志")
+        request_id_var.set("")
+        logger.complete()
+        entries = query_logs(str(tmp_path / "app.jsonl"), request_id="req-sync", store=get_log_store())
+    finally:
+        setup_logger(level="INFO")
+
+    assert [entry["message"] for entry in entries] == ["同步模式日志"]
+    assert threads and threading.main_thread() not in threads
@@ -0,0 +1,92 @@
+"""
+Prometheus指标测试
+"""
+
+import asyncio
+import re
+
+from fastapi.testclient import TestClient
+from mock_coze import async_transport, build_chat_events, install_mock_client
+from test_resilience import collect, flaky_transport, make_service
+
+from app.services import metrics
+from app.services.coze_service import coze_service
+
+
+def sample(text, name, **labels):
+    """从导出文本中取出一个样本值"""
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf"^{re.escape(name)}\{{{re.escape(label_text)}\}} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.MetricsRegistry()
+    histogram = registry.register(metrics.Histogram("demo_seconds", "示例", (0.1, 1)))
+    child = histogram.labels("wang", "/api/chat/stream")
+    for value in (0.05, 0.5, 3):
+        child.observe(value)
+    counter = registry.register(metrics.Counter("demo_total", "示例"))
+    counter.labels(None, 'a"b').inc(2)
+
+    assert registry.render().splitlines() == [
+        "# HELP demo_seconds 示例",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{doctor_type="wang",endpoint="/api/chat/stream",le="0.1"} 1',
+        'demo_seconds_bucket{doctor_type="wang",endpoint="/api/chat/stream",le="1.0"} 2',
+        'demo_seconds_bucket{doctor_type="wang",endpoint="/api/chat/stream",le="+Inf"} 3',
+        'demo_seconds_sum{doctor_type="wang",endpoint="/api/chat/stream"} 3.55',
+        'demo_seconds_count{doctor_type="wang",endpoint="/api/chat/stream"} 3',
+        "# HELP demo_total 示例",
+        "# TYPE demo_total counter",
+        'demo_total{doctor_type="default",endpoint="a\\"b"} 2',
+    ]
+
+
+def test_stream_endpoint_records_latency_metrics(monkeypatch):
+    from app.main import app
+
+    labels = {"doctor_type": "default", "endpoint": "/api/chat/stream"}
+    monkeypatch.setattr(coze_service, "_answer_cache", None)
+    with TestClient(app) as client:
+        before = client.get("/api/metrics").text
+        install_mock_client(coze_service, async_transport(build_chat_events(chunk_chars=20), event_delay=0))
+        client.post("/api/chat/stream", json={"message": "问题", "user_id": "user-1"})
+        response = client.get("/api/metrics")
+
+    after = response.text
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    for name in ("chat_time_to_first_token_seconds_count", "chat_stream_duration_seconds_count",
+                 "chat_stream_frames_count"):
+        assert sample(after, name, **labels) - sample(before, name, **labels) == 1
+    assert sample(after, "chat_inter_token_gap_seconds_count", **labels) > sample(before, "chat_inter_token_gap_seconds_count", **labels)
+    assert sample(after, "chat_active_streams", **labels) == 0
+
+
+def test_unknown_doctor_type_lands_on_default_series(monkeypatch):
+    from app.main import app
+
+    labels = {"doctor_type": "default", "endpoint": "/api/chat/stream"}
+    monkeypatch.setattr(coze_service, "_answer_cache", None)
+    with TestClient(app) as client:
+        before = client.get("/api/metrics").text
+        install_mock_client(coze_service, async_transport(build_chat_events(chunk_chars=20), event_delay=0))
+        for doctor_type in ("x0", "x1"):
+            client.post("/api/chat/stream", json={"message": "问题", "user_id": "user-1", "doctor_type": doctor_type})
+        after = client.get("/api/metrics").text
+
+    name = "chat_stream_duration_seconds_count"
+    assert sample(after, name, **labels) - sample(before, name, **labels) == 2
+    assert 'doctor_type="x0"' not in after and 'doctor_type="x1"' not in after
+    assert metrics.doctor_label("wang") == "wang" and metrics.doctor_label("get_config") == "default"
+
+
+def test_upstream_retries_and_errors_are_counted():
+    retries = metrics.upstream_retries.labels(None, "-")
+    errors = metrics.upstream_errors.labels(None, "-")
+    start = (retries.value, errors.value)
+
+    asyncio.run(collect(make_service(flaky_transport(2, build_chat_events())[0])))
+    asyncio.run(collect(make_service(flaky_transport(100, build_chat_events())[0], max_retries=1)))
+
+    assert (retries.value - start[0], errors.value - start[1]) == (3, 1)
@@ -0,0 +1,105 @@
+"""
+流式引用段落分离器测试
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import re
+
+from app.api.chat import build_stream_pipeline
+from app.models.chat import ChatRequest, StreamEvent, StreamEventType
+from app.services.coze_service import coze_service
+from app.services.reference_splitter import ReferenceSplitter
+from app.utils.logger import StreamLogger
+from app.utils.sse_encoder import SSEEncoder
+
+MARKER = re.compile(r'\n\n\[\d+\]', re.ASCII)
+
+SAMPLES = [
+    "手术顺利。\n\n[1] 指南(https://example.org/a)\n[2] 共识",
+    "没有引用的回答\n\n结尾",
+    "三个换行\n\n\n[12] 引用",
+    "伪标记\n\n[a] 和 \n\n[] 和 \n[3]\n\n[45",
+    "\n\n[7]",
+    "正文\n\n[",
+    "正文\n\n[3",
+    "\n\n\n\n[1]后文\n\n[2]",
+    "",
+]
+
+
+def expected_split(text):
+    match = MARKER.search(text)
+    if match is None:
+        return text, ""
+    return text[:match.start()], text[match.start():]
+
+
+def run_splitter(chunks):
+    splitter = ReferenceSplitter()
+    body = "".join(splitter.feed(chunk) for chunk in chunks) + splitter.flush()
+    return body, splitter.references
+
+
+def split_at(text, positions):
+    bounds = [0, *positions, len(text)]
+    return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def test_every_single_split_position():
+    for text in SAMPLES:
+        for position in range(len(text) + 1):
+            assert run_splitter(split_at(text, [position])) == expected_split(text), (text, position)
+
+
+def test_every_pair_of_split_positions():
+    for text in SAMPLES:
+        for first, second in itertools.combinations_with_replacement(range(len(text) + 1), 2):
+            assert run_splitter(split_at(text, [first, second])) == expected_split(text), (text, first, second)
+
+
+def test_single_character_chunks():
+    for text in SAMPLES:
+        assert run_splitter(list(text)) == expected_split(text)
+
+
+def test_random_texts_and_splits():
+    rng = random.Random(20240518)
+    alphabet = "\n\n[]12a 文"
+    for _ in range(2000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 24)))
+        positions = sorted(rng.randint(0, len(text)) for _ in range(rng.randint(0, 6)))
+        assert run_splitter(split_at(text, positions)) == expected_split(text), (text, positions)
+
+
+def test_body_is_released_as_soon_as_marker_is_ruled_out():
+    splitter = ReferenceSplitter()
+    assert splitter.feed("结论\n") == "结论"
+    assert splitter.feed("\n") == ""
+    assert splitter.feed("下一段") == "\n\n下一段"
+    assert not splitter.in_references
+
+
+def test_stream_pipeline_strips_marker_split_across_deltas():
+    chunks = ["回答正文\n", "\n[", "1] 指南", "\n[2] 共识"]
+
+    async def fake_stream():
+        for chunk in chunks:
+            yield StreamEvent(type=StreamEventType.MESSAGE, content=chunk)
+        yield StreamEvent(type=StreamEventType.COMPLETE, done=True)
+
+    async def run():
+        request = ChatRequest(message="问题", user_id="user-1", conversation_id="conv-splitter")
+        pipeline = build_stream_pipeline(request, "req-1", "/api/chat/stream-without-references",
+                                         SSEEncoder("req-1"), StreamLogger("test"), "无引用流式聊天")
+        frames = [frame async for frame in pipeline.run(fake_stream())]
+        return frames, await coze_service.get_references("conv-splitter")
+
+    frames, references = asyncio.run(run())
+    events = [json.loads(frame[6:]) for frame in frames if frame.startswith(b"data: ")]
+    body = "".join(event["content"] for event in events if event["type"] == "message")
+    assert body == "回答正文"
+    assert events[-1]["type"] == "complete"
+    assert references["references"] == "[1] 指南\n[2] 共识"
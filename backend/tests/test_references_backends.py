@@ -0,0 +1,205 @@
+"""
+引用文本共享存储后端测试
+
+sqlite后端用两个实例模拟两个worker共用同一个数据库文件；redis后端连接本地的
+RESP协议替身服务。
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.models.config import ReferencesConfig
+from app.services.references_store import (
+    MemoryReferencesBackend,
+    RedisReferencesBackend,
+    ReferencesBackend,
+    SQLiteReferencesBackend,
+    create_references_backend,
+)
+from app.utils.resp_client import encode_command, read_reply
+
+
+class FakeRespServer:
+    """支持GET/SET(EX)/DEL/PING的最小RESP服务"""
+
+    def __init__(self):
+        self.data = {}
+        self.writers = set()
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        for writer in self.writers:
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            while True:
+                command = await read_reply(reader)
+                writer.write(self._dispatch([part.decode("utf-8") if isinstance(part, bytes) else part
+                                             for part in command]))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def _dispatch(self, command):
+        name = command[0].upper()
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name == "SET":
+            expires_at = time.monotonic() + int(command[4]) if len(command) > 4 else None
+            self.data[command[1]] = (command[2].encode("utf-8"), expires_at)
+            return b"+OK\r\n"
+        if name == "GET":
+            value, expires_at = self.data.get(command[1], (None, None))
+            if value is None or (expires_at is not None and expires_at <= time.monotonic()):
+                return b"$-1\r\n"
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if name == "DEL":
+            return b":%d\r\n" % int(self.data.pop(command[1], None) is not None)
+        return b"-ERR unknown command\r\n"
+
+
+def test_sqlite_backend_is_shared_between_workers(tmp_path):
+    config = ReferencesConfig(backend="sqlite", sqlite_path=str(tmp_path / "refs.db"))
+
+    async def run():
+        worker_a = create_references_backend(config)
+        worker_b = create_references_backend(config)
+        assert isinstance(worker_a, SQLiteReferencesBackend)
+
+        await worker_a.set("conv-1", "[1] 指南")
+        result = await worker_b.get("conv-1"), await worker_b.get("conv-2")
+        await worker_b.delete("conv-1")
+        result += (await worker_a.get("conv-1"),)
+        await worker_a.aclose()
+        await worker_b.aclose()
+        return result
+
+    assert asyncio.run(run()) == ("[1] 指南", None, None)
+
+
+def test_sqlite_backend_expires_and_evicts(tmp_path):
+    now = [1000.0]
+    config = ReferencesConfig(backend="sqlite", sqlite_path=str(tmp_path / "refs.db"),
+                              ttl_seconds=10, max_entries=2, max_bytes=0)
+
+    async def run():
+        backend = SQLiteReferencesBackend(config, clock=lambda: now[0])
+        await backend.set("a", "1")
+        now[0] += 1
+        await backend.set("b", "2")
+        now[0] += 1
+        await backend.get("a")  # a变为最近访问
+        now[0] += 1
+        await backend.set("c", "3")  # 淘汰b
+        evicted = await backend.get("b")
+        now[0] += 20
+        expired = await backend.get("c")
+        stats = await backend.get_stats()
+        await backend.aclose()
+        return evicted, expired, stats
+
+    evicted, expired, stats = asyncio.run(run())
+    assert evicted is None and expired is None
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 0
+
+
+def test_sqlite_backend_respects_byte_limit(tmp_path):
+    config = ReferencesConfig(backend="sqlite", sqlite_path=str(tmp_path / "refs.db"), max_bytes=40)
+
+    async def run():
+        backend = SQLiteReferencesBackend(config)
+        for index in range(10):
+            await backend.set(f"conv-{index}", "x" * 14)  # 每条20字节
+        stats = await backend.get_stats()
+        latest = await backend.get("conv-9")
+        await backend.aclose()
+        return stats, latest
+
+    stats, latest = asyncio.run(run())
+    assert stats["bytes"] <= 40
+    assert latest == "x" * 14
+
+
+def test_redis_backend_against_local_resp_server():
+    async def run():
+        server = await FakeRespServer().start()
+        config = ReferencesConfig(backend="redis", redis_url=f"redis://127.0.0.1:{server.port}/0", ttl_seconds=60)
+        worker_a = create_references_backend(config)
+        worker_b = create_references_backend(config)
+        assert isinstance(worker_b, RedisReferencesBackend)
+
+        await worker_a.set("conv-1", "[1] 共识")
+        shared = await worker_b.get("conv-1")
+        missing = await worker_b.get("conv-2")
+        stored_key = next(iter(server.data))
+        await worker_b.delete("conv-1")
+        deleted = await worker_a.get("conv-1")
+        stats = await worker_b.get_stats()
+
+        await worker_a.aclose()
+        await worker_b.aclose()
+        await server.stop()
+        return shared, missing, stored_key, deleted, stats
+
+    shared, missing, stored_key, deleted, stats = asyncio.run(run())
+    assert shared == "[1] 共识"
+    assert missing is None and deleted is None
+    assert stored_key == "johnson:references:conv-1"
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_resp_client_reconnects_after_server_restart():
+    async def run():
+        server = await FakeRespServer().start()
+        port = server.port
+        config = ReferencesConfig(backend="redis", redis_url=f"redis://127.0.0.1:{port}")
+        backend = RedisReferencesBackend(config)
+        await backend.set("conv-1", "a")
+        await server.stop()
+
+        try:
+            await backend.get("conv-1")
+        except (ConnectionError, OSError, asyncio.TimeoutError):
+            failed = True
+        else:
+            failed = False
+
+        restarted = FakeRespServer()
+        restarted.server = await asyncio.start_server(restarted._handle, "127.0.0.1", port)
+        await backend.set("conv-1", "b")
+        value = await backend.get("conv-1")
+        await backend.aclose()
+        await restarted.stop()
+        return failed, value
+
+    assert asyncio.run(run()) == (True, "b")
+
+
+def test_encode_command_and_default_backend():
+    assert encode_command("SET", "k", "值") == b"*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$3\r\n\xe5\x80\xbc\r\n"
+    assert isinstance(create_references_backend(ReferencesConfig()), MemoryReferencesBackend)
+
+
+def test_backend_must_implement_storage_methods():
+    class IncompleteBackend(ReferencesBackend):
+        async def get(self, conversation_id):
+            return None
+
+    with pytest.raises(TypeError):
+        IncompleteBackend(ReferencesConfig())
@@ -0,0 +1,72 @@
+"""
+引用文本存储测试
+"""
+
+from app.models.config import ReferencesConfig
+from app.services.references_store import ReferencesStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_set_and_counters():
+    store = ReferencesStore()
+    assert store.set("conv-1", "[1] 指南")
+    assert store.get("conv-1") == "[1] 指南"
+    assert store.get("conv-2") is None
+
+    stats = store.get_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    store = ReferencesStore(ttl_seconds=10, clock=clock)
+    store.set("old", "a")
+    clock.now = 5
+    store.set("new", "b")
+
+    clock.now = 10
+    assert store.get("old") is None
+    assert store.get("new") == "b"
+    assert store.get_stats()["expirations"] == 1
+
+
+def test_evicts_least_recently_used_entry():
+    store = ReferencesStore(max_entries=2)
+    store.set("a", "1")
+    store.set("b", "2")
+    store.get("a")
+    store.set("c", "3")
+
+    assert store.get("b") is None
+    assert store.get("a") == "1"
+    assert store.get_stats()["evictions"] == 1
+
+
+def test_total_bytes_stay_within_limit():
+    store = ReferencesStore(max_bytes=100)
+    for index in range(50):
+        store.set(f"conv-{index}", "引用" * 5)  # 每条 7~8 + 30 字节
+        assert store.total_bytes <= 100
+
+    assert len(store) == 2
+    assert not store.set("huge", "x" * 200)
+    assert store.get_stats()["rejected"] == 1
+
+
+def test_overwrite_updates_size_and_configure_shrinks():
+    store = ReferencesStore()
+    store.set("a", "x" * 10)
+    store.set("a", "x" * 4)
+    store.set("b", "y" * 4)
+    assert store.total_bytes == 10
+
+    store.configure(ReferencesConfig(ttl_seconds=60, max_entries=1, max_bytes=0))
+    assert len(store) == 1
+    assert store.get("b") == "y" * 4
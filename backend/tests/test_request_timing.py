@@ -0,0 +1,49 @@
+"""
+请求计时中间件测试
+"""
+
+import asyncio
+
+from starlette.applications import Starlette
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.utils.request_timing import RequestTimingMiddleware, RequestTimingStats
+
+
+def build_app(stats, headers=None):
+    async def chunks():
+        for chunk in (b"data: 1\n\n", b"data: 22\n\n"):
+            await asyncio.sleep(0.05)
+            yield chunk
+
+    async def stream(request):
+        return StreamingResponse(chunks(), media_type="text/event-stream", headers=headers)
+
+    app = Starlette(routes=[Route("/stream/{name}", stream)])
+    app.add_middleware(RequestTimingMiddleware, stats=stats)
+    return app
+
+
+def test_records_stream_duration_until_last_chunk():
+    stats = RequestTimingStats()
+    with TestClient(build_app(stats)) as client:
+        response = client.get("/stream/a")
+        client.get("/missing")
+
+    route_stats = stats.get_stats()
+    assert response.headers["x-request-id"].startswith("req_")
+    assert set(route_stats) == {"/stream/{name}", "unmatched"}
+    timing = route_stats["/stream/{name}"]
+    assert timing["bytes_sent"] == len(response.content) == 19
+    # 总耗时到最后一个数据块发出为止，而非响应头发出时
+    assert timing["avg_headers_ms"] < 50 <= timing["avg_first_byte_ms"] < 100 <= timing["avg_total_ms"]
+    assert route_stats["unmatched"]["requests"] == 1
+
+
+def test_keeps_request_id_set_by_endpoint():
+    stats = RequestTimingStats()
+    with TestClient(build_app(stats, headers={"X-Request-ID": "stream_1"})) as client:
+        response = client.get("/stream/a")
+    assert response.headers.get_list("x-request-id") == ["stream_1"]
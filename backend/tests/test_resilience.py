@@ -0,0 +1,86 @@
+"""
+重试策略与熔断器测试
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from mock_coze import build_chat_events, install_mock_client
+from app.models.chat import ChatRequest, StreamEventType
+from app.services.coze_service import CozeService
+from app.utils.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+def flaky_transport(failures: int, events):
+    """前failures次请求连接失败，之后正常返回SSE"""
+    calls = {"count": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls["count"] += 1
+        if calls["count"] <= failures:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content="".join(events).encode())
+
+    return httpx.MockTransport(handler), calls
+
+
+def make_service(transport, **config_updates) -> CozeService:
+    service = CozeService()
+    install_mock_client(service, transport)
+    service._configs[None] = service._configs[None].model_copy(
+        update={"retry_base_delay": 0.001, "retry_max_delay": 0.002, **config_updates}
+    )
+    return service
+
+
+async def collect(service: CozeService):
+    return [event async for event in service.chat_stream(ChatRequest(message="问题", user_id="tester"))]
+
+
+def test_stream_retries_failures_raised_during_iteration():
+    transport, calls = flaky_transport(2, build_chat_events(chunk_chars=10))
+    events = asyncio.run(collect(make_service(transport)))
+
+    assert calls["count"] == 3
+    assert events[-1].type == StreamEventType.COMPLETE
+    assert any(event.type == StreamEventType.MESSAGE for event in events)
+
+
+def test_breaker_opens_and_fails_fast():
+    transport, calls = flaky_transport(100, build_chat_events())
+    service = make_service(transport, max_retries=0, breaker_failure_threshold=2, breaker_reset_timeout=60)
+
+    for _ in range(2):
+        assert asyncio.run(collect(service))[-1].type == StreamEventType.ERROR
+    assert calls["count"] == 2
+
+    events = asyncio.run(collect(service))
+    assert events[-1].type == StreamEventType.ERROR
+    assert "熔断" in events[-1].error
+    assert calls["count"] == 2  # 熔断期间不再访问上游
+
+
+def test_half_open_probe_closes_breaker():
+    breaker = CircuitBreaker("bot", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    breaker.before_call()  # 冷却结束，放行探测请求
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.reset_timeout = 60
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # 探测进行中，其他请求仍被拒绝
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retry_policy_respects_deadline_and_retryability():
+    policy = RetryPolicy(max_retries=5, base_delay=10, max_delay=10, deadline=0.5)
+    state = policy.begin()
+    assert state.next_delay(ValueError("bad request")) is None
+
+    delays = [state.next_delay(httpx.ReadTimeout("timeout")) for _ in range(20)]
+    assert all(delay is None or delay < 0.5 for delay in delays)
@@ -0,0 +1,108 @@
+"""
+相同请求合并测试
+"""
+
+import asyncio
+
+from mock_coze import DEFAULT_ANSWER, async_transport, build_chat_events, install_mock_client
+
+from app.models.chat import ChatRequest, StreamEventType
+from app.services.config_service import config_service
+from app.services.coze_service import CozeService
+from app.services.single_flight import SingleFlight, StreamBroadcaster
+
+
+async def numbers(count, delay, state):
+    state["started"] = state.get("started", 0) + 1
+    try:
+        for value in range(count):
+            await asyncio.sleep(delay)
+            yield value
+    finally:
+        state["closed"] = True
+
+
+def test_late_joiner_receives_prefix_then_live_events():
+    async def run():
+        state = {}
+        flights = SingleFlight()
+        first = flights.stream("k", lambda: numbers(10, 0.002, state))
+        received = []
+        async for value in first:
+            received.append(value)
+            if value == 4:
+                break
+        late = flights.stream("k", lambda: numbers(10, 0.002, state))
+        await first.aclose()
+        return received, [value async for value in late], state, flights.get_stats()
+
+    received, late, state, stats = asyncio.run(run())
+    assert received == [0, 1, 2, 3, 4]
+    assert late == list(range(10))
+    assert state["started"] == 1
+    assert (stats["upstream_streams"], stats["shared_requests"], stats["in_flight"]) == (1, 1, 0)
+
+
+def test_upstream_is_cancelled_when_all_subscribers_leave():
+    async def run():
+        state = {}
+        broadcaster = StreamBroadcaster(numbers(1000, 0.01, state))
+        broadcaster.start()
+        subscriber = broadcaster.subscribe()
+        await subscriber.__anext__()
+        await subscriber.aclose()
+        await asyncio.sleep(0.05)
+        return state, broadcaster.done
+
+    state, done = asyncio.run(run())
+    assert state["closed"] and done
+
+
+def test_source_error_reaches_every_subscriber():
+    async def failing():
+        yield 1
+        raise ValueError("upstream failed")
+
+    async def consume(iterator):
+        values = []
+        try:
+            async for value in iterator:
+                values.append(value)
+        except ValueError as e:
+            values.append(str(e))
+        return values
+
+    async def run():
+        flights = SingleFlight()
+        return await asyncio.gather(*(consume(flights.stream("k", failing)) for _ in range(3)))
+
+    assert asyncio.run(run()) == [[1, "upstream failed"]] * 3
+
+
+def test_identical_concurrent_requests_share_one_upstream_stream(monkeypatch):
+    monkeypatch.setattr(config_service.get_config().stream, "single_flight", True)
+    requests = []
+    transport = async_transport(build_chat_events(chunk_chars=3), event_delay=0.001)
+    handler = transport.handler
+
+    def counting_handler(request):
+        requests.append(request.url.path)
+        return handler(request)
+
+    transport.handler = counting_handler
+    service = CozeService()
+    install_mock_client(service, transport)
+
+    async def one(index):
+        request = ChatRequest(message="如何确认关键安全视野？", user_id=f"resident_{index}")
+        events = [event async for event in service.chat_stream(request)]
+        assert events[-1].type == StreamEventType.COMPLETE
+        return "".join(event.content for event in events if event.type == StreamEventType.MESSAGE)
+
+    async def run():
+        return await asyncio.gather(*(one(index) for index in range(8)))
+
+    answers = asyncio.run(run())
+    assert answers == [DEFAULT_ANSWER] * 8
+    assert requests == ["/v3/chat"]
+    assert service.get_single_flight_stats()["shared_requests"] == 7
@@ -0,0 +1,50 @@
+"""
+SSE帧编码器测试
+"""
+
+import json
+import warnings
+
+import pytest
+
+from benchmark_sse_encoder import build_stream_events, legacy_frame
+from app.models.chat import StreamEvent, StreamEventType
+from app.utils.sse_encoder import SSEEncoder, get_dumps, orjson_available
+
+BACKENDS = ["json"] + (["orjson"] if orjson_available() else [])
+
+
+def parse_frame(frame: bytes):
+    assert frame.startswith(b"data: ") and frame.endswith(b"\n\n")
+    return json.loads(frame[6:-2])
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_frames_match_legacy_encoding(backend):
+    request_id = '请求"1"\\'
+    encoder = SSEEncoder(request_id, backend)
+    events = build_stream_events(3) + [
+        StreamEvent(type=StreamEventType.MESSAGE, content='含"引号"\n和\\反斜杠 '),
+        StreamEvent(type=StreamEventType.MESSAGE, content=None),
+        StreamEvent(type=StreamEventType.ERROR, error="上游错误", done=True),
+    ]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        for event in events:
+            expected = parse_frame(legacy_frame(event, request_id))
+            actual = parse_frame(encoder.encode(event))
+            assert actual == expected
+            assert list(actual) == list(expected)
+
+
+def test_data_and_comment_frames():
+    encoder = SSEEncoder("abc", "json")
+    assert encoder.encode_data({"type": "init", "message": "连接成功"}) == \
+        'data: {"type":"init","message":"连接成功"}\n\n'.encode("utf-8")
+    assert SSEEncoder.comment("heartbeat 1") == b": heartbeat 1\n\n"
+
+
+def test_unknown_backend_rejected():
+    with pytest.raises(ValueError):
+        get_dumps("ujson")
@@ -0,0 +1,99 @@
+"""
+客户端断开测试
+"""
+
+import asyncio
+import json
+
+import httpx
+from mock_coze import build_chat_events, install_mock_client
+
+from app.main import app
+from app.services.coze_service import coze_service
+from app.services.stream_stats import StreamStats, stream_stats
+
+
+def test_disconnect_stops_upstream_and_is_counted(monkeypatch):
+    events = build_chat_events(chunk_chars=1)
+    pulled = []
+    responses = []
+    cancels = []
+
+    async def slow_stream():
+        for event in events:
+            await asyncio.sleep(0.01)
+            pulled.append(event)
+            yield event.encode("utf-8")
+
+    async def handler(request):
+        if request.url.path == "/v3/chat/cancel":
+            cancels.append(json.loads(request.content))
+            return httpx.Response(200, json={"code": 0, "msg": "", "data": {
+                "id": "chat_mock", "conversation_id": "conv_mock", "bot_id": "bot_mock", "status": "canceled"}})
+        response = httpx.Response(200, headers={"content-type": "text/event-stream"}, content=slow_stream())
+        responses.append(response)
+        return response
+
+    monkeypatch.setattr(coze_service, "_answer_cache", None)
+    install_mock_client(coze_service, httpx.MockTransport(handler))
+    stats = StreamStats()
+    monkeypatch.setattr("app.services.stream_pipeline.stream_stats", stats)
+    monkeypatch.setattr("app.services.coze_service.stream_stats", stats)
+
+    async def scenario():
+        body = json.dumps({"message": "问题", "user_id": "user-1"}).encode("utf-8")
+        scope = {
+            "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+            "method": "POST", "scheme": "http", "path": "/api/chat/stream", "raw_path": b"/api/chat/stream",
+            "query_string": b"", "root_path": "", "headers": [(b"content-type", b"application/json")],
+            "client": ("127.0.0.1", 1234), "server": ("testserver", 80),
+        }
+        disconnected = asyncio.Event()
+        frames = []
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and b'"type":"message"' in message.get("body", b""):
+                frames.append(message["body"])
+                if len(frames) == 3:
+                    disconnected.set()
+
+        await asyncio.wait_for(app(scope, receive, send), timeout=5)
+        await asyncio.sleep(0.15)
+        closed = [response.is_closed for response in responses]
+        pulled_after_disconnect = len(pulled)
+        await asyncio.sleep(0.1)
+        return frames, pulled_after_disconnect, closed
+
+    frames, pulled_after_disconnect, closed = asyncio.run(scenario())
+
+    assert len(frames) == 3
+    assert len(pulled) == pulled_after_disconnect < len(events) // 2
+    assert closed and all(closed)
+    assert stats.abandoned == 1 and stats.completed == 0
+    # 关闭响应之外还要取消对话，否则Coze会继续生成并计费
+    assert cancels == [{"conversation_id": "conv_mock", "chat_id": "chat_mock"}]
+    assert stats.upstream_cancelled == 1 and stats.upstream_cancel_failed == 0
+
+
+def test_cancel_results_are_counted():
+    stats = StreamStats()
+    stats.record_completed()
+    stats.record_abandoned(50)
+    stats.record_upstream_cancel(True)
+    stats.record_upstream_cancel(False)
+    assert stats.get_stats() == {
+        "completed": 1,
+        "abandoned": 1,
+        "abandoned_output_chars": 50,
+        "upstream_cancelled": 1,
+        "upstream_cancel_failed": 1,
+    }
@@ -0,0 +1,63 @@
+"""
+流日志记录器测试
+"""
+
+import time
+
+from loguru import logger
+
+from app.utils.logger import StreamLogger, setup_logger
+
+
+def capture(level="DEBUG"):
+    records = []
+    handler_id = logger.add(lambda message: records.append(message.record), level=level)
+    return records, handler_id
+
+
+def test_aggregates_events_into_single_summary_line():
+    records, handler_id = capture()
+    try:
+        stream_logger = StreamLogger("test_stream")
+        for content in ("手术", "顺利"):
+            stream_logger.log_event("content", content=content)
+        time.sleep(0.02)
+        stream_logger.log_event("complete")
+        stream_logger.log_summary("完成")
+    finally:
+        logger.remove(handler_id)
+
+    assert len(records) == 1
+    summary = records[0]["extra"]["stream_summary"]
+    assert summary["events"] == 3 and summary["content_chars"] == 4
+    assert summary["types"] == {"content": 2, "complete": 1}
+    assert sum(summary["gap_histogram"].values()) == 3
+    assert summary["gap_histogram"]["<=50ms"] == 1 and summary["max_gap_ms"] >= 20
+    assert "类型: content=2 complete=1" in records[0]["message"]
+
+
+def test_traced_streams_format_events_only_when_debug_enabled():
+    metadata = {"calls": 0}
+
+    class CountingDict(dict):
+        def __repr__(self):
+            metadata["calls"] += 1
+            return "元数据"
+
+    # 所有输出都在INFO级别时不格式化明细
+    setup_logger(level="INFO")
+    records, handler_id = capture(level="INFO")
+    try:
+        stream_logger = StreamLogger("test_stream", trace=True)
+        stream_logger.log_event("message", content="正文", metadata=CountingDict(a=1))
+    finally:
+        logger.remove(handler_id)
+    assert records == [] and metadata["calls"] == 0
+
+    records, handler_id = capture(level="DEBUG")
+    try:
+        StreamLogger("test_stream", trace=True).log_event("message", content="正文", metadata=CountingDict(a=1))
+        StreamLogger("test_stream", trace=False).log_event("message", content="正文")
+    finally:
+        logger.remove(handler_id)
+    assert [record["message"].split("] ", 1)[1] for record in records] == ["事件 #1 | 类型: message | 内容: 正文 | 元数据: 元数据"]
@@ -0,0 +1,173 @@
+"""
+流式处理管道测试
+"""
+
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+from mock_coze import DEFAULT_ANSWER, async_transport, build_chat_events, install_mock_client
+
+from app.models.chat import StreamEvent, StreamEventType
+from app.services.coze_service import coze_service
+from app.services.stream_pipeline import CoalesceStage, ReferencesStage, SSESink, StreamPipeline
+from app.utils.sse_encoder import SSEEncoder
+
+
+async def upstream(chunks, delay=0.0, pause_after=None, pause=0.0):
+    for index, chunk in enumerate(chunks):
+        await asyncio.sleep(delay)
+        yield StreamEvent(type=StreamEventType.MESSAGE, content=chunk, done=False)
+        if index == pause_after:
+            await asyncio.sleep(pause)
+    yield StreamEvent(type=StreamEventType.FOLLOW_UP, follow_up_questions=["问题"], done=False)
+    yield StreamEvent(type=StreamEventType.COMPLETE, done=True)
+
+
+def sse_pipeline(stages, timing=False):
+    return StreamPipeline(stages, SSESink(SSEEncoder("req-1")), timing=timing)
+
+
+def decode(frame):
+    """解码数据帧，注释帧返回None"""
+    return json.loads(frame[6:]) if frame.startswith(b"data: ") else None
+
+
+def test_stages_flush_before_events_and_record_timings():
+    saved = {}
+
+    async def save(conversation_id, text):
+        saved[conversation_id] = text
+
+    async def run():
+        pipeline = sse_pipeline([ReferencesStage("conv-1", save), CoalesceStage(1000)], timing=True)
+        chunks = ["正文", "\n", "\n[", "1] 引用"]
+        return [decode(frame) async for frame in pipeline.run(upstream(chunks))], pipeline.stage_timings()
+
+    events, timings = asyncio.run(run())
+    # 暂存的正文在建议问题事件之前合并发出，引用段落被去除且不重建中间事件
+    assert [(event["type"], event["content"]) for event in events] == [
+        ("message", "正文"), ("follow_up", None), ("complete", None)
+    ]
+    assert saved == {"conv-1": "[1] 引用"}
+    assert timings["references"]["calls"] == 4 + 2
+    assert timings["coalesce"]["calls"] == 1 + 2
+    assert timings["sse_encode"]["calls"] == 1 + 2
+
+
+def test_coalesce_stage_flushes_when_window_expires():
+    async def run():
+        pipeline = sse_pipeline([CoalesceStage(20)])
+        return [decode(frame)["content"] async for frame in pipeline.run(upstream(["a", "b", "c"], delay=0.015))]
+
+    assert asyncio.run(run())[:2] == ["ab", "c"]
+
+
+def test_pipeline_without_stages_passes_deltas_through():
+    async def run():
+        return [decode(frame) async for frame in sse_pipeline([]).run(upstream(list("手术复盘")))]
+
+    events = asyncio.run(run())
+    assert [event["content"] for event in events[:4]] == list("手术复盘")
+
+
+def test_coalesce_stage_flushes_at_max_bytes_and_keeps_order():
+    chunks = list("腹腔镜胆囊切除术")
+
+    async def run():
+        pipeline = sse_pipeline([CoalesceStage(1000, max_bytes=9)])
+        return [decode(frame) async for frame in pipeline.run(upstream(chunks))]
+
+    events = asyncio.run(run())
+    messages = [event["content"] for event in events if event["type"] == "message"]
+    assert "".join(messages) == "".join(chunks)
+    assert messages[0] == "腹腔镜"  # 每个汉字3字节，达到9字节立即发出
+    assert events[-1]["type"] == "complete"
+    assert len(messages) < len(chunks)
+
+
+def test_coalesce_window_flushes_while_upstream_is_silent():
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        source = upstream(list("术中出血"), pause_after=1, pause=0.3)
+        return [(decode(frame)["content"], loop.time() - start)
+                async for frame in sse_pipeline([CoalesceStage(20)]).run(source)]
+
+    received = asyncio.run(run())
+    assert received[0][0] == "术中"
+    assert received[0][1] < 0.2  # 上游静默时按窗口发出，无需等待下一个事件
+    assert "".join(content or "" for content, _ in received) == "术中出血"
+
+
+def test_keepalive_sent_while_upstream_is_silent():
+    async def run():
+        pipeline = sse_pipeline([])
+        source = upstream(list("术中"), pause_after=0, pause=0.25)
+        return [frame async for frame in pipeline.run(source, keepalive_interval=0.1)]
+
+    frames = asyncio.run(run())
+    assert "术".encode() in frames[0]
+    assert all(frame.startswith(b": heartbeat ") for frame in frames[1:3])
+    assert "中".encode() in frames[3]
+    assert b'"type":"complete"' in frames[-1]
+
+
+def test_without_references_endpoint_runs_pipeline(monkeypatch):
+    from app.main import app
+
+    monkeypatch.setattr(coze_service, "_answer_cache", None)
+    with TestClient(app) as client:
+        install_mock_client(coze_service, async_transport(build_chat_events(chunk_chars=7), event_delay=0))
+        response = client.post("/api/chat/stream-without-references",
+                               json={"message": "问题", "user_id": "user-1", "conversation_id": "conv-3"})
+        references = client.get("/api/chat/references/conv-3")
+
+    events = [json.loads(line[6:]) for line in response.text.split("\n") if line.startswith("data: ")]
+    content = "".join(event.get("content") or "" for event in events if event["type"] == "message")
+    assert content == DEFAULT_ANSWER.split("\n\n[1]")[0]
+    assert events[-1]["type"] == "complete"
+    assert references.json()["references"].startswith("[1]")
+
+
+def test_without_references_binds_one_conversation_id(monkeypatch):
+    from app.main import app
+    from app.utils.logger import get_logger
+
+    records = []
+    monkeypatch.setattr(coze_service, "_answer_cache", None)
+    with TestClient(app) as client:
+        # 启动时会重新配置日志，之后再添加记录器
+        handler_id = get_logger("test").add(lambda message: records.append(message.record["extra"]), level="DEBUG")
+        install_mock_client(coze_service, async_transport(build_chat_events(chunk_chars=7), event_delay=0))
+        client.post("/api/chat/stream-without-references", json={"message": "问题", "user_id": "user-1"})
+        get_logger("test").remove(handler_id)
+        logged = {extra["conversation_id"] for extra in records if extra.get("conversation_id")}
+        references = [client.get(f"/api/chat/references/{conversation_id}").json() for conversation_id in logged]
+
+    # 未带对话ID时只生成一个，引用按该ID保存
+    assert len(logged) == 1
+    assert references[0]["references"].startswith("[1]")
+
+
+def test_logs_after_binding_carry_conversation_id(monkeypatch):
+    from app.main import app
+    from app.utils.logger import get_logger
+
+    records = []
+    monkeypatch.setattr(coze_service, "_answer_cache", None)
+    with TestClient(app) as client:
+        handler_id = get_logger("test").add(
+            lambda message: records.append((message.record["extra"]["name"], message.record["extra"].get("conversation_id"))),
+            level="DEBUG")
+        install_mock_client(coze_service, async_transport(build_chat_events(chunk_chars=20), event_delay=0))
+        client.post("/api/chat/stream", json={"message": "问题", "user_id": "user-1"})
+        get_logger("test").remove(handler_id)
+
+    # 对话ID在请求任务中绑定：之前只有请求开始的日志不带，之后上游读取任务(开启心跳时由TimedReader创建)、
+    # 管道各阶段和访问日志的记录都带有同一个ID
+    first = next(index for index, (_, conversation_id) in enumerate(records) if conversation_id)
+    assert {name for name, _ in records[:first]} <= {"http", "chat_api"}
+    after = records[first:]
+    assert len({conversation_id for _, conversation_id in after}) == 1
+    assert {"coze_service", "stream_pipeline", "http"} <= {name for name, _ in after}
@@ -0,0 +1,129 @@
+"""
+断线续传测试
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from mock_coze import DEFAULT_ANSWER, async_transport, build_chat_events, install_mock_client
+
+from app.services.coze_service import coze_service
+from app.services.stream_resume import ResumableStreams
+
+
+async def frames(count, delay, state):
+    state["started"] = state.get("started", 0) + 1
+    yield b": heartbeat 0\n\n"
+    for value in range(count):
+        await asyncio.sleep(delay)
+        yield f"data: {value}\n\n".encode()
+
+
+def parse_frames(text):
+    parsed = []
+    for block in text.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n") if line and not line.startswith(":"))
+        if "data" in fields:
+            parsed.append((int(fields["id"]), fields["data"]))
+    return parsed
+
+
+def test_resume_replays_missed_frames_then_continues_live():
+    async def run():
+        state = {}
+        streams = ResumableStreams()
+        first = streams.open("req-1", "token-1", frames(20, 0.002, state))
+        received = []
+        async for frame in first:
+            received.append(frame)
+            if len(received) == 6:
+                break
+        await first.aclose()
+        resumed = [frame async for frame in streams.resume("req-1", "token-1", 5)]
+        return received, resumed, state, streams.get_stats()
+
+    received, resumed, state, stats = asyncio.run(run())
+    assert received[0] == b": heartbeat 0\n\n"
+    assert received[5] == b"id: 6\ndata: 4\n\n"
+    # 从id 5之后补发，包含断开前已发出但客户端未确认的帧
+    assert resumed[0] == b"id: 6\ndata: 4\n\n"
+    assert resumed[-1] == b"id: 21\ndata: 19\n\n"
+    assert len(resumed) == 16
+    assert state["started"] == 1
+    assert (stats["opened"], stats["resumed"]) == (1, 1)
+
+
+def test_resume_errors_for_unknown_or_dropped_frames(monkeypatch):
+    from app.services.config_service import config_service
+
+    monkeypatch.setattr(config_service.get_config().stream.resume, "buffer_frames", 4)
+
+    async def run():
+        streams = ResumableStreams()
+        subscriber = streams.open("req-2", "token-2", frames(10, 0, {}))
+        assert len([frame async for frame in subscriber]) == 11
+        with pytest.raises(KeyError):
+            streams.resume("missing", "token-2", 0)
+        with pytest.raises(KeyError):
+            streams.resume("req-2", "guessed", 8)
+        with pytest.raises(LookupError):
+            streams.resume("req-2", "token-2", 3)
+        return [frame async for frame in streams.resume("req-2", "token-2", 8)], streams.get_stats()
+
+    tail, stats = asyncio.run(run())
+    assert tail == [b"id: 9\ndata: 7\n\n", b"id: 10\ndata: 8\n\n", b"id: 11\ndata: 9\n\n"]
+    assert stats["misses"] == 3
+
+
+def test_resume_endpoint_does_not_call_upstream_again(monkeypatch):
+    from app.main import app
+    from app.services.config_service import config_service
+
+    upstream_calls = []
+    transport = async_transport(build_chat_events(chunk_chars=9), event_delay=0)
+    handler = transport.handler
+
+    async def counting_handler(request):
+        upstream_calls.append(request.url.path)
+        return await handler(request)
+
+    transport.handler = counting_handler
+    monkeypatch.setattr(coze_service, "_answer_cache", None)
+
+    with TestClient(app) as client:
+        monkeypatch.setattr(config_service.get_config().stream.resume, "enabled", True)
+        install_mock_client(coze_service, transport)
+        response = client.post("/api/chat/stream", json={"message": "问题", "user_id": "user-1"})
+        original = parse_frames(response.text)
+        init = json.loads(original[0][1])
+        request_id, token = init["request_id"], init["resume_token"]
+
+        resumed = client.get(f"/api/chat/stream/{request_id}/resume",
+                             headers={"Last-Event-ID": str(original[2][0]), "X-Resume-Token": token})
+        without_token = client.get(f"/api/chat/stream/{request_id}/resume")
+        missing = client.get("/api/chat/stream/unknown/resume", params={"token": token})
+
+    assert parse_frames(resumed.text) == original[3:]
+    content = "".join(json.loads(data).get("content") or "" for _, data in original[1:])
+    assert content == DEFAULT_ANSWER
+    assert [event_id for event_id, _ in original] == sorted(set(event_id for event_id, _ in original))
+    assert upstream_calls == ["/v3/chat"]
+    assert len(token) >= 22  # 至少128位
+    assert without_token.status_code == 404 and missing.status_code == 404
+
+
+def test_resume_is_disabled_by_default():
+    from app.main import app
+    from app.models.config import ResumeConfig
+
+    assert not ResumeConfig().enabled
+    with TestClient(app) as client:
+        install_mock_client(coze_service, async_transport(build_chat_events(chunk_chars=20), event_delay=0))
+        response = client.post("/api/chat/stream", json={"message": "问题", "user_id": "user-1"})
+
+    init = json.loads(response.text.split("\n\n")[0][6:])
+    assert init["type"] == "init" and "resume_token" not in init
+    assert not response.text.startswith("id:")
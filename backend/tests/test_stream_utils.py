@@ -0,0 +1,94 @@
+"""
+流式处理工具测试
+"""
+
+import asyncio
+import contextvars
+
+import pytest
+
+from app.models.chat import StreamEvent, StreamEventType
+from app.utils.stream_utils import TIMEOUT, StreamIdleTimeout, TimedReader, with_idle_timeout
+
+
+async def delta_source(chunks, delay=0.0):
+    for chunk in chunks:
+        if delay:
+            await asyncio.sleep(delay)
+        yield StreamEvent(type=StreamEventType.MESSAGE, content=chunk)
+    yield StreamEvent(type=StreamEventType.COMPLETE, done=True)
+
+
+def test_timed_reader_timeout_does_not_lose_items():
+    async def scenario():
+        reader = TimedReader(delta_source(["一"], delay=0.05))
+        assert await reader.next(0.001) is TIMEOUT
+        event = await reader.next(1)
+        await reader.aclose()
+        return event
+
+    assert asyncio.run(scenario()).content == "一"
+
+
+def test_idle_timeout_aborts_and_closes_upstream():
+    closed = []
+
+    async def stuck_source():
+        try:
+            yield StreamEvent(type=StreamEventType.MESSAGE, content="一")
+            await asyncio.sleep(10)
+        finally:
+            closed.append(True)
+
+    async def scenario():
+        received = []
+        with pytest.raises(StreamIdleTimeout):
+            async for event in with_idle_timeout(stuck_source(), 0.05):
+                received.append(event.content)
+        return received
+
+    assert asyncio.run(scenario()) == ["一"]
+    assert closed == [True]
+
+
+def test_timed_reader_uses_one_task_per_stream():
+    async def scenario():
+        tasks = []
+
+        async def source():
+            for chunk in "手术复盘":
+                tasks.append(asyncio.current_task())
+                await asyncio.sleep(0)
+                yield chunk
+
+        reader = TimedReader(source())
+        received = []
+        while True:
+            try:
+                item = await reader.next(1)
+            except StopAsyncIteration:
+                break
+            received.append(item)
+        await reader.aclose()
+        return received, tasks, asyncio.current_task()
+
+    received, tasks, consumer = asyncio.run(scenario())
+    assert received == list("手术复盘")
+    assert len(set(tasks)) == 1 and tasks[0] is not consumer
+
+
+def test_idle_timeout_reads_in_consumer_task_and_keeps_context():
+    conversation_id = contextvars.ContextVar("conversation_id", default="")
+
+    async def source():
+        conversation_id.set("conv-1")
+        yield asyncio.current_task()
+        yield conversation_id.get()
+
+    async def scenario():
+        received = [event async for event in with_idle_timeout(source(), 1)]
+        return received, asyncio.current_task(), conversation_id.get()
+
+    (task, seen), consumer, after = asyncio.run(scenario())
+    assert task is consumer
+    assert seen == "conv-1" and after == "conv-1"
@@ -0,0 +1,75 @@
+"""
+请求链路追踪测试
+"""
+
+import json
+
+from fastapi.testclient import TestClient
+from mock_coze import async_transport, build_chat_events, install_mock_client
+
+from app.models.config import TracingConfig
+from app.services.coze_service import coze_service
+from app.utils.tracing import tracer
+
+TRACEPARENT = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+def test_message_endpoint_returns_server_timing(monkeypatch):
+    from app.main import app
+
+    monkeypatch.setattr(coze_service, "_answer_cache", None)
+    with TestClient(app) as client:
+        tracer.configure(TracingConfig(enabled=True, server_timing=True))
+        install_mock_client(coze_service, async_transport(build_chat_events(), event_delay=0))
+        response = client.post("/api/chat/message", json={"message": "问题", "user_id": "user-1"},
+                               headers={"traceparent": TRACEPARENT})
+
+    entries = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+    assert entries[:4] == ["coze.client", "coze.first_byte", "coze.first_token", "coze.complete"]
+    assert entries[-2:] == ["total", "trace"]
+    assert response.headers["server-timing"].endswith('trace;desc="0af7651916cd43dd8448eb211c80319c"')
+
+
+def test_stream_ends_with_timing_event_and_exports_otlp(tmp_path, monkeypatch):
+    from app.main import app
+
+    monkeypatch.setattr(coze_service, "_answer_cache", None)
+    export_file = tmp_path / "traces.jsonl"
+    with TestClient(app) as client:
+        tracer.configure(TracingConfig(enabled=True, server_timing=True, export_file=str(export_file)))
+        install_mock_client(coze_service, async_transport(build_chat_events(chunk_chars=20), event_delay=0))
+        response = client.post("/api/chat/stream", json={"message": "问题", "user_id": "user-1"})
+
+    events = [json.loads(line[6:]) for line in response.text.split("\n") if line.startswith("data: ")]
+    timing = events[-1]
+    assert timing["type"] == "timing" and timing["request_id"] == response.headers["x-request-id"]
+    spans = {span["name"]: span for span in timing["spans"]}
+    assert {"chat.admission", "coze.first_byte", "coze.first_token", "coze.complete", "chat.stream"} <= set(spans)
+    assert spans["coze.first_token"]["duration_ms"] <= spans["coze.complete"]["duration_ms"]
+    assert "chat.admission;dur=" in response.headers["server-timing"]
+
+    # 关闭时写完队列中的Trace
+    lines = export_file.read_text(encoding="utf-8").splitlines()
+    resource_spans = json.loads(lines[-1])["resourceSpans"][0]
+    assert resource_spans["resource"]["attributes"][0] == {"key": "service.name", "value": {"stringValue": "johnson-backend"}}
+    exported = resource_spans["scopeSpans"][0]["spans"]
+    root = exported[0]
+    assert root["name"] == "POST /api/chat/stream" and root["kind"] == 2 and root["traceId"] == timing["trace_id"]
+    assert {"key": "http.status_code", "value": {"intValue": "200"}} in root["attributes"]
+    assert all(span["parentSpanId"] == root["spanId"] for span in exported[1:])
+    assert all(int(span["endTimeUnixNano"]) >= int(span["startTimeUnixNano"]) for span in exported)
+
+
+def test_tracing_is_off_by_default(monkeypatch):
+    from app.main import app
+
+    monkeypatch.setattr(coze_service, "_answer_cache", None)
+    with TestClient(app) as client:
+        install_mock_client(coze_service, async_transport(build_chat_events(chunk_chars=20), event_delay=0))
+        message = client.post("/api/chat/message", json={"message": "问题", "user_id": "user-1"})
+        stream = client.post("/api/chat/stream", json={"message": "问题", "user_id": "user-1"})
+
+    events = [json.loads(line[6:]) for line in stream.text.split("\n") if line.startswith("data: ")]
+    assert not TracingConfig().enabled and not TracingConfig().server_timing
+    assert "server-timing" not in message.headers and "server-timing" not in stream.headers
+    assert events[-1]["type"] == "complete"
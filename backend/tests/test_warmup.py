@@ -0,0 +1,73 @@
+"""
+启动预热和就绪检查测试
+"""
+
+import asyncio
+
+import httpx
+from cozepy import AsyncHTTPClient
+
+from app.services import coze_service as coze_module
+from app.services.config_service import config_service
+from app.services.coze_service import CozeService, coze_service
+
+
+def use_transport(monkeypatch, handler):
+    """让预热创建的客户端使用模拟传输层"""
+    monkeypatch.setattr(coze_module.http_pool_service, "create_client",
+                        lambda config: AsyncHTTPClient(transport=httpx.MockTransport(handler)))
+
+
+def test_warm_up_connects_every_doctor(monkeypatch):
+    requests = []
+
+    async def handler(request):
+        requests.append(request.method)
+        return httpx.Response(200)
+
+    use_transport(monkeypatch, handler)
+    status = asyncio.run(CozeService().warm_up(connections=2, timeout=1))
+
+    doctors = config_service.get_config().coze.doctor_types()
+    assert status["ready"] and status["state"] == "completed"
+    assert all(result["success"] and "connect_ms" in result for result in status["doctors"].values())
+    assert len(status["doctors"]) == len(doctors) and requests == ["HEAD"] * 2 * len(doctors)
+
+
+def test_warm_up_failure_is_reported_without_blocking_readiness(monkeypatch):
+    async def handler(request):
+        raise httpx.ConnectError("连接被拒绝", request=request)
+
+    use_transport(monkeypatch, handler)
+    status = asyncio.run(CozeService().warm_up(connections=1, timeout=1))
+
+    assert status["ready"] and status["state"] == "completed"
+    assert all(not result["success"] and "连接被拒绝" in result["error"] for result in status["doctors"].values())
+
+
+def test_readiness_flips_when_warm_up_completes(monkeypatch):
+    from app.main import app
+
+    for name in ("_warmup_status", "_coze_clients", "_http_clients", "_configs"):
+        monkeypatch.setattr(coze_service, name, getattr(coze_service, name).copy())
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def handler(request):
+            await gate.wait()
+            return httpx.Response(200)
+
+        use_transport(monkeypatch, handler)
+        warm_up = asyncio.create_task(coze_service.warm_up(connections=1, timeout=5))
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://test") as client:
+            await asyncio.sleep(0.01)
+            during = await client.get("/api/health/ready")
+            gate.set()
+            await warm_up
+            after = await client.get("/api/health/ready")
+        return during, after
+
+    during, after = asyncio.run(run())
+    assert during.status_code == 503 and during.json()["state"] == "running"
+    assert after.status_code == 200 and after.json()["state"] == "completed"
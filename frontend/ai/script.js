@@ -710,7 +710,7 @@ async function streamChatWithAPI(message) {
         throw new Error(`HTTP ${response.status}: ${response.statusText}`);
     }
 
-    const reader = response.body.getReader();
+    let reader = response.body.getReader();
     const decoder = new TextDecoder();
     
     hideTypingIndicator();
@@ -765,9 +765,38 @@ async function streamChatWithAPI(message) {
         let lastUpdateTime = Date.now();
         const minUpdateInterval = 50; // 最小更新间隔（毫秒）
         
+        // 断线续传状态：流ID和续传令牌来自初始化事件(服务端开启续传时才有令牌)，id为最后收到的完整帧
+        let streamId = null;
+        let resumeToken = null;
+        let lastEventId = null;
+        let streamFinished = false;
+        let resumeAttempts = 0;
+        const maxResumeAttempts = 3;
+        
         while (true) {
-            const { done, value } = await reader.read();
-            if (done) break;
+            let result;
+            try {
+                result = await reader.read();
+            } catch (readError) {
+                result = { done: true, error: readError };
+            }
+            
+            if (result.done && !streamFinished && streamId && resumeToken && resumeAttempts < maxResumeAttempts) {
+                // 网络中断：从最后收到的帧之后续传，服务端不会重新生成回答
+                resumeAttempts++;
+                console.warn(`流式连接中断，第${resumeAttempts}次续传，Last-Event-ID: ${lastEventId}`, result.error);
+                await new Promise(resolve => setTimeout(resolve, 500 * resumeAttempts));
+                try {
+                    reader = await resumeStream(API_BASE_URL, streamId, resumeToken, lastEventId);
+                    buffer = '';
+                    continue;
+                } catch (resumeError) {
+                    console.warn('续传失败:', resumeError);
+                }
+            }
+            if (result.error && !streamFinished) throw result.error;
+            if (result.done) break;
+            const { value } = result;
             
             const chunk = decoder.decode(value, { stream: true });
             buffer += chunk;
@@ -777,7 +806,16 @@ async function streamChatWithAPI(message) {
             // 保留最后一行，可能是不完整的
             buffer = lines.pop() || '';
             
-            for (const line of lines) {
+            for (const block of lines) {
+                // 数据帧可能带有id行，记录最后收到的id用于续传
+                let line = '';
+                for (const field of block.split('\n')) {
+                    if (field.startsWith('id: ')) {
+                        lastEventId = field.slice(4).trim();
+                    } else if (field.startsWith('data: ')) {
+                        line = field;
+                    }
+                }
                 if (line.trim() && line.startsWith('data: ')) {
                     try {
                         const dataString = line.slice(6).trim();
@@ -801,8 +839,14 @@ async function streamChatWithAPI(message) {
                                     lastUpdateTime = now;
                                 }
                             } else if (data.type === 'init') {
+                                streamId = data.request_id;
+                                resumeToken = data.resume_token || null;
                                 console.log('流式连接初始化成功:', data.message);
+                            } else if (data.type === 'timing') {
+                                // 服务端各阶段耗时，与Server-Timing头格式相同
+                                console.log('服务端耗时:', data.server_timing);
                             } else if (data.type === 'error') {
+                                streamFinished = true;
                                 messageText.classList.remove('typing-animation');
                                 messageText.innerHTML = `<span style="color: #ff6b6b;">AI回复出现错误: ${data.error}</span>`;
                                 isWaitingForResponse = false;
@@ -826,6 +870,7 @@ async function streamChatWithAPI(message) {
                                     moveSuggestedQuestionsAfterLastMessage();
                                 }
                             } else if (data.type === 'complete' || data.done) {
+                                streamFinished = true;
                                 console.log('流式响应完成');
                                 
                                 // 确保显示完整的最终内容
@@ -895,6 +940,19 @@ async function streamChatWithAPI(message) {
     }
 }
 
+// 断线后续传流式响应，返回新的读取器
+async function resumeStream(apiBaseUrl, streamId, resumeToken, lastEventId) {
+    const headers = { 'X-Resume-Token': resumeToken };
+    if (lastEventId) {
+        headers['Last-Event-ID'] = lastEventId;
+    }
+    const response = await fetch(`${apiBaseUrl}/api/chat/stream/${encodeURIComponent(streamId)}/resume`, { headers });
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+    return response.body.getReader();
+}
+
 // 获取当前对话ID（支持会话持续）
 function getCurrentConversationId() {
     if (!window.conversationId) {